@@ -1,12 +1,25 @@
-from operator import contains
+import hashlib
+import mmap
 import os
-from typing import Union, List, Optional
-from xml.etree.ElementTree import QName
+import re
+import sys
+from array import array
+from collections import OrderedDict
+from collections.abc import Sequence
+from functools import partial
+from itertools import islice
+from time import perf_counter, process_time
+from typing import Iterator, NamedTuple, Union, List, Optional
+
+# result_sinks, parse_store, parallel_parse and parse_profiler build on this module and
+# import it, so the functions here that need them import them when they are called
 
 alphabet_chars = list("abcdefghijklmnopqrstuvwxyz") + list("ABCDEFGHIJKLMNOPQRSTUVWXYZ")
 numeric_chars = list("0123456789")
 var_chars = alphabet_chars + numeric_chars
 all_valid_chars = var_chars + ["(", ")", ".", "\\"]
+alphabet_char_set = frozenset(alphabet_chars)
+var_char_set = frozenset(var_chars)
 valid_examples_fp = "./valid_examples.txt"
 invalid_examples_fp = "./invalid_examples.txt"
 extra_valid_example_fp = "./extra_valid_examples.txt"
@@ -19,11 +32,34 @@ def read_lines_from_txt(fp: list[str, os.PathLike]) -> List[str]:
     and newline characters.
     """
     
-    with open(fp) as file:
-        lines = [line.rstrip() for line in file]
-        file.close()
-    
-    return lines
+    return list(iter_lines_from_txt(fp))
+
+def iter_lines_from_txt(fp: [str, os.PathLike], use_mmap: bool = False) -> Iterator[str]:
+    """
+    Lazily reads the lines of a .txt file, so only one line is held in memory at a time.
+    :param fp: File path of the .txt file.
+    :param use_mmap: memory map the file and cut the lines out of the mapping, which
+    avoids the read buffer copies on very large files
+    :return: iterator over the lines, without trailing whitespace and newline characters
+    """
+    if not use_mmap:
+        with open(fp) as file:
+            for line in file:
+                yield line.rstrip()
+        return
+
+    with open(fp, "rb") as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            return  # empty files cannot be mapped
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            start = 0
+            size = len(mapped)
+            while start < size:
+                end = mapped.find(b"\n", start)
+                if end == -1:
+                    end = size
+                yield mapped[start:end].decode().rstrip()
+                start = end + 1
 
 def is_valid_var_name(s: str) -> tuple[bool, str]:
     """
@@ -32,17 +68,188 @@ def is_valid_var_name(s: str) -> tuple[bool, str]:
     and contains only characters and digits. Returns False otherwise.
     """
 
-    if not alphabet_chars.__contains__(s[0]):
+    if s[0] not in alphabet_char_set:
         return (False, f"SYNTAX ERROR: variables must start with a letter")
     
     for char in s:
-        if not var_chars.__contains__(char):
+        if char not in var_char_set:
             return (False, f"SYNTAX ERROR: variables cannot contain the character '{char}'")
 
     return (True, "")
 
 
 
+#   ===============
+#   BEGIN PROFILING
+#   ===============
+
+# the Profiler installed by parse_profiler.profiling(), None when not profiling. The phases
+# of the pipeline check it before timing themselves, so profiling costs nothing while off.
+_profiler: Optional['parse_profiler.Profiler'] = None
+
+#   =============
+#   END PROFILING
+#   =============
+
+
+#   ===========
+#   BEGIN LEXER
+#   ===========
+
+# token kind codes, also the ids of the punctuation entries in TokenBuffer.names
+TOK_LAMBDA = 0
+TOK_OPEN = 1
+TOK_CLOSE = 2
+TOK_VAR = 3
+
+# one alternative per kind of lexeme, the number of the group that matched tells them apart
+_lexeme_re = re.compile(
+    r"([A-Za-z][A-Za-z0-9]*)(?![^\\(). \t])"  # 1: variable
+    r"|([ \t]+)"                              # 2: whitespace
+    r"|(\()"                                  # 3: opening bracket
+    r"|(\))"                                  # 4: closing bracket
+    r"|(\.)"                                  # 5: dot operator
+    r"|(\\)"                                  # 6: lambda
+    r"|([^\\(). \t]+)"                        # 7: anything else is a malformed variable
+)
+_LEX_VAR, _LEX_SPACE, _LEX_OPEN, _LEX_CLOSE, _LEX_DOT, _LEX_LAMBDA, _LEX_BAD = 1, 2, 3, 4, 5, 6, 7
+
+
+class TokenBuffer:
+    """
+    Compact token stream of one input string, see tokenize()
+    Attributes:
+        source: the string the tokens were read from, None if built by buffer_from_tokens()
+        kinds: the TOK_* kind code of each token
+        ids: index into names of each token
+        offsets: index in source each token was read at
+        names: table of token strings, the punctuation first and then every
+        distinct variable name (interned) in order of first appearance
+    """
+    __slots__ = ("source", "kinds", "ids", "offsets", "names")
+
+    def __init__(self, source: str):
+        self.source = source
+        self.kinds = array("b")
+        self.ids = array("l")
+        self.offsets = array("q")
+        self.names = ["\\", "(", ")"]
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def token(self, idx: int) -> str:
+        return self.names[self.ids[idx]]
+
+    def to_list(self) -> List[str]:
+        """
+        :return: the tokens as the list of strings parse_tokens() returns
+        """
+        return list(map(self.names.__getitem__, self.ids))
+
+
+def tokenize(s: str) -> TokenBuffer:
+    """
+    Splits the string into tokens in a single pass. Whitespace is dropped and a
+    dot operator is replaced by brackets: '(' in place of the dot and ')' right
+    before the bracket (or end of input) closing the expression the dot is in.
+    Only the lexical structure is checked, use valid_syntax() for the grammar.
+    Example: "\\x.\\y.x y" -> \\ x ( \\ y ( x y ) )
+    :param s: the input string
+    :return: the tokens of s
+    :raises ValueError: if s contains a malformed variable or unbalanced brackets
+    """
+    if _profiler is not None:
+        start = _profiler.start("lex")
+    buf = TokenBuffer(s)
+    names = buf.names
+    push_kind = buf.kinds.append
+    push_id = buf.ids.append
+    push_offset = buf.offsets.append
+    name_ids = {}
+    # number of dots still waiting for their ')' at each bracket depth
+    open_dots = [0]
+
+    for m in _lexeme_re.finditer(s):
+        lexeme = m.lastindex
+        if lexeme == _LEX_VAR:
+            name = m.group(1)
+            name_id = name_ids.get(name)
+            if name_id is None:
+                name_id = name_ids[name] = len(names)
+                names.append(sys.intern(name))
+            push_kind(TOK_VAR)
+            push_id(name_id)
+            push_offset(m.start())
+        elif lexeme == _LEX_SPACE:
+            continue
+        elif lexeme == _LEX_OPEN:
+            push_kind(TOK_OPEN)
+            push_id(TOK_OPEN)
+            push_offset(m.start())
+            open_dots.append(0)
+        elif lexeme == _LEX_CLOSE:
+            if len(open_dots) == 1:
+                raise ValueError("SYNTAX ERROR: brackets are mismatched.")
+            offset = m.start()
+            for _ in range(open_dots.pop() + 1):
+                push_kind(TOK_CLOSE)
+                push_id(TOK_CLOSE)
+                push_offset(offset)
+        elif lexeme == _LEX_DOT:
+            push_kind(TOK_OPEN)
+            push_id(TOK_OPEN)
+            push_offset(m.start())
+            open_dots[-1] += 1
+        elif lexeme == _LEX_LAMBDA:
+            push_kind(TOK_LAMBDA)
+            push_id(TOK_LAMBDA)
+            push_offset(m.start())
+        else:
+            raise ValueError(is_valid_var_name(m.group(7))[1])
+
+    if len(open_dots) != 1:
+        raise ValueError("SYNTAX ERROR: brackets are mismatched.")
+    for _ in range(open_dots[0]):
+        push_kind(TOK_CLOSE)
+        push_id(TOK_CLOSE)
+        push_offset(len(s))
+
+    if _profiler is not None:
+        _profiler.record("lex", perf_counter() - start, chars=len(s), tokens=len(buf))
+    return buf
+
+
+_punctuation_ids = {"\\": TOK_LAMBDA, "(": TOK_OPEN, ")": TOK_CLOSE}
+
+
+def buffer_from_tokens(tokens: List[str]) -> TokenBuffer:
+    """
+    Builds the TokenBuffer of an already tokenized expression (as returned by
+    parse_tokens), without going back through a string. The tokens are not checked.
+    :param tokens: List of tokens
+    :return: the tokens as a TokenBuffer whose source is None and whose offsets are the token indices
+    """
+    buf = TokenBuffer(None)
+    names = buf.names
+    name_ids = dict(_punctuation_ids)
+    push_kind = buf.kinds.append
+    push_id = buf.ids.append
+    for token in tokens:
+        name_id = name_ids.get(token)
+        if name_id is None:
+            name_id = name_ids[token] = len(names)
+            names.append(token)
+        push_kind(name_id if name_id < TOK_VAR else TOK_VAR)
+        push_id(name_id)
+    buf.offsets.extend(range(len(buf.kinds)))
+    return buf
+
+#   =========
+#   END LEXER
+#   =========
+
+
 class Node:
     """
     Nodes in a parse tree
@@ -69,21 +276,314 @@ class ParseTree:
         self.root = root
 
     def print_tree(self, node: Optional[Node] = None, level: int = 0) -> None: 
-        # TODO COMPLETE
-
+        """
+        Prints every node on its own line, indented by "----" per level below node.
+        :param node: the node to start from, the root by default
+        :param level: the level of node
+        """
+        if _profiler is not None:
+            start = _profiler.start("print_tree")
+        for line in self.iter_tree_lines(node, level):
+            print(line)
+        if _profiler is not None:
+            _profiler.record("print_tree", perf_counter() - start)
+
+    def iter_tree_lines(self, node: Optional[Node] = None, level: int = 0) -> Iterator[str]:
+        """
+        The lines print_tree() prints, in order
+        :param node: the node to start from, the root by default
+        :param level: the level of node
+        """
+        for (level, elem) in self.iter_tree_labels(node, level):
+            yield "----"*level + '_'.join(elem)
+
+    def iter_tree_labels(self, node: Optional[Node] = None, level: int = 0) -> Iterator[tuple]:
+        """
+        The nodes in the order print_tree() prints them. Uses an explicit stack so
+        deeply nested trees cannot hit the recursion limit.
+        :param node: the node to start from, the root by default
+        :param level: the level of node
+        :return: iterator over (level, tokens of the node)
+        """
         if node is None: 
             node = self.root
 
-        indent = "----"*level
-        print(indent + '_'.join(node.elem))
+        stack = [(node, level)]
+        while stack:
+            (node, level) = stack.pop()
+            yield (level, node.elem)
+
+            level += 1
+            for child in reversed(node.children):
+                stack.append((child, level))
+
 
-        level += 1
-        for child in node.children: 
-            self.print_tree(child, level)
 
+class TokenSlice(Sequence):
+    """
+    Read-only view of tokens[start:end] that shares the token list instead of copying it
+    Attributes:
+        tokens: the shared list of tokens
+        start: index of the first token in the view
+        end: index after the last token in the view
+    """
+    __slots__ = ("tokens", "start", "end")
+
+    def __init__(self, tokens: List[str], start: int, end: int):
+        self.tokens = tokens
+        self.start = start
+        self.end = end
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.tokens[self.start:self.end][idx]
+        if idx < 0:
+            idx += self.end - self.start
+        if not 0 <= idx < self.end - self.start:
+            raise IndexError("token index out of range")
+        return self.tokens[self.start + idx]
+
+    def __iter__(self):
+        return islice(self.tokens, self.start, self.end)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, (TokenSlice, list, tuple)):
+            return len(self) == len(other) and all(map(str.__eq__, self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return repr(self.tokens[self.start:self.end])
+
+
+class CompactNode:
+    """
+    Node of a CompactParseTree, with the same elem and children attributes as Node
+    Attributes:
+        tree: the tree the node belongs to
+        index: the index of the node in the tree's arrays
+    """
+    __slots__ = ("tree", "index")
+
+    def __init__(self, tree: 'CompactParseTree', index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def elem(self) -> TokenSlice:
+        tree = self.tree
+        return TokenSlice(tree.tokens, tree.starts[self.index], tree.ends[self.index])
+
+    @property
+    def children(self) -> List['CompactNode']:
+        tree = self.tree
+        children = []
+        child = tree.first_child[self.index]
+        while child != -1:
+            children.append(CompactNode(tree, child))
+            child = tree.next_sibling[child]
+        return children
+
+
+class CompactParseTree(ParseTree):
+    """
+    A parse tree stored as parallel arrays with one entry per node, node 0 being the root.
+    Node labels are ranges of one shared token list, so the memory used grows with the
+    number of nodes rather than with the total length of their labels.
+    Attributes:
+        tokens: the tokens of the whole expression
+        kinds: the _NODE_* kind of each node
+        starts, ends: the range of tokens each node stands for
+        first_child, next_sibling: the node's first child and the next child of its parent (-1 for none)
+        root: a CompactNode for node 0
+    """
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.kinds = array("b")
+        self.starts = array("l")
+        self.ends = array("l")
+        self.first_child = array("l")
+        self.next_sibling = array("l")
+        super().__init__(CompactNode(self, 0))
+
+    @classmethod
+    def from_arrays(cls, tokens: Sequence[str], kinds, starts, ends, first_child, next_sibling) -> 'CompactParseTree':
+        """
+        :return: a tree over existing node arrays (any indexable of ints, e.g. memoryviews), which are not copied
+        """
+        tree = cls(tokens)
+        tree.kinds = kinds
+        tree.starts = starts
+        tree.ends = ends
+        tree.first_child = first_child
+        tree.next_sibling = next_sibling
+        return tree
+
+    def __len__(self) -> int:
+        return len(self.kinds)
+
+    def add_node(self, kind: int, start: int, end: int) -> int:
+        """
+        :return: the index of the new node, which has no children or siblings yet
+        """
+        self.kinds.append(kind)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.first_child.append(-1)
+        self.next_sibling.append(-1)
+        return len(self.kinds) - 1
+
+    def iter_tree_labels(self, node: Optional[CompactNode] = None, level: int = 0) -> Iterator[tuple]:
+        """
+        Same nodes as ParseTree.iter_tree_labels(), read straight from the arrays
+        """
+        tokens = self.tokens
+        starts = self.starts
+        ends = self.ends
+        first_child = self.first_child
+        next_sibling = self.next_sibling
+
+        stack = [(self.root.index if node is None else node.index, level)]
+        while stack:
+            (idx, level) = stack.pop()
+            yield (level, tokens[starts[idx]:ends[idx]])
+
+            # push the children last to first so they come off the stack in order
+            children = []
+            child = first_child[idx]
+            while child != -1:
+                children.append(child)
+                child = next_sibling[child]
+            level += 1
+            for child in reversed(children):
+                stack.append((child, level))
+
+
+class SharedNode(Node):
+    """
+    Node of a hash-consed parse tree, one object for every distinct subtree.
+    Subtrees interned in the same HashConsTable are structurally equal exactly
+    when they are the same object, so == and hash() are O(1).
+    Attributes:
+        elem: a list of strings, put together from the children the first time it is read
+        children: a list of child nodes, shared with every other occurrence
+        hash: structural hash of the subtree
+        size: number of nodes in the subtree, counting every occurrence of shared subtrees
+    """
+    def __init__(self, elem: Optional[List[str]], children: tuple, structural_hash: int, size: int):
+        self._elem = elem
+        self.children = children
+        self.hash = structural_hash
+        self.size = size
+
+    @property
+    def elem(self) -> List[str]:
+        if self._elem is None:
+            # iterative so that the first read of a deep tree cannot hit the recursion limit
+            elem = []
+            stack = [self]
+            while stack:
+                node = stack.pop()
+                if node._elem is not None:
+                    elem.extend(node._elem)
+                else:
+                    stack.extend(reversed(node.children))
+            self._elem = elem
+        return self._elem
+
+    def add_child_node(self, node: 'Node') -> None:
+        raise TypeError("shared nodes cannot be changed")
+
+    def __hash__(self) -> int:
+        return self.hash
+
+    def __eq__(self, other) -> bool:
+        return self is other
+
+
+class HashConsTable:
+    """
+    Interning table for SharedNode, keeping one node per distinct subtree.
+    Can be kept across build_shared_parse_tree() calls to share subtrees between expressions.
+    """
+    def __init__(self):
+        self._leaves = {}
+        self._nodes = {}
+
+    def __len__(self) -> int:
+        return len(self._leaves) + len(self._nodes)
+
+    def leaf(self, token: str) -> SharedNode:
+        node = self._leaves.get(token)
+        if node is None:
+            node = self._leaves[token] = SharedNode([token], (), hash((None, token)), 1)
+        return node
+
+    def node(self, children: tuple) -> SharedNode:
+        """
+        :param children: interned nodes, compared by identity and their precomputed hash
+        """
+        node = self._nodes.get(children)
+        if node is None:
+            size = 1
+            for child in children:
+                size += child.size
+            node = self._nodes[children] = SharedNode(None, children, hash(children), size)
+        return node
+
+
+class LazyNode:
+    """
+    Node of a LazyParseTree, with the same elem and children attributes as Node.
+    The children are only worked out the first time they are asked for.
+    Attributes:
+        tree: the tree the node belongs to
+        kind: the _NODE_* kind of the node
+        start, end: the range of tokens the node stands for
+    """
+    __slots__ = ("tree", "kind", "start", "end", "_children")
+
+    def __init__(self, tree: 'LazyParseTree', kind: int, start: int, end: int):
+        self.tree = tree
+        self.kind = kind
+        self.start = start
+        self.end = end
+        self._children = None
+
+    @property
+    def elem(self) -> TokenSlice:
+        return TokenSlice(self.tree.tokens, self.start, self.end)
+
+    @property
+    def children(self) -> List['LazyNode']:
+        if self._children is None:
+            if self.kind == _NODE_LEAF:
+                self._children = []
+            else:
+                tree = self.tree
+                self._children = [LazyNode(tree, kind, start, end) for (kind, start, end)
+                                  in _child_spans(tree.tokens, tree.brackets.partners, self.kind, self.start, self.end)]
+        return self._children
+
+
+class LazyParseTree(ParseTree):
+    """
+    A parse tree whose nodes only build their children when they are first asked for,
+    so looking at the top of the tree does not pay for the rest of it
+    Attributes:
+        tokens: the tokens of the whole expression
+        brackets: the BracketIndex of tokens, used to find the children of a node
+        root: a LazyNode for all of tokens
+    """
+    def __init__(self, tokens: List[str]):
+        self.tokens = tokens
+        self.brackets = BracketIndex(tokens)
+        super().__init__(LazyNode(self, _NODE_SEQ, 0, len(tokens)))
 
 
-def parse_tokens(s_: str, association_type: Optional[str] = None) -> Union[List[str], bool]:
+def parse_tokens(s_: str, association_type: Optional[str] = None, jobs: int = 1) -> Union[List[str], bool]:
     """
     Gets the final tokens for valid strings as a list of strings, only for valid syntax,
     where tokens are (no whitespace included)
@@ -91,361 +591,1171 @@ def parse_tokens(s_: str, association_type: Optional[str] = None) -> Union[List[
     valid variable names
     opening and closing parenthesis
     Note that dots are replaced with corresponding parenthesis
+    While the parse cache is enabled (see enable_parse_cache) the tokens are returned
+    as a tuple, which is shared with the cache.
     :param s_: the input string
     :param association_type: If not None, add brackets to make expressions non-ambiguous
+    :param jobs: parse the top level operands of a long line in this many processes (bypassing
+    the parse cache), the tokens are the same for any number
     :return: A List of tokens (strings) if a valid input, otherwise False
     """
 
     s = s_[:]  #  Don't modify the original input string
     
-    (valid, msg) = valid_syntax(s) 
-    if not valid:
-        print(msg)
+    if jobs > 1:
+        import parallel_parse
+        result = parallel_parse.tokens_or_error(s, association_type, jobs)
+    elif _parse_cache is not None:
+        result = _parse_cache.parse_tokens(s, association_type)
+    else:
+        result = _tokens_or_error(s, association_type)
+    if result.__class__ is str:
+        print(result)
         return False
     
-    show_ambiguity = association_type is not None
+    return result
+
+
+def _tokens_or_error(s: str, association_type: Optional[str] = None) -> Union[List[str], str]:
+    """
+    parse_tokens() without the printing
+    :return: the tokens if s is valid, otherwise the error message
+    """
+    issues = syntax_errors(s)
+    if issues:
+        return issues[0].message
     
-    if association_type == "right":
-        tokens = parse_expr(s, show_ambiguity)[::-1]
-        return mirror_brackets(tokens)
-    else:
-        return parse_expr(s, show_ambiguity)
+    buf = tokenize(s)
+    if association_type is None:
+        return buf.to_list()
+
+    return emit_tokens(parse_token_buffer(buf), buf, association_type)
 
 #   ======================
 #   BEGIN CUSTOM FUNCTIONS
 #   ======================
 
 
-def parse_expr(s: str, show_ambiguity: bool = False) -> list[str]:
-    """ 
-    converts the string itself into the list of tokens
+# kinds of terms built by parse_token_buffer(), all terms are tuples starting with the kind:
+#   (TERM_VAR, tok)                  tok is the index of the variable token
+#   (TERM_ABS, tok, body)            tok is the index of the '\\', the binder is at tok + 1
+#   (TERM_APP, operands)             tuple of two or more terms, applied in order
+#   (TERM_GROUP, open, close, inner) an expression between the brackets at open and close
+TERM_VAR = 0
+TERM_ABS = 1
+TERM_APP = 2
+TERM_GROUP = 3
+
+# what the parser is collecting operands for
+_FRAME_ROOT = 0
+_FRAME_GROUP = 1
+_FRAME_LAMBDA = 2
+
+
+def _application(operands: list) -> tuple:
+    if not operands:
+        raise ValueError("SYNTAX ERROR: expression is missing.")
+    if len(operands) == 1:
+        return operands[0]
+    return (TERM_APP, tuple(operands))
+
+
+def parse_token_buffer(buf: TokenBuffer, start: int = 0, end: Optional[int] = None) -> tuple:
     """
-    # some cases where there would be " <expr>", which makes
-    # the program think theres two exprs
-    s = s.strip()
+    Parses the tokens buf[start:end] in one left to right pass, using an explicit
+    stack instead of recursion and only ever looking at token indices (no copies).
+    A lambda body extends as far right as possible, so it ends at the bracket
+    closing the expression the lambda is in.
+    :param buf: tokens of a syntactically valid expression (see tokenize)
+    :param start: index of the first token to parse
+    :param end: index after the last token to parse, defaults to the end of buf
+    :return: the term for the expression, see TERM_*
+    """
+    if _profiler is not None:
+        started = _profiler.start("parse")
+    if end is None:
+        end = len(buf)
+    kinds = buf.kinds
+
+    # each frame is [frame kind, token index it started at, operands so far]
+    stack = [[_FRAME_ROOT, start, []]]
+    operands = stack[-1][2]
+    max_depth = 1
+    i = start
+    while i < end:
+        kind = kinds[i]
+        if kind == TOK_VAR:
+            operands.append((TERM_VAR, i))
+        elif kind == TOK_LAMBDA:
+            if i + 1 >= end or kinds[i + 1] != TOK_VAR:
+                raise ValueError("SYNTAX ERROR: lambda expression syntax is incorrect.")
+            stack.append([_FRAME_LAMBDA, i, []])
+            operands = stack[-1][2]
+            if len(stack) > max_depth:
+                max_depth = len(stack)
+            i += 1  # skip the binder
+        elif kind == TOK_OPEN:
+            stack.append([_FRAME_GROUP, i, []])
+            operands = stack[-1][2]
+            if len(stack) > max_depth:
+                max_depth = len(stack)
+        else:
+            # a ')' ends every lambda body opened since the matching '('
+            while stack[-1][0] == _FRAME_LAMBDA:
+                _, lambda_idx, body = stack.pop()
+                stack[-1][2].append((TERM_ABS, lambda_idx, _application(body)))
+            frame_kind, open_idx, inner = stack.pop()
+            if frame_kind != _FRAME_GROUP:
+                raise ValueError("SYNTAX ERROR: brackets are mismatched.")
+            operands = stack[-1][2]
+            operands.append((TERM_GROUP, open_idx, i, _application(inner)))
+        i += 1
+
+    while stack[-1][0] == _FRAME_LAMBDA:
+        _, lambda_idx, body = stack.pop()
+        stack[-1][2].append((TERM_ABS, lambda_idx, _application(body)))
+    if len(stack) != 1:
+        raise ValueError("SYNTAX ERROR: brackets are mismatched.")
+    if _profiler is not None:
+        _profiler.record("parse", perf_counter() - started, tokens=end - start, depth=max_depth)
+    return _application(stack[0][2])
+
+
+def emit_tokens(term: tuple, buf: TokenBuffer, association_type: Optional[str] = None) -> List[str]:
+    """
+    Converts a term back into tokens. With an association type, every application
+    of more than two operands is bracketed in pairs, either from the left
+    ((a b) c) or from the right (a (b c)), and the whole application is bracketed
+    unless it already is the only thing inside brackets.
+    :param term: a term from parse_token_buffer
+    :param buf: the tokens the term was parsed from
+    :param association_type: None, "left" or "right"
+    :return: a list of tokens
+    """
+    if _profiler is not None:
+        start = _profiler.start("associate")
+    names = buf.names
+    ids = buf.ids
     tokens = []
-    
-    if show_ambiguity: tokens.append("(")
-
-    # case 1 : <expr> ::= '(' <expr> ')'
-    # case 2 : <expr> ::= '\' <var> <expr> 
-    if s[0] == '\\':
-        var_end_idx = end_idx_of_var(s[1:]);
-        # note: array indexing has an inclusive start
-        # but an exclusive end
-        var_str =  s[1:var_end_idx+1]
-        expr_str = s[var_end_idx+1:]
-        tokens.extend("\\")
-        tokens.extend(var_str)
-        tokens.extend(parse_expr(expr_str, show_ambiguity))
-    # checks if this is either the only bracketed expr OR theres nested brackets
-    elif (s[0] == '(' and ") " not in s) or (s.__contains__('(') and s.__contains__(')') and valid_syntax(s[1:-1])[0] ):
-        closing_bracket_idx = find_closing_bracket(s)
-        tokens.extend('(')
-        tokens.extend( parse_expr(s[1:closing_bracket_idx], show_ambiguity) )
-        tokens.extend(')')
-    # case 3 : <expr> ::= <var>
-    elif len(s.split(' ')) > 1:
-        # if this expression is two '(<expr>)'s
-        # split at the end of the first bracket expr
-        if s[0] == '(' and s[-1] == ')':
-            # re-add end bracket because the split() method
-            # excludes the bracket for `expr1`
-            expr1 = (s.split(") ", 1))[0] + ")"
-            expr2 = (s.split(") ", 1))[1]
-            tokens.extend( parse_expr(expr1) )
-            tokens.extend( parse_expr(expr2) )
+    # work items are either a token string or a (term, bracketed) pair,
+    # pushed in reverse since the stack pops from the end
+    stack = [(term, False)]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            tokens.append(item)
+            continue
+        (term, bracketed) = item
+        kind = term[0]
+        if kind == TERM_VAR:
+            tokens.append(names[ids[term[1]]])
+        elif kind == TERM_ABS:
+            tokens.append("\\")
+            tokens.append(names[ids[term[1] + 1]])
+            stack.append((term[2], False))
+        elif kind == TERM_GROUP:
+            tokens.append("(")
+            stack.append(")")
+            stack.append((term[3], True))
+        elif association_type is None:
+            stack.extend((operand, False) for operand in reversed(term[1]))
         else:
-            expr1 = (s.split(" ", 1))[0]
-            expr2 = (s.split(" ", 1))[1]
-            tokens.extend( parse_expr(expr1, show_ambiguity) )
-            tokens.extend( parse_expr(expr2, show_ambiguity) )   
-    # case 4 : <expr> ::= <expr> <expr>
-    elif alphabet_chars.__contains__(s[0]):
-        # 'extend' takes an iterable as the argument, so if you give it a whole string,
-        # itll split the string into its characters.
-        # by giving it a list of a string, it just puts the whole string in as one object
-        tokens.extend([s])
-
-
-    if show_ambiguity: tokens.append(")")
-    
+            operands = term[1]
+            # one pair of brackets per two operands applied, minus the outermost
+            # pair if the application is already inside brackets
+            pairs = len(operands) - 2 if bracketed else len(operands) - 1
+            if association_type == "right":
+                # ( a ( b ( c d ) ) )
+                stack.extend(")" * pairs)
+                stack.append((operands[-1], False))
+                for idx in range(len(operands) - 2, -1, -1):
+                    stack.append((operands[idx], False))
+                    if idx > 0 or not bracketed:
+                        stack.append("(")
+            else:
+                # ( ( ( a b ) c ) d )
+                if not bracketed:
+                    stack.append(")")
+                for idx in range(len(operands) - 1, 1, -1):
+                    stack.append((operands[idx], False))
+                    stack.append(")")
+                stack.append((operands[1], False))
+                stack.append((operands[0], False))
+                stack.extend("(" * pairs)
+
+    if _profiler is not None:
+        _profiler.record("associate", perf_counter() - start, tokens=len(tokens))
     return tokens
 
 
-def mirror_brackets(s: list[str]) -> list[str]:
-    '''
-    right associativity is done by flipping the expression, evaluating it as a
-    left-associated tree, then reflipping it. Because of the way the brackets are added
-    (done for left-associated parsing), the brackets need to be "mirrored" 
-    (i.e. opening becomes closed, closed becomes opening) for a right associated parse
-    to look correct  
-    '''
-    r = []
-    for char in s:
-        if char == "(":
-            r.append(")")
-        elif char == ")":
-            r.append("(")
+def emit_minimal_tokens(term: tuple, buf: TokenBuffer, association_type: str = "left") -> List[str]:
+    """
+    Converts a term back into tokens with only the brackets needed to read it the
+    same way under the association type: "left" reads a b c as ((a b) c) and
+    "right" as (a (b c)). Brackets in the source (and dots) are dropped, the
+    structure they gave is kept. A lambda body extends as far right as possible,
+    so a lambda is bracketed unless nothing follows it.
+    Example: (a b) (\\x.x) c, left -> a b (\\ x x) c, right -> (a b) (\\ x x) c
+    :param term: a term from parse_token_buffer
+    :param buf: the tokens the term was parsed from
+    :param association_type: "left" or "right"
+    :return: a list of tokens
+    """
+    if association_type not in ("left", "right"):
+        raise ValueError(f"association_type must be 'left' or 'right', not {association_type!r}")
+    if _profiler is not None:
+        start = _profiler.start("associate")
+    left = association_type == "left"
+    names = buf.names
+    ids = buf.ids
+    tokens = []
+    # work items are either a token string or a (term, rightmost) pair, rightmost
+    # being whether nothing follows the term before its closing bracket or the end
+    stack = [(term, True)]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            tokens.append(item)
+            continue
+        (term, rightmost) = item
+        while term[0] == TERM_GROUP:
+            term = term[3]
+        kind = term[0]
+        if kind == TERM_VAR:
+            tokens.append(names[ids[term[1]]])
+        elif kind == TERM_ABS:
+            tokens.append("\\")
+            tokens.append(names[ids[term[1] + 1]])
+            stack.append((term[2], True))
         else:
-            r.append(char) 
-    return r
-    
+            operands = term[1]
+            last = len(operands) - 1
+            for idx in range(last, -1, -1):
+                operand = operands[idx]
+                while operand[0] == TERM_GROUP:
+                    operand = operand[3]
+                if operand[0] == TERM_VAR:
+                    stack.append((operand, False))
+                    continue
+                if operand[0] == TERM_ABS:
+                    # the body would take in everything after it
+                    needs_brackets = idx < last or not rightmost
+                elif left:
+                    # the head of a left associated application is the application so far
+                    needs_brackets = idx > 0
+                else:
+                    needs_brackets = idx < last
+                if needs_brackets:
+                    stack.append(")")
+                    stack.append((operand, True))
+                    stack.append("(")
+                else:
+                    stack.append((operand, rightmost and idx == last))
+
+    if _profiler is not None:
+        _profiler.record("associate", perf_counter() - start, tokens=len(tokens))
+    return tokens
 
-def add_correct_spacing(s: str) -> str:
+
+# kinds of de Bruijn terms built by to_de_bruijn(), tuples starting with the kind:
+#   (DB_VAR, index)          bound variable, index is the number of lambdas between it and its binder
+#   (DB_FREE, name)          free variable
+#   (DB_ABS, body, name)     lambda, name is the binder's name in the source (only kept for printing)
+#   (DB_APP, function, arg)  application of two terms
+DB_VAR = 0
+DB_FREE = 1
+DB_ABS = 2
+DB_APP = 3
+
+# work items of to_de_bruijn()
+_DB_VISIT = 0
+_DB_LEAVE_ABS = 1
+_DB_APPLY = 2
+
+
+def to_de_bruijn(term: tuple, buf: TokenBuffer) -> tuple:
     """
-    the parse_str function doesnt work for examples such as:
-    a \\x(x b)
-    because it parses "\\x(x" into one token. This function stops that from happening 
+    Converts a term into de Bruijn form, where bound variables are numbered by how
+    many lambdas lie between them and their binder, so alpha equivalent terms are
+    equal. Brackets are dropped and applications are associated to the left.
+    Uses an explicit stack so deeply nested terms cannot hit the recursion limit.
+    Example: \\x.\\y.x y z -> \\.\\.((1 0) z), with z free
+    :param term: a term from parse_token_buffer
+    :param buf: the tokens the term was parsed from
+    :return: the term in de Bruijn form, see DB_*
     """
-    result = ""
-    
-    for idx, char in enumerate(s):
-        if (char == "\\" or char == "(" or char == ")"):
-            if (idx - 1 >= 0) and (s[idx - 1] != " "):
-                result += " "      
+    names = buf.names
+    ids = buf.ids
+    # depths of the lambdas binding each name, innermost last
+    binders = {}
+    depth = 0
+    results = []
+    stack = [(_DB_VISIT, term)]
+    while stack:
+        (action, item) = stack.pop()
+        if action == _DB_VISIT:
+            while item[0] == TERM_GROUP:
+                item = item[3]
+            kind = item[0]
+            if kind == TERM_VAR:
+                name = names[ids[item[1]]]
+                depths = binders.get(name)
+                if depths:
+                    results.append((DB_VAR, depth - 1 - depths[-1]))
+                else:
+                    results.append((DB_FREE, name))
+            elif kind == TERM_ABS:
+                name = names[ids[item[1] + 1]]
+                binders.setdefault(name, []).append(depth)
+                depth += 1
+                stack.append((_DB_LEAVE_ABS, name))
+                stack.append((_DB_VISIT, item[2]))
+            else:
+                operands = item[1]
+                stack.append((_DB_APPLY, len(operands)))
+                stack.extend((_DB_VISIT, operand) for operand in reversed(operands))
+        elif action == _DB_LEAVE_ABS:
+            depth -= 1
+            binders[item].pop()
+            results.append((DB_ABS, results.pop(), item))
+        else:
+            first = len(results) - item
+            applied = results[first]
+            for idx in range(first + 1, len(results)):
+                applied = (DB_APP, applied, results[idx])
+            del results[first:]
+            results.append(applied)
+    return results[0]
+
+
+def canonical_tokens(term: tuple, buf: TokenBuffer) -> List[str]:
+    """
+    Writes a term in prefix form with its bound variables renamed to de Bruijn
+    indices, in one traversal: "@" for a (two operand) application, "\\" for a
+    lambda, "#i" for the variable bound i lambdas out, and free variables by name.
+    Brackets are dropped and applications associated to the left, so two terms
+    have the same canonical tokens exactly when they are alpha equivalent.
+    Example: \\x.x y -> \\ #0 y, and \\z.z y gives the same
+    :param term: a term from parse_token_buffer
+    :param buf: the tokens the term was parsed from
+    :return: a list of tokens
+    """
+    names = buf.names
+    ids = buf.ids
+    binders = {}
+    depth = 0
+    tokens = []
+    # work items are terms, or the name of a lambda's binder to leave it
+    stack = [term]
+    while stack:
+        item = stack.pop()
+        if item.__class__ is str:
+            depth -= 1
+            binders[item].pop()
+            continue
+        while item[0] == TERM_GROUP:
+            item = item[3]
+        kind = item[0]
+        if kind == TERM_VAR:
+            name = names[ids[item[1]]]
+            depths = binders.get(name)
+            tokens.append(f"#{depth - 1 - depths[-1]}" if depths else name)
+        elif kind == TERM_ABS:
+            name = names[ids[item[1] + 1]]
+            binders.setdefault(name, []).append(depth)
+            depth += 1
+            tokens.append("\\")
+            stack.append(name)
+            stack.append(item[2])
+        else:
+            operands = item[1]
+            tokens.extend("@" * (len(operands) - 1))
+            stack.extend(reversed(operands))
+    return tokens
 
-        result += char
 
-        if (char == "\\" or char == "(" or char == ")"):
-            if (idx + 1 < len(s)) and (s[idx + 1] != " "):
-                result += " "
+def alpha_hash(s: str) -> Optional[str]:
+    """
+    :param s: the input string
+    :return: a hash of s that is the same for every alpha equivalent expression
+    and stable between runs (hex digits), or None if s is not a valid expression
+    """
+    if syntax_errors(s):
+        return None
+    buf = tokenize(s)
+    canonical = "\0".join(canonical_tokens(parse_token_buffer(buf), buf))
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+# syntax error codes, see syntax_errors()
+ERR_BRACKETS = 1
+ERR_EMPTY_BRACKETS = 2
+ERR_VAR_START = 3
+ERR_VAR_CHAR = 4
+ERR_DOT_NO_LAMBDA = 5
+ERR_DOT_NO_VAR = 6
+ERR_LAMBDA_SPACE = 7
+ERR_LAMBDA = 8
+ERR_EMPTY = 9
+# resource limit codes, see Limits
+ERR_DEPTH_LIMIT = 10
+ERR_TOKEN_LIMIT = 11
+ERR_NODE_LIMIT = 12
+ERR_TIME_LIMIT = 13
+
+_error_messages = {
+    ERR_BRACKETS: "SYNTAX ERROR: brackets are mismatched.",
+    ERR_EMPTY_BRACKETS: "SYNTAX ERROR: expression missing inside brackets (index {idx})",
+    ERR_VAR_START: "SYNTAX ERROR: variables must start with a letter",
+    ERR_VAR_CHAR: "SYNTAX ERROR: variables cannot contain the character '{char}'",
+    ERR_DOT_NO_LAMBDA: "SYNTAX ERROR: dot operators must occur AFTER a lambda expression",
+    ERR_DOT_NO_VAR: "SYNTAX ERROR: need a variable before a dot operator.",
+    ERR_LAMBDA_SPACE: "SYNTAX ERROR: spaces or brackets not allowed immediately after a lambda (index {idx})",
+    ERR_LAMBDA: "SYNTAX ERROR: lambda expression syntax is incorrect.",
+    ERR_EMPTY: "SYNTAX ERROR: expression is missing.",
+    ERR_DEPTH_LIMIT: "LIMIT EXCEEDED: expression is nested too deeply (index {idx})",
+    ERR_TOKEN_LIMIT: "LIMIT EXCEEDED: expression has too many tokens (index {idx})",
+    ERR_NODE_LIMIT: "LIMIT EXCEEDED: parse tree has too many nodes",
+    ERR_TIME_LIMIT: "LIMIT EXCEEDED: expression took too long to parse (index {idx})",
+}
+_limit_codes = frozenset((ERR_DEPTH_LIMIT, ERR_TOKEN_LIMIT, ERR_NODE_LIMIT, ERR_TIME_LIMIT))
+
+
+class SyntaxIssue(NamedTuple):
+    """
+    A syntax error found by syntax_errors()
+    Attributes:
+        offset: index in the input string the error was found at
+        code: one of the ERR_* codes
+        message: the error message printed for it
+    """
+    offset: int
+    code: int
+    message: str
 
-    return result
 
+def _syntax_issue(s: str, code: int, offset: int) -> SyntaxIssue:
+    char = s[offset] if offset < len(s) else ""
+    return SyntaxIssue(offset, code, _error_messages[code].format(idx=offset, char=char))
 
-def end_idx_of_var(s) -> int:
-    '''
-    given a string s where a variable starts at index 0,
-    returns the index of the end of the variable
-    example:
-    "as(ds)" -> 2
-    "mkdsaj (a v)" -> 6
-    '''
-    for idx, char in enumerate(s):
-        if not var_chars.__contains__(char):
-            return idx
-    
-    return len(s)
-      
-
-def find_closing_bracket(s) -> int:
-    '''
-    given a string with an opening bracket at index 0,
-    returns the index of the associated closing bracket
-    '''
-    bracket_number = 0
-    for idx, char in enumerate(s):
-        if char == '(':
-            bracket_number += 1
-        elif char == ')':
-            bracket_number -= 1
-        if bracket_number == 0: 
-            return idx
-    return -1
-
-
-def convert_dot_to_brackets(s: str) -> str:
-    """ 
-    checks to see if there are any dot operators,
-    if there are, it converts it to the equivalent expression
-    with brackets
-    """
-    s = s[::-1]
-    
-    modified_string = ""
-    
-    # looping over s backwards
-    for char in s:
-        if char == '.':
-            modified_string = ''.join((')', modified_string))
-            modified_string += '( '
-        else:
-            modified_string += char
-    
-    modified_string = modified_string[::-1]
-    
-    return modified_string
-
-
-def valid_lambda_expr(s) -> tuple[bool, str]:
-    """ 
-    given the string s, determines if any lambda expressions in it are valid
-    """
-    in_lambda_expr = False
-    for idx, char in enumerate(s):
-        if char == '\\':
-            in_lambda_expr = True
-            # spaces or brackets not allowed immediately after a slash
-            if idx+1 < len(s) and (s[idx+1] == ' ' or s[idx+1] == '('):
-                return (False, f"SYNTAX ERROR: spaces or brackets not allowed immediately after a lambda (index {idx})")
-                
-        if char == ' ':
-            # make sure there's another expression after the lambda token
-            if all_valid_chars.__contains__(s[idx+1]):
-                in_lambda_expr = False
-            
-    if not in_lambda_expr:
-        return (True, "")
-    else:
-        return (False, "SYNTAX ERROR: lambda expression syntax is incorrect.")
-    
-    
-def valid_brackets(s: str) -> tuple[bool, str]:    
+
+class Limits(NamedTuple):
     """
-    returns true if the string has valid bracket syntax
-    :param s_: the input string
+    Resources one expression may use, see parse_line(). None means no limit.
+    Attributes:
+        max_depth: deepest nesting of brackets, dots and lambdas
+        max_tokens: most tokens, a dot counting as the two brackets it stands for
+        max_nodes: most nodes of the parse tree
+        max_seconds: most CPU time spent on the expression
     """
-    s = s.replace(" ", "")
-    bracket_count = 0
-    for (idx,char) in enumerate(s):
-        if char == '(':
-            bracket_count += 1
-            
-            if idx + 1 < len(s) and s[idx+1] != '(':
-                next_char = s[idx+1]
-                # expression missing from the brackets
-                if next_char == ')':
-                    return (False, f"SYNTAX ERROR: expression missing inside brackets (index {idx})")
-            
-        if char == ')':
-            bracket_count -= 1
-        
-        # bracket count can only be negative if a close bracket
-        # appears before an opening
-        if bracket_count < 0:
-            return (False, f"SYNTAX ERROR: brackets are mismatched.")
+    max_depth: Optional[int] = None
+    max_tokens: Optional[int] = None
+    max_nodes: Optional[int] = None
+    max_seconds: Optional[float] = None
 
-    if bracket_count != 0:
-        return (False, "SYNTAX ERROR: brackets are mismatched.")
+    def deadline(self) -> Optional[float]:
+        """
+        :return: the process_time() to stop at when starting now, None if there is no time limit
+        """
+        return None if self.max_seconds is None else process_time() + self.max_seconds
 
-    return (True, "")
 
+class LimitExceeded(ValueError):
+    """
+    An expression went over one of its Limits
+    Attributes:
+        issue: the SyntaxIssue for it, with one of the ERR_*_LIMIT codes
+    """
+    def __init__(self, issue: SyntaxIssue):
+        super().__init__(issue.message)
+        self.issue = issue
 
-def valid_syntax(s: str) -> tuple[bool, str]:
-    
-    (valid, err_msg) = valid_dot_op(s)
-    if not valid:
-        return (False, err_msg)
-    
-    modified_s = convert_dot_to_brackets(s) 
-    
-    (valid, err_msg) = valid_brackets(s)
-    if not valid:
-        return (False, err_msg)
-   
-    # standardize the string to make it easier to parse 
-    modidifed_s = modified_s.replace("_", " ")
-    modidifed_s = modified_s.replace("  ", " ")
-    modidifed_s = add_correct_spacing(modified_s)
-    
-    # next make sure any variables are valid
-    for potential_var in s.split(' '):
-        if ("(" in potential_var) or (")" in potential_var) or ("." in potential_var) or ("\\" in potential_var):
-            continue
-       
-        # sometimes if you split between two spaces, it adds an empty string into the split
-        if potential_var == "":
+
+# how many lexemes or tree nodes are processed between checks of the time limit
+_CLOCK_INTERVAL = 1024
+
+
+def _limited_lexemes(s: str, limits: Limits, deadline: Optional[float]) -> Iterator[re.Match]:
+    """
+    The lexemes of s, stopping with LimitExceeded as soon as s goes over the depth,
+    token or time limit
+    """
+    max_depth = limits.max_depth
+    max_tokens = limits.max_tokens
+    depth = 0
+    tokens = 0
+    # dots and lambdas waiting for the ')' that ends them, at each bracket depth
+    open_bodies = [0]
+    for (count, m) in enumerate(_lexeme_re.finditer(s)):
+        lexeme = m.lastindex
+        if lexeme == _LEX_OPEN:
+            depth += 1
+            open_bodies.append(0)
+        elif lexeme == _LEX_DOT or lexeme == _LEX_LAMBDA:
+            depth += 1
+            open_bodies[-1] += 1
+        elif lexeme == _LEX_CLOSE and len(open_bodies) > 1:
+            depth -= open_bodies.pop() + 1
+        if lexeme != _LEX_SPACE and lexeme != _LEX_BAD:
+            tokens += 2 if lexeme == _LEX_DOT else 1
+
+        if max_depth is not None and depth > max_depth:
+            raise LimitExceeded(_syntax_issue(s, ERR_DEPTH_LIMIT, m.start()))
+        if max_tokens is not None and tokens > max_tokens:
+            raise LimitExceeded(_syntax_issue(s, ERR_TOKEN_LIMIT, m.start()))
+        if deadline is not None and count % _CLOCK_INTERVAL == 0 and process_time() > deadline:
+            raise LimitExceeded(_syntax_issue(s, ERR_TIME_LIMIT, m.start()))
+        yield m
+
+
+# states of the syntax checker
+_S_EXPR = 0       # an expression has to follow, at the start or after a '('
+_S_BODY = 1       # a lambda body has to follow, after the binder and a space or a dot
+_S_ITEM = 2       # after a variable or a ')', anything may follow
+_S_LAMBDA = 3     # right after a '\\'
+_S_LAMBDA_SP = 4  # whitespace after a '\\', already reported
+_S_BINDER = 5     # right after the variable of a '\\'
+
+# _syntax_table[state][lexeme] = (next state, error code or 0), lexemes as in _lexeme_re
+_syntax_table = (
+    #      var             space                             (                            )                              .                             \\                       bad word
+    (None, (_S_ITEM, 0),   (_S_EXPR, 0),                     (_S_EXPR, 0),                (_S_ITEM, ERR_EMPTY_BRACKETS), (_S_EXPR, ERR_DOT_NO_LAMBDA), (_S_LAMBDA, 0),          (_S_ITEM, ERR_VAR_START)),  # _S_EXPR
+    (None, (_S_ITEM, 0),   (_S_BODY, 0),                     (_S_EXPR, 0),                (_S_ITEM, ERR_LAMBDA),         (_S_BODY, ERR_DOT_NO_VAR),    (_S_LAMBDA, 0),          (_S_ITEM, ERR_VAR_START)),  # _S_BODY
+    (None, (_S_ITEM, 0),   (_S_ITEM, 0),                     (_S_EXPR, 0),                (_S_ITEM, 0),                  (_S_ITEM, ERR_DOT_NO_LAMBDA), (_S_LAMBDA, 0),          (_S_ITEM, ERR_VAR_START)),  # _S_ITEM
+    (None, (_S_BINDER, 0), (_S_LAMBDA_SP, ERR_LAMBDA_SPACE), (_S_EXPR, ERR_LAMBDA_SPACE), (_S_ITEM, ERR_LAMBDA),         (_S_BODY, ERR_DOT_NO_VAR),    (_S_LAMBDA, ERR_LAMBDA), (_S_BINDER, ERR_VAR_START)),  # _S_LAMBDA
+    (None, (_S_BINDER, 0), (_S_LAMBDA_SP, 0),                (_S_EXPR, 0),                (_S_ITEM, ERR_LAMBDA),         (_S_BODY, ERR_DOT_NO_VAR),    (_S_LAMBDA, ERR_LAMBDA), (_S_BINDER, ERR_VAR_START)),  # _S_LAMBDA_SP
+    (None, (_S_ITEM, 0),   (_S_BODY, 0),                     (_S_EXPR, 0),                (_S_ITEM, ERR_LAMBDA),         (_S_BODY, 0),                 (_S_LAMBDA, 0),          (_S_ITEM, ERR_VAR_START)),  # _S_BINDER
+)
+
+# error for reaching the end of the input in each state (brackets are checked separately)
+_syntax_end_errors = (ERR_EMPTY, ERR_LAMBDA, 0, ERR_LAMBDA, ERR_LAMBDA, ERR_LAMBDA)
+
+
+def syntax_errors(s: str, all_errors: bool = False, limits: Optional[Limits] = None,
+                  deadline: Optional[float] = None) -> List[SyntaxIssue]:
+    """
+    Checks dot placement, bracket balance, variable names and lambda syntax in a
+    single scan, driven by _syntax_table and a stack of the unclosed brackets.
+    :param s: the input string
+    :param all_errors: keep scanning after the first error and report every error, otherwise
+    only the error with the lowest offset is reported
+    :param limits: stop the scan at the first of the depth, token and time limits s goes
+    over, which is then the last error reported
+    :param deadline: process_time() at which the time limit runs out, by default limits.max_seconds from now
+    :return: the errors found sorted by offset, empty if s is valid
+    """
+    if _profiler is not None:
+        start = _profiler.start("validate")
+    if limits is None:
+        issues = _scan_syntax(s, all_errors, _lexeme_re.finditer(s))
+    else:
+        if deadline is None:
+            deadline = limits.deadline()
+        issues = []
+        try:
+            issues = _scan_syntax(s, all_errors, _limited_lexemes(s, limits, deadline), issues)
+        except LimitExceeded as e:
+            if all_errors or not issues:
+                issues.append(e.issue)
+            else:
+                # a limit hit while looking for an error before the first one found
+                issues[:] = [min(issues)]
+    if _profiler is not None:
+        _profiler.record("validate", perf_counter() - start, chars=len(s))
+    return issues
+
+
+def _scan_syntax(s: str, all_errors: bool, lexemes: Iterator[re.Match],
+                 issues: Optional[list] = None) -> List[SyntaxIssue]:
+    """
+    :param lexemes: the matches of _lexeme_re in s
+    :param issues: the list to add the errors to
+    """
+    if issues is None:
+        issues = []
+    opened = []  # offsets of the '(' that are not closed yet
+    lambda_at = 0
+    state = _S_EXPR
+
+    for m in lexemes:
+        lexeme = m.lastindex
+        (state, code) = _syntax_table[state][lexeme]
+        if code == 0 and lexeme not in (_LEX_OPEN, _LEX_CLOSE, _LEX_LAMBDA, _LEX_BAD):
             continue
-            
-        (valid, err_msg) = is_valid_var_name(potential_var)
-        if not valid:
-            return (False, err_msg)
-        
-    # make sure lambda expressions are valid
-    (valid, err_msg) = valid_lambda_expr(s)
-    if not valid:
-        return (False, err_msg)
+
+        offset = m.start()
+        if lexeme == _LEX_OPEN:
+            opened.append(offset)
+            if code == ERR_LAMBDA_SPACE:
+                offset = lambda_at
+        elif lexeme == _LEX_CLOSE:
+            if not opened:
+                code = ERR_BRACKETS
+            else:
+                open_at = opened.pop()
+                if code == ERR_EMPTY_BRACKETS:
+                    offset = open_at
+        elif lexeme == _LEX_LAMBDA:
+            lambda_at = offset
+        elif lexeme == _LEX_BAD:
+            if s[offset] in alphabet_char_set:
+                code = ERR_VAR_CHAR
+                offset += 1
+                while s[offset] in var_char_set:
+                    offset += 1
+        elif code == ERR_LAMBDA_SPACE:
+            offset = lambda_at
+
+        if code:
+            issues.append(_syntax_issue(s, code, offset))
+        # only errors about the brackets still open, or about spaces after the lambda just
+        # read, can come before the ones found so far, so the first error is known once the
+        # brackets are closed and the lambda is followed by something else
+        if issues and not all_errors and not opened and state != _S_LAMBDA:
+            issues[:] = [min(issues)]
+            return issues
+
+    for open_at in opened:
+        issues.append(_syntax_issue(s, ERR_BRACKETS, open_at))
+    code = _syntax_end_errors[state]
+    if code and not (code == ERR_EMPTY and opened):
+        issues.append(_syntax_issue(s, code, len(s)))
+
+    issues.sort()
+    if not all_errors:
+        del issues[1:]
+    return issues
+
+
+def valid_syntax(s: str) -> tuple[bool, str]:
+    """
+    :param s: the input string
+    :return: (True, "") if s is a valid expression, otherwise (False, <message of the first error>)
+    """
+    if _parse_cache is not None:
+        return _parse_cache.valid_syntax(s)
+
+    issues = syntax_errors(s)
+    if issues:
+        return (False, issues[0].message)
     
     return (True, "")
 
 
-def valid_dot_op(s: str) -> tuple[bool, str]:   
-    # make sure any dot operators happen AFTER a lambda expression
-    dot_op = False
-    for idx,char in enumerate(s[::-1]):  # iter from right --> left
-        if char == '.':
-            dot_op = True
-        if char == '\\':
-            dot_op = False
-    if dot_op == True:
-        return (False, f"SYNTAX ERROR: dot operators must occur AFTER a lambda expression")
-            
-    # makes sure that if there is a dot operator, it has a variable beside it   x
-    reversed_str = s[::-1]
-    for (idx, char) in enumerate(reversed_str):
-        if char == ".":
-            if idx + 1 <= len(s) and not var_chars.__contains__(reversed_str[idx+1]):
-                return (False, "SYNTAX ERROR: need a variable before a dot operator.")
-                
-    return (True, "")
+class ParseCache:
+    """
+    Bounded cache of parse_tokens(), valid_syntax() and parse_line() results,
+    evicting the least recently used entry once it is full. Entries are keyed on
+    (input string, association type), with _SYNTAX_KEY and _LINE_KEY as the
+    association type for valid_syntax() and parse_line() results.
+    Attributes:
+        maxsize: the most entries kept at once
+        hits: lookups answered from the cache
+        misses: lookups that had to be computed
+        evictions: entries dropped to make room
+    """
+    def __init__(self, maxsize: int = 4096):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _lookup(self, key: tuple, compute, keep=None):
+        """
+        :param keep: if not None, a computed value is only cached if keep(value) is true
+        """
+        entries = self._entries
+        try:
+            value = entries[key]
+        except KeyError:
+            self.misses += 1
+            value = compute()
+            if keep is not None and not keep(value):
+                return value
+            entries[key] = value
+            if len(entries) > self.maxsize:
+                entries.popitem(last=False)
+                self.evictions += 1
+            return value
+        
+        self.hits += 1
+        entries.move_to_end(key)
+        return value
+
+    def parse_tokens(self, s: str, association_type: Optional[str] = None) -> Union[tuple, str]:
+        """
+        :return: the tokens as a tuple if s is valid, otherwise the error message
+        """
+        def compute():
+            result = _tokens_or_error(s, association_type)
+            return result if result.__class__ is str else tuple(result)
+
+        return self._lookup((s, association_type), compute)
+
+    def valid_syntax(self, s: str) -> tuple[bool, str]:
+        def compute():
+            issues = syntax_errors(s)
+            return (False, issues[0].message) if issues else (True, "")
+
+        return self._lookup((s, _SYNTAX_KEY), compute)
+
+    def parse_line(self, s: str, limits: Optional[Limits] = None, deadline: Optional[float] = None) -> 'LineResult':
+        """
+        Results cut short by a limit are not cached, as parse_store.ParseStore.put() does not store them:
+        whether the time limit runs out depends on the load of the machine and not only on s.
+        :return: the LineResult of s, without a tree
+        """
+        key = (s, _LINE_KEY) if limits is None else (s, (_LINE_KEY, limits))
+        return self._lookup(key, lambda: _line_result(s, limits, deadline), _within_limits)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                "misses": self.misses, "evictions": self.evictions}
+
+
+_SYNTAX_KEY = "syntax"
+_LINE_KEY = "line"
+
+
+def _within_limits(result: 'LineResult') -> bool:
+    return result.code not in _limit_codes
+
+_parse_cache: Optional[ParseCache] = None
+
+
+def enable_parse_cache(maxsize: int = 4096) -> ParseCache:
+    """
+    Makes parse_tokens(), valid_syntax() and parse_line() remember their results for the
+    maxsize most recently used inputs
+    :return: the cache, for its hit, miss and eviction counters
+    """
+    global _parse_cache
+    _parse_cache = ParseCache(maxsize)
+    return _parse_cache
+
+
+def disable_parse_cache() -> None:
+    global _parse_cache
+    _parse_cache = None
 
 
 #   ====================
 #   END CUSTOM FUNCTIONS
 #   ====================
 
-def read_lines_from_txt_check_validity(fp: [str, os.PathLike]) -> None:
+
+#   ==================
+#   BEGIN LINE RESULTS
+#   ==================
+
+class LineResult(NamedTuple):
+    """
+    Everything parsing one line produced, see parse_line()
+    Attributes:
+        line: the input string
+        code: 0 if the line is valid, otherwise the ERR_* code of its first error
+        offset: index in line the error was found at, None if valid
+        message: the error message, None if valid
+        tokens: the tokens as a tuple if valid, otherwise None
+        tree: the (compact) parse tree if it was asked for and the line is valid, otherwise None
+    A line going over its Limits is not valid, its code is one of the ERR_*_LIMIT codes.
+    """
+    line: str
+    code: int
+    offset: Optional[int]
+    message: Optional[str]
+    tokens: Optional[tuple]
+    tree: Optional[ParseTree] = None
+
+    @property
+    def valid(self) -> bool:
+        return self.code == 0
+
+    @property
+    def limit_exceeded(self) -> bool:
+        return self.code in _limit_codes
+
+
+def parse_line(s: str, build_tree: bool = False, limits: Optional[Limits] = None) -> LineResult:
+    """
+    parse_tokens() with the result returned instead of printed
+    :param s: the input string
+    :param build_tree: also build the parse tree of s if it is valid
+    :param limits: stop as soon as s goes over one of these, with a result for the limit
+    :return: the result of parsing s
+    """
+    if _profiler is None:
+        return _parsed_line(s, build_tree, limits)
+
+    _profiler.start("line")
+    result = _parsed_line(s, build_tree, limits)
+    _profiler.record_line(s, len(result.tokens) if result.tokens is not None else 0)
+    return result
+
+
+def _parsed_line(s: str, build_tree: bool, limits: Optional[Limits]) -> LineResult:
+    deadline = None if limits is None else limits.deadline()
+    if _parse_cache is not None:
+        result = _parse_cache.parse_line(s, limits, deadline)
+    else:
+        result = _line_result(s, limits, deadline)
+    if not build_tree or result.code != 0:
+        return result
+    if limits is None:
+        return result._replace(tree=build_parse_tree(result.tokens, compact=True))
+
+    try:
+        tree = build_parse_tree(result.tokens, compact=True, limits=limits, deadline=deadline)
+    except LimitExceeded as e:
+        # the tree builders do not know where in s they are, the limit is put at its end
+        (offset, code, message) = _syntax_issue(s, e.issue.code, len(s))
+        return LineResult(s, code, offset, message, None)
+    return result._replace(tree=tree)
+
+
+def _line_result(s: str, limits: Optional[Limits] = None, deadline: Optional[float] = None) -> LineResult:
+    issues = syntax_errors(s, limits=limits, deadline=deadline)
+    if issues:
+        (offset, code, message) = issues[0]
+        return LineResult(s, code, offset, message, None)
+    return LineResult(s, 0, None, None, tuple(tokenize(s).to_list()))
+
+
+def _line_results(lines: List[str], limits: Optional[Limits] = None) -> List[LineResult]:
+    """
+    Worker side of read_lines_from_txt_check_validity(jobs=N)
+    """
+    return [parse_line(l, limits=limits) for l in lines]
+
+
+def _line_results_with_trees(lines: List[str], limits: Optional[Limits] = None) -> List[LineResult]:
+    """
+    Worker side of read_lines_from_txt_output_parse_tree(jobs=N)
+    """
+    return [parse_line(l, build_tree=True, limits=limits) for l in lines]
+
+#   ================
+#   END LINE RESULTS
+#   ================
+
+
+
+
+def _batch_results(lines: Iterator[str], jobs: int, with_tree: bool, store: Optional['parse_store.ParseStore'] = None,
+                   limits: Optional[Limits] = None) -> Iterator[LineResult]:
+    """
+    The parsing shared by the batch functions, see read_lines_from_txt_check_validity()
+    :return: iterator over the result of every line, in order
+    """
+    if jobs > 1:
+        import parallel_parse
+        if store is not None:
+            return parallel_parse.stored_results(store, lines, jobs, with_tree, limits)
+        worker = _line_results_with_trees if with_tree else _line_results
+        if limits is not None:
+            worker = partial(worker, limits=limits)
+        return (result for (_, result) in parallel_parse.map_lines_in_parallel(worker, lines, jobs))
+    if store is not None:
+        return store.results(lines, with_tree, limits)
+    if not with_tree and limits is None:
+        return map(parse_line, lines)
+    return (parse_line(l, with_tree, limits) for l in lines)
+
+
+def read_lines_from_txt_check_validity(fp: [str, os.PathLike], use_mmap: bool = False, jobs: int = 1,
+                                       sink: Optional['result_sinks.ResultSink'] = None,
+                                       store: Optional['parse_store.ParseStore'] = None,
+                                       limits: Optional[Limits] = None) -> None:
     """
     Reads each line from a .txt file, and then
     parses each string  to yield a tokenized list of strings for printing, joined by _ characters
-    In the case of a non-valid line, the corresponding error message is printed (not necessarily within
-    this function, but possibly within the parse_tokens function).
+    In the case of a non-valid line, the corresponding error message is printed.
+    Lines are streamed, so memory use does not depend on the length of the file.
     :param lines: The file path of the lines to parse
+    :param use_mmap: read the file through a memory map, see iter_lines_from_txt
+    :param jobs: number of processes to parse the lines with, the output is the same for any number
+    :param sink: where the result of each line goes, a result_sinks.TextSink printing to the console by default
+    :param store: take the results of lines already in this parse_store.ParseStore from it, and add the others to it
+    :param limits: what each line may use, a line going over them gets a limit error and the run goes on
+    When profiling (see parse_profiler.profiling()), a table of the time spent in each phase is printed at the end.
     """
-    lines = read_lines_from_txt(fp)
-    valid_lines = []
-    for l in lines:
-        # TODO: adding extra brackets for some reason ?
-        tokens = parse_tokens(l)
-        if tokens:
-            valid_lines.append(l)
-            print(f"The tokenized string for input string {l} is {'_'.join(tokens)}")
-    if len(valid_lines) == len(lines):
-        print(f"All lines are valid")
-    else:
-        print(f"{len(valid_lines)} of {len(lines)} lines were correct")
-
-def read_lines_from_txt_output_parse_tree(fp: [str, os.PathLike]) -> None:
+    if sink is None:
+        import result_sinks
+        sink = result_sinks.TextSink()
+    results = _batch_results(iter_lines_from_txt(fp, use_mmap), jobs, False, store, limits)
+
+    line_count = 0
+    valid_count = 0
+    for result in results:
+        line_count += 1
+        valid_count += result.code == 0
+        sink.write(result)
+    sink.summary(line_count, valid_count)
+    sink.flush()
+    if store is not None:
+        store.flush()
+    if _profiler is not None:
+        print(_profiler.report())
+
+def read_lines_from_txt_output_parse_tree(fp: [str, os.PathLike], use_mmap: bool = False, jobs: int = 1,
+                                          sink: Optional['result_sinks.ResultSink'] = None,
+                                          store: Optional['parse_store.ParseStore'] = None,
+                                          limits: Optional[Limits] = None) -> None:
     """
     Reads each line from a .txt file, and then
     parses each string to yield a tokenized output string, to be used in constructing a parse tree. The
-    parse tree should call print_tree() to print its content to the console.
-    In the case of a non-valid line, the corresponding error message is printed (not necessarily within
-    this function, but possibly within the parse_tokens function).
+    parse tree of each valid line is printed to the console, as by print_tree().
+    In the case of a non-valid line, the corresponding error message is printed.
+    Lines are streamed, so memory use does not depend on the length of the file.
     :param fp: The file path of the lines to parse
+    :param use_mmap: read the file through a memory map, see iter_lines_from_txt
+    :param jobs: number of processes to build the trees with, the output is the same for any number
+    :param sink: where the result of each line goes, a result_sinks.TextSink printing the trees to the console
+    by default
+    :param store: take the results (with trees) of lines already in this parse_store.ParseStore from it, and add
+    the others to it
+    :param limits: what each line may use, a line going over them gets a limit error and the run goes on
+    """
+    if sink is None:
+        import result_sinks
+        sink = result_sinks.TextSink(trees=True)
+    results = _batch_results(iter_lines_from_txt(fp, use_mmap), jobs, True, store, limits)
+
+    for result in results:
+        sink.write(result)
+    sink.flush()
+    if store is not None:
+        store.flush()
+
+
+class AlphaClass:
+    """
+    Lines found alpha equivalent by read_lines_from_txt_group_alpha_equivalent()
+    Attributes:
+        representative: the first line of the class
+        first_line: the line number of the representative, counting from 1
+        count: the number of lines in the class
+    """
+    __slots__ = ("representative", "first_line", "count")
+
+    def __init__(self, representative: str, first_line: int):
+        self.representative = representative
+        self.first_line = first_line
+        self.count = 1
+
+
+def _alpha_hashes(lines: List[str]) -> List[Optional[str]]:
+    """
+    Worker side of read_lines_from_txt_group_alpha_equivalent(jobs=N)
+    """
+    return [alpha_hash(l) for l in lines]
+
+
+def read_lines_from_txt_group_alpha_equivalent(fp: [str, os.PathLike], use_mmap: bool = False, jobs: int = 1,
+                                               quiet: bool = False) -> dict:
     """
-    lines = read_lines_from_txt(fp)
-    for l in lines:
-        tokens = parse_tokens(l)
-        if tokens:
-            print("\n")
-            parse_tree2 = build_parse_tree(tokens)
-            parse_tree2.print_tree()
+    Reads each line from a .txt file and groups the valid ones into classes of alpha
+    equivalent expressions (equal up to the names of bound variables, see alpha_hash).
+    Lines are streamed and only one line per class is kept, so memory use grows with
+    the number of classes rather than the length of the file.
+    Every class of more than one line is printed, followed by a summary.
+    :param fp: The file path of the lines to group
+    :param use_mmap: read the file through a memory map, see iter_lines_from_txt
+    :param jobs: number of processes to hash the lines with, the classes are the same for any number
+    :param quiet: do not print anything
+    :return: the AlphaClass of every hash, in the order the classes were first seen
+    """
+    lines = iter_lines_from_txt(fp, use_mmap)
+    if jobs > 1:
+        import parallel_parse
+        hashed = parallel_parse.map_lines_in_parallel(_alpha_hashes, lines, jobs)
+    else:
+        hashed = ((l, alpha_hash(l)) for l in lines)
+
+    classes = {}
+    line_count = 0
+    invalid_count = 0
+    for (l, key) in hashed:
+        line_count += 1
+        if key is None:
+            invalid_count += 1
+            continue
+        alpha_class = classes.get(key)
+        if alpha_class is None:
+            classes[key] = AlphaClass(l, line_count)
+        else:
+            alpha_class.count += 1
+
+    if not quiet:
+        out = []
+        for alpha_class in classes.values():
+            if alpha_class.count > 1:
+                out.append(f"{alpha_class.count} lines are alpha equivalent to line {alpha_class.first_line}: "
+                           f"{alpha_class.representative}\n")
+        out.append(f"{line_count - invalid_count} valid lines in {len(classes)} classes, "
+                   f"{invalid_count} invalid lines\n")
+        sys.stdout.write("".join(out))
+    return classes
 
 
-def add_associativity(s_: List[str], association_type: str = "left") -> List[str]:
+def add_associativity(s_: List[str], association_type: str = "left", minimal: bool = False) -> List[str]:
     """
+    Brackets the applications of an already tokenized expression, working on the tokens
+    directly (the expression is not joined back into a string or validated again).
     :param s_: A list of string tokens
     :param association_type: a string in [`left`, `right`]
-    :return: List of strings, with added parenthesis that disambiguates the original expression
+    :param minimal: instead of bracketing every application, keep only the brackets needed
+    to read the expression the same way under association_type, see emit_minimal_tokens
+    :return: List of strings, with added parenthesis that disambiguates the original expression,
+    or False (after printing the error) if the tokens do not form an expression
     """
+    buf = buffer_from_tokens(s_)
+    try:
+        term = parse_token_buffer(buf)
+    except ValueError as e:
+        print(e)
+        return False
 
-    # TODO Optional
-    s = s_[:]  # Don't modify original string
-    
-    if association_type == "right":
-        s = s[::-1]
-        s = " ".join(s)
-    else:
-        s = " ".join(s)
-    
-    return parse_tokens(s, association_type)
+    if minimal:
+        return emit_minimal_tokens(term, buf, association_type)
+    return emit_tokens(term, buf, association_type)
+
+
+
+
+# the kinds of parse tree nodes, see _child_spans()
+_NODE_LEAF = 0   # a single token, or the inside of a bracket pair holding a single token
+_NODE_GROUP = 1  # '(' <expr> ')'
+_NODE_SEQ = 2    # a sequence of operands: the whole input, the inside of brackets, or a lambda
+
+
+class BracketIndex:
+    """
+    Bracket structure of a list of tokens, built once in linear time so that the
+    matching bracket and nesting depth of any token are O(1) lookups. The depths of
+    the tokens are only worked out the first time they are used.
+    Attributes:
+        tokens: the tokens indexed
+        partners: for every bracket the index of the bracket it pairs with, -1 for other tokens
+        max_depth: the deepest nesting of brackets
+    """
+    __slots__ = ("tokens", "partners", "max_depth", "_depths")
+
+    def __init__(self, tokens: Sequence[str]):
+        """
+        :param tokens: a list of tokens with balanced brackets
+        :raises ValueError: if the brackets are not balanced
+        """
+        self.tokens = tokens
+        self.partners = partners = array("l", [-1]) * len(tokens)
+        self._depths = None
+        max_depth = 0
+        opened = []
+        for idx, token in enumerate(tokens):
+            if token == "(":
+                opened.append(idx)
+                if len(opened) > max_depth:
+                    max_depth = len(opened)
+            elif token == ")":
+                if not opened:
+                    raise ValueError("SYNTAX ERROR: brackets are mismatched.")
+                open_idx = opened.pop()
+                partners[open_idx] = idx
+                partners[idx] = open_idx
+        if opened:
+            raise ValueError("SYNTAX ERROR: brackets are mismatched.")
+        self.max_depth = max_depth
+
+    @property
+    def depths(self) -> array:
+        """ the number of bracket pairs around every token, a bracket's own pair not included """
+        if self._depths is None:
+            self._depths = depths = array("l", [0]) * len(self.tokens)
+            depth = 0
+            for (idx, token) in enumerate(self.tokens):
+                if token == ")":
+                    depth -= 1
+                depths[idx] = depth
+                if token == "(":
+                    depth += 1
+        return self._depths
+
+    def operand_starts(self, start: int = 0, end: Optional[int] = None) -> List[int]:
+        """
+        The top level application boundaries of tokens[start:end], which must be a
+        whole expression: where each operand starts, jumping over bracket groups. A
+        lambda takes in everything up to end, so it is always the last operand.
+        Example: a (b c) \\x x y -> [0, 1, 5]
+        :return: the index of the first token of every operand, in order
+        """
+        if end is None:
+            end = len(self.tokens)
+        tokens = self.tokens
+        partners = self.partners
+        starts = []
+        idx = start
+        while idx < end:
+            starts.append(idx)
+            token = tokens[idx]
+            if token == "(":
+                idx = partners[idx] + 1
+            elif token == "\\":
+                break
+            else:
+                idx += 1
+        return starts
 
 
+def _child_spans(tokens: List[str], partners: Sequence[int], kind: int, start: int, end: int) -> List[tuple]:
+    """
+    Works out the children of the node for tokens[start:end] without looking
+    further than the node's own operands.
+    A bracket group has the children '(', its inside, ')'. A sequence has one child per
+    operand, except that a lambda starting the sequence is split into '\\', the
+    variable and then the operands of its body, and a lambda further along becomes a
+    single child holding everything up to the end of the sequence.
+    :param tokens: all the tokens of the tree
+    :param partners: the matching bracket of every bracket, see BracketIndex.partners
+    :param kind: the kind of the node, _NODE_GROUP or _NODE_SEQ
+    :return: a list of (kind, start, end) for each child
+    """
+    if kind == _NODE_GROUP:
+        inner_kind = _NODE_SEQ if end - start > 3 else _NODE_LEAF
+        return [(_NODE_LEAF, start, start + 1), (inner_kind, start + 1, end - 1), (_NODE_LEAF, end - 1, end)]
+
+    spans = []
+    idx = start
+    while idx < end:
+        token = tokens[idx]
+        if token == "\\":
+            if idx != start:
+                spans.append((_NODE_SEQ, idx, end))
+                break
+            spans.append((_NODE_LEAF, idx, idx + 1))
+            spans.append((_NODE_LEAF, idx + 1, idx + 2))
+            idx += 2
+        elif token == "(":
+            close_idx = partners[idx] + 1
+            spans.append((_NODE_GROUP, idx, close_idx))
+            idx = close_idx
+        else:
+            spans.append((_NODE_LEAF, idx, idx + 1))
+            idx += 1
+    return spans
 
 
-def build_parse_tree_rec(tokens: List[str], node: Optional[Node] = None) -> Node:
+def build_parse_tree_rec(tokens: List[str], node: Optional[Node] = None, limits: Optional[Limits] = None,
+                         deadline: Optional[float] = None) -> Node:
     """
 
     Example Input: ["\\", "x", "(", "x", "za", ")"]
@@ -458,135 +1768,388 @@ def build_parse_tree_rec(tokens: List[str], node: Optional[Node] = None) -> Node
     ------------x
     ------------za
     --------)
-    An inner recursive inner function to build a parse tree
+    Builds the tree under node with an explicit stack of the nodes still to expand
+    rather than recursion, so the nesting depth is only limited by memory.
+    Every node gets a copy of its tokens, so the time and memory grow with the square
+    of the nesting depth; build_parse_tree(tokens, compact=True) is linear.
     :param tokens: A list of token strings
     :param node: A Node object
+    :param limits: stop with LimitExceeded if the tokens go over the depth limit, or once the
+    tree goes over the node or time limit
+    :param deadline: process_time() at which the time limit runs out
     :return: a node with children whose tokens are variables, parenthesis, slashes, or the inner part of an expression
     """
     if node is None: 
         node = Node(tokens[:]) # Create root node
 
-    isInnerExpression = False
-
-    while tokens:
-
-        token = tokens.pop(0)
-
-        if isInnerExpression and token == '\\':  # in case of '\' <var> <expr> sub expression
-          
-            if is_valid_var_name(tokens[1])[0]: 
-                innerExprTokens = [token, tokens.pop(0), tokens.pop(0)] # Getting '\' <var> <var>
-                innerExprNode = Node(innerExprTokens[:])
-                node.add_child_node(innerExprNode)
-                build_parse_tree_rec(innerExprTokens, innerExprNode)
-
-                
+    brackets = BracketIndex(tokens)
+    if limits is not None:
+        _check_tree_depth(brackets, limits)
+    _expand_tree(node, tokens, brackets.partners, _NODE_SEQ, 0, len(tokens), limits, deadline)
+    return node
 
-            elif tokens[1] == "\\":
-                innerExprTokens = [token]
-                while True:
-                    innerExprTokens.append(tokens.pop(0)) #To capture an expr that looks like '\' 'x' '\' 'y' '\' 'z'...
-                    innerExprTokens.append(tokens.pop(0))
-                    innerExprTokens.append(tokens.pop(0))
-                    token = tokens.pop(0)
 
-                    if token == '\\' and tokens[1] == '\\': 
-                        innerExprTokens.append(token)
-                        continue
+def _expand_tree(node: Node, tokens: List[str], partners: Sequence[int], kind: int, start: int, end: int,
+                 limits: Optional[Limits] = None, deadline: Optional[float] = None, views: bool = False) -> None:
+    """
+    Adds the whole subtree below node, which stands for tokens[start:end] and is of the given kind
+    :param views: label the nodes with TokenSlice views of tokens instead of copies of their tokens
+    :raises LimitExceeded: if limits are given and the subtree goes over the node or time limit
+    """
+    node_count = 1
+    stack = [(node, kind, start, end)]
+    while stack:
+        (parent, kind, start, end) = stack.pop()
+        spans = _child_spans(tokens, partners, kind, start, end)
+        if limits is not None:
+            node_count += len(spans)
+            _check_tree_limits(node_count, len(spans), limits, deadline)
+        for (child_kind, child_start, child_end) in spans:
+            child = Node(TokenSlice(tokens, child_start, child_end) if views else tokens[child_start:child_end])
+            parent.add_child_node(child)
+            if child_kind != _NODE_LEAF:
+                stack.append((child, child_kind, child_start, child_end))
 
-                    elif token == '\\' and not tokens[1] == '\\': 
-                        innerExprTokens.append(token)
-                        innerExprTokens.append(tokens.pop(0))
-                        token = tokens.pop(0)
-                        innerExprTokens.append(token)
-                        break
+#<expr> ::= <var> | '(' <expr> ')' | '\' <var> <expr> | <expr> <expr> 
 
-                    else: 
-                        innerExprTokens.append(token)
-                        break
 
-                if token == '(': 
-                    closingBracketIndex = findClosingBracket(tokens)
-                    innerExprTokens += tokens[:closingBracketIndex + 1]
-                    tokens = tokens[closingBracketIndex + 1:]
+def _check_tree_depth(brackets: BracketIndex, limits: Limits) -> None:
+    """
+    Called by the tree builders before they start. The depth of the tokens counts their
+    brackets (a dot being one), not lambdas, so it is never more than the depth
+    syntax_errors() checks, and a line that passed it also passes this.
+    """
+    if limits.max_depth is not None and brackets.max_depth > limits.max_depth:
+        raise LimitExceeded(SyntaxIssue(0, ERR_DEPTH_LIMIT, _error_messages[ERR_DEPTH_LIMIT].format(idx=0)))
 
-                innerExprNode = Node(innerExprTokens[:])
-                node.add_child_node(innerExprNode)
-                build_parse_tree_rec(innerExprTokens, innerExprNode)
 
+def _check_tree_limits(node_count: int, added: int, limits: Limits, deadline: Optional[float]) -> None:
+    """
+    Called by the tree builders each time they add the children of a node. The clock is
+    only read when node_count passes a multiple of _CLOCK_INTERVAL, like _limited_lexemes() does.
+    :param node_count: number of nodes built so far
+    :param added: how many of them were just added
+    """
+    if limits.max_nodes is not None and node_count > limits.max_nodes:
+        raise LimitExceeded(SyntaxIssue(0, ERR_NODE_LIMIT, _error_messages[ERR_NODE_LIMIT]))
+    if (deadline is not None and (node_count - added) // _CLOCK_INTERVAL != node_count // _CLOCK_INTERVAL
+            and process_time() > deadline):
+        raise LimitExceeded(SyntaxIssue(0, ERR_TIME_LIMIT, _error_messages[ERR_TIME_LIMIT].format(idx=0)))
 
 
+def build_compact_parse_tree(tokens: List[str], limits: Optional[Limits] = None,
+                             deadline: Optional[float] = None) -> CompactParseTree:
+    """
+    Builds the same tree as build_parse_tree_rec() into a CompactParseTree, the
+    nodes refer to ranges of tokens instead of holding copies of them
+    :param tokens: List of tokens, kept (not copied) by the tree
+    :param limits: stop with LimitExceeded if the tokens go over the depth limit, or once the
+    tree goes over the node or time limit
+    :param deadline: process_time() at which the time limit runs out
+    :return: the parse tree
+    """
+    tree = CompactParseTree(tokens)
+    tree.add_node(_NODE_SEQ, 0, len(tokens))
+    first_child = tree.first_child
+    next_sibling = tree.next_sibling
+
+    brackets = BracketIndex(tokens)
+    if limits is not None:
+        _check_tree_depth(brackets, limits)
+    partners = brackets.partners
+    stack = [(0, _NODE_SEQ, 0, len(tokens))]
+    while stack:
+        (parent, kind, start, end) = stack.pop()
+        spans = _child_spans(tokens, partners, kind, start, end)
+        if limits is not None:
+            _check_tree_limits(len(first_child) + len(spans), len(spans), limits, deadline)
+        prev = -1
+        for (child_kind, child_start, child_end) in spans:
+            child = tree.add_node(child_kind, child_start, child_end)
+            if prev == -1:
+                first_child[parent] = child
             else:
-                closingBracketIndex = findClosingBracket(tokens[2:]) + 2
-                innerExprTokens = [token] + tokens[:closingBracketIndex + 1] # \ <var> '(' <expr> ')'
-                innerExprNode = Node(innerExprTokens[:])
+                next_sibling[prev] = child
+            prev = child
+            if child_kind != _NODE_LEAF:
+                stack.append((child, child_kind, child_start, child_end))
 
-                node.add_child_node(innerExprNode)
+    return tree
 
-                tokens = tokens[closingBracketIndex + 1:]  # removeing the inner expression we're about to parse
 
-                build_parse_tree_rec(innerExprTokens, innerExprNode) # building parse tree on \ <var> '(' <expr> ')' treeting it as an <expr>
+def build_shared_parse_tree(tokens: List[str], table: Optional[HashConsTable] = None,
+                            limits: Optional[Limits] = None, deadline: Optional[float] = None) -> ParseTree:
+    """
+    Builds the same tree as build_parse_tree_rec() bottom up, interning every subtree
+    in table so that repeated subtrees are one shared SharedNode (the tree is a DAG)
+    :param tokens: List of tokens
+    :param table: where to intern the nodes, a new table by default
+    :param limits: stop with LimitExceeded if the tokens go over the depth limit, or once the
+    tree goes over the node or time limit, counting the nodes of the tree rather than the shared ones
+    :param deadline: process_time() at which the time limit runs out
+    :return: parse tree
+    """
+    if table is None:
+        table = HashConsTable()
+    brackets = BracketIndex(tokens)
+    if limits is not None:
+        _check_tree_depth(brackets, limits)
+    partners = brackets.partners
+
+    # post-order walk: a node is interned once all of its children are, the
+    # children waiting for their parent are kept on built
+    built = []
+    node_count = 1
+    stack = [(_NODE_SEQ, 0, len(tokens), -1)]
+    while stack:
+        (kind, start, end, child_count) = stack.pop()
+        if kind == _NODE_LEAF:
+            built.append(table.leaf(tokens[start]))
+        elif child_count >= 0:
+            children = tuple(built[len(built) - child_count:])
+            del built[len(built) - child_count:]
+            built.append(table.node(children))
+        else:
+            spans = _child_spans(tokens, partners, kind, start, end)
+            if limits is not None:
+                node_count += len(spans)
+                _check_tree_limits(node_count, len(spans), limits, deadline)
+            stack.append((kind, start, end, len(spans)))
+            stack.extend((child_kind, child_start, child_end, -1)
+                         for (child_kind, child_start, child_end) in reversed(spans))
 
+    return ParseTree(built[0])
 
 
-        elif token == "(": 
+def build_parse_tree(tokens: List[str], compact: bool = False, shared: bool = False, lazy: bool = False,
+                     limits: Optional[Limits] = None, deadline: Optional[float] = None, jobs: int = 1) -> ParseTree:
+    """
+    Build a parse tree from a list of tokens
+    :param tokens: List of tokens
+    :param compact: build a CompactParseTree, which shares tokens instead of copying them into every node,
+    in time linear in the number of tokens also on deeply nested ones
+    :param shared: build a tree of SharedNode, where repeated subtrees are only built once
+    :param lazy: build a LazyParseTree, whose nodes only build their children when first asked for
+    :param limits: stop with LimitExceeded if the tokens are nested deeper than the depth limit
+    (see _check_tree_depth), or once the tree goes over the node or time limit. Not checked for
+    lazy trees.
+    :param deadline: process_time() at which the time limit runs out, by default limits.max_seconds from now
+    :param jobs: build the subtrees of the top level operands of a long compact tree without
+    limits in this many processes, the tree is the same for any number
+    :return: parse tree
+    """
+    if _profiler is not None:
+        start = _profiler.start("build_tree")
+    if limits is not None and deadline is None:
+        deadline = limits.deadline()
+    if lazy:
+        pt = LazyParseTree(tokens)
+    elif compact and jobs > 1 and limits is None:
+        import parallel_parse
+        pt = parallel_parse.build_compact_parse_tree(tokens, jobs)
+    elif compact:
+        pt = build_compact_parse_tree(tokens, limits, deadline)
+    elif shared:
+        pt = build_shared_parse_tree(tokens, None, limits, deadline)
+    else:
+        pt = ParseTree(build_parse_tree_rec(tokens, None, limits, deadline))
 
-            closingBracketIndex = findClosingBracket(tokens)
+    if _profiler is not None:
+        _profiler.record("build_tree", perf_counter() - start, tokens=len(tokens))
+    return pt
 
-            innerExprTokens = [token] + tokens[:closingBracketIndex + 1] # getting '(' <expr> ')'
 
-            innerExprNode = Node(innerExprTokens)
-            node.add_child_node(innerExprNode)
+#   ==========================
+#   BEGIN INCREMENTAL PARSING
+#   ==========================
 
-            innerExprNode.add_child_node(Node(["("]))
+class ParsedExpression:
+    """
+    An expression parsed by parse_expression(), which reparse() can update after an edit
+    Attributes:
+        source: the input string
+        issues: the syntax errors in source, see syntax_errors()
+        buffer: the TokenBuffer of source, None if it is not valid
+        tokens: the tokens of source as parse_tokens() returns them, None if it is not valid
+        tree: the parse tree of the tokens, None if it is not valid. Its nodes are labelled with
+        TokenSlice views, so the nodes an edit rebuilds do not copy their tokens.
+    """
+    def __init__(self, source: str, issues: List[SyntaxIssue], buffer: Optional[TokenBuffer] = None,
+                 tokens: Optional[List[str]] = None, tree: Optional[ParseTree] = None):
+        self.source = source
+        self.issues = issues
+        self.buffer = buffer
+        self.tokens = tokens
+        self.tree = tree
 
-            innerInnerExprNode = Node(innerExprTokens[1:-1])
-            innerExprNode.add_child_node(innerInnerExprNode)
+    @property
+    def valid(self) -> bool:
+        return not self.issues
 
-            innerExprNode.add_child_node(Node([")"]))
 
-           
-            if not len(innerInnerExprNode.elem) == 1:  # if the subexpression node contains just a var, stop exploring
-                build_parse_tree_rec(tokens[:closingBracketIndex], innerInnerExprNode) #Evaluates expr in '('<expr>')'
-            
-            tokens = tokens[closingBracketIndex + 1:] # remove tokens we've parsed
+def parse_expression(s: str) -> ParsedExpression:
+    """
+    :param s: the input string
+    :return: the tokens and parse tree of s, or its syntax errors
+    """
+    issues = syntax_errors(s, all_errors=True)
+    if issues:
+        return ParsedExpression(s, issues)
 
-        else: 
-            node.add_child_node(Node([token]))
+    buf = tokenize(s)
+    tokens = buf.to_list()
+    return ParsedExpression(s, issues, buf, tokens, ParseTree(_view_tree(tokens, _NODE_SEQ)))
 
-        isInnerExpression = True
 
+def _view_tree(tokens: List[str], kind: int) -> Node:
+    """
+    :param tokens: a whole expression, or with kind _NODE_GROUP a bracket group
+    :return: the root of the parse tree of tokens, with every node labelled by a TokenSlice view of tokens
+    """
+    node = Node(TokenSlice(tokens, 0, len(tokens)))
+    _expand_tree(node, tokens, BracketIndex(tokens).partners, kind, 0, len(tokens), views=True)
     return node
 
-#<expr> ::= <var> | '(' <expr> ')' | '\' <var> <expr> | <expr> <expr> 
-
-
-def findClosingBracket(tokens: List[str]) -> int:
 
-    stack = ["("] # THIS IS IMPORTANT: since the first "(" will have been popped when we call this function
+def _token_end(buf: TokenBuffer, idx: int) -> int:
+    """ :return: the offset in the source just after token idx """
+    if buf.kinds[idx] == TOK_VAR:
+        return buf.offsets[idx] + len(buf.names[buf.ids[idx]])
+    return buf.offsets[idx] + 1
 
-    for index, token in enumerate(tokens):
-        if token == "(": 
-            stack.append(index)
 
-        elif token == ")": 
-            if stack:
-                stack.pop()
-                if not stack: # If stack is now empty, we've found corresponding closed bracket
-                    return index
-    return -1 # Closing bracket does not exist
-
-def build_parse_tree(tokens: List[str]) -> ParseTree:
+def _find_damaged_group(prev: ParsedExpression, offset: int, edit_end: int) -> Optional[tuple]:
     """
-    Build a parse tree from a list of tokens
-    :param tokens: List of tokens
-    :return: parse tree
+    Walks down the tree of prev towards the edit, visiting only the nodes on the way
+    and their siblings.
+    :return: (the path to the innermost bracket pair that strictly contains the edit, as
+    (node, index of its first token, index of the child taken) steps, index of its first token),
+    or None if the edit is not inside any bracket pair
     """
-    pt = ParseTree(build_parse_tree_rec(tokens))
-    return pt
-
-
-if __name__ == "__main__":
+    buf = prev.buffer
+    source = prev.source
+    offsets = buf.offsets
+
+    path = []
+    # the length of the path to the innermost pair found so far, and its first token
+    found = None
+    node = prev.tree.root
+    node_start = 0
+    while True:
+        child_start = node_start
+        for (child_idx, child) in enumerate(node.children):
+            if offsets[child_start] > offset:
+                child = None
+                break
+            child_end = child_start + len(child.elem)
+            if edit_end <= _token_end(buf, child_end - 1):
+                break
+            child_start = child_end
+        else:
+            child = None
+        if child is None:
+            return None if found is None else (path[:found[0]], found[1])
+
+        path.append((node, node_start, child_idx))
+        open_offset = offsets[child_start]
+        # brackets written as a dot have their '(' at the '.' and their ')' may be at the end
+        # of the source, only real brackets are used
+        if (buf.kinds[child_start] == TOK_OPEN and source[open_offset] == "("
+                and open_offset < offset and edit_end <= offsets[child_end - 1]
+                and len(child.children[0].elem) == 1):
+            found = (len(path), child_start)
+        node = child
+        node_start = child_start
+
+
+def reparse(prev: ParsedExpression, offset: int, deleted: int, inserted: str) -> ParsedExpression:
+    """
+    Applies an edit to a parsed expression, re-lexing and re-parsing only the inside of the
+    innermost pair of brackets around the edit. Every subtree of the previous tree outside
+    that pair is reused, and only the nodes on the path from the root to it are rebuilt,
+    each as a view of the new tokens, so the work done grows with the size of that pair and
+    the nodes on the path rather than with the tokens above it. The token list and arrays
+    of the new expression are still copied once, and the offsets of the tokens after the
+    edit shifted, so an edit also costs a pass over the whole token arrays.
+    Falls back to parsing the whole new string if the edit is not inside brackets, or if
+    either the previous or the new expression is not valid.
+    The previous expression is left unchanged.
+    :param prev: the expression before the edit
+    :param offset: where in prev.source the edit starts
+    :param deleted: the number of characters removed at offset
+    :param inserted: the text inserted at offset
+    :return: the expression after the edit
+    """
+    source = prev.source
+    edit_end = offset + deleted
+    if not 0 <= offset <= edit_end <= len(source):
+        raise ValueError("edit is outside of the expression")
+    new_source = source[:offset] + inserted + source[edit_end:]
+    if not prev.valid:
+        return parse_expression(new_source)
+
+    damaged = _find_damaged_group(prev, offset, edit_end)
+    if damaged is None:
+        return parse_expression(new_source)
+    (path, group_start) = damaged
+    (parent, _, child_idx) = path[-1]
+    group_end = group_start + len(parent.children[child_idx].elem)
+
+    buf = prev.buffer
+    shift = len(inserted) - deleted
+    open_offset = buf.offsets[group_start]
+    inner_source = new_source[open_offset + 1:buf.offsets[group_end - 1] + shift]
+    if syntax_errors(inner_source):
+        return parse_expression(new_source)  # for the errors of the whole string
+    inner = tokenize(inner_source)
+
+    # splice the new tokens in between the unchanged brackets
+    new_buf = TokenBuffer(new_source)
+    new_buf.names = list(buf.names)
+    name_ids = {name: name_id for (name_id, name) in enumerate(buf.names) if name_id >= TOK_VAR}
+    inner_ids = array("l")
+    for name_id in inner.ids:
+        if name_id < TOK_VAR:
+            inner_ids.append(name_id)
+            continue
+        name = inner.names[name_id]
+        new_id = name_ids.get(name)
+        if new_id is None:
+            new_id = name_ids[name] = len(new_buf.names)
+            new_buf.names.append(name)
+        inner_ids.append(new_id)
+    new_buf.kinds = buf.kinds[:group_start + 1] + inner.kinds + buf.kinds[group_end - 1:]
+    new_buf.ids = buf.ids[:group_start + 1] + inner_ids + buf.ids[group_end - 1:]
+    new_buf.offsets = (buf.offsets[:group_start + 1]
+                       + array("q", map((open_offset + 1).__add__, inner.offsets))
+                       + array("q", map(shift.__add__, buf.offsets[group_end - 1:])))
+    tokens = prev.tokens[:group_start + 1] + inner.to_list() + prev.tokens[group_end - 1:]
+    token_shift = len(inner) - (group_end - group_start - 2)
+
+    # a fresh subtree for the bracket pair, then new nodes above it, each a view of the
+    # new tokens ending token_shift further than the node it replaces
+    node = _view_tree(tokens[group_start:group_end + token_shift], _NODE_GROUP)
+    for (old_parent, parent_start, child_idx) in reversed(path):
+        new_parent = Node(TokenSlice(tokens, parent_start, parent_start + len(old_parent.elem) + token_shift))
+        new_parent.children = old_parent.children[:]
+        new_parent.children[child_idx] = node
+        node = new_parent
+
+    return ParsedExpression(new_source, [], new_buf, tokens, ParseTree(node))
+
+#   ========================
+#   END INCREMENTAL PARSING
+#   ========================
+
+
+
+
+def demo() -> None:
+    """
+    Checks and prints the trees of the example files, with the parse cache on so
+    the lines parsed for the validity check are not parsed again for the trees
+    """
+    enable_parse_cache()
 
 #   ===========================
 #   BEGIN TESTING OF PARSE TREE
@@ -627,4 +2190,9 @@ if __name__ == "__main__":
     print(associated_sample_r)
     print("Left association")
     associated_sample_l = add_associativity(sample, association_type="left")
-    print(associated_sample_l)
\ No newline at end of file
+    print(associated_sample_l)
+    disable_parse_cache()
+
+
+if __name__ == "__main__":
+    demo()
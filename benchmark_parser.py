@@ -0,0 +1,284 @@
+"""
+Benchmarks and complexity checks for the A1 parsing pipeline.
+
+Generates expressions of growing size along one dimension at a time (nesting
+depth, application width, lambda chain length, variable name length), times each
+phase of the pipeline on them, measures peak memory, and fits the growth exponent
+of the run time against the size. A phase growing faster than expected (say, a
+linear phase turning quadratic) is timed again, and fails the run if it still does.
+
+Usage: python benchmark_parser.py [--sizes 250 500 1000 2000] [--output bench_results.json]
+"""
+import argparse
+import contextlib
+import gc
+import json
+import math
+import platform
+import re
+import subprocess
+import sys
+import time
+import tracemalloc
+from typing import Callable, Dict, List
+
+import A1
+
+
+def nested_expr(depth: int) -> str:
+    """ (((a b))) with depth pairs of brackets """
+    return "(" * depth + "a b" + ")" * depth
+
+
+def wide_expr(width: int) -> str:
+    """ (a) (b) (\\x(x b)) ... with width operands applied to each other """
+    operands = ["(a)", "(b)", "(\\x(x b))", "c"]
+    return " ".join(operands[idx % len(operands)] for idx in range(width))
+
+
+def lambda_chain_expr(length: int) -> str:
+    """ \\x0.\\x1. ... x0 x1 with length lambdas """
+    return "".join(f"\\x{idx}." for idx in range(length)) + "x0 x1"
+
+
+def long_name_expr(length: int) -> str:
+    """ \\v.v w with variable names length characters long """
+    name = "v" * length
+    return f"\\{name}.{name} w"
+
+
+SHAPES: Dict[str, Callable[[int], str]] = {
+    "nesting": nested_expr,
+    "application": wide_expr,
+    "lambda_chain": lambda_chain_expr,
+    "name_length": long_name_expr,
+}
+
+
+class _NullWriter:
+    """ stdout replacement that drops everything, so print_tree is timed without the terminal """
+    def write(self, s: str) -> int:
+        return len(s)
+
+    def flush(self) -> None:
+        pass
+
+
+def _print_tree(tree: A1.ParseTree) -> None:
+    with contextlib.redirect_stdout(_NullWriter()):
+        tree.print_tree()
+
+
+# a variable right after a '(', where an edit leaves reparse() a bracket pair to work in
+_edit_re = re.compile(r"\(([A-Za-z])")
+
+
+def _edit_offset(s: str) -> int:
+    """
+    :return: where to edit one letter of s: the first variable after the middle of s that
+    directly follows a '(', so on deep inputs the innermost pair and on wide ones an operand
+    near the middle, or the first letter of s if it has no such variable
+    """
+    m = _edit_re.search(s, len(s) // 2) or _edit_re.search(s)
+    if m is not None:
+        return m.start(1)
+    return next(idx for (idx, char) in enumerate(s) if char.isalpha())
+
+
+def _phases(s: str) -> Dict[str, Callable[[], object]]:
+    """
+    :return: a function running each phase on s, with the earlier phases it needs already done
+    """
+    tokens = A1.parse_tokens(s)
+    tree = A1.build_parse_tree(tokens)
+    parsed = A1.parse_expression(s)
+    edit = _edit_offset(s)
+    return {
+        "valid_syntax": lambda: A1.valid_syntax(s),
+        "parse_tokens": lambda: A1.parse_tokens(s),
+        "parse_tokens[left]": lambda: A1.parse_tokens(s, "left"),
+        "parse_tokens[right]": lambda: A1.parse_tokens(s, "right"),
+        "add_associativity[left]": lambda: A1.add_associativity(tokens, "left"),
+        "add_associativity[minimal]": lambda: A1.add_associativity(tokens, "left", minimal=True),
+        "build_parse_tree": lambda: A1.build_parse_tree(tokens),
+        "build_parse_tree[compact]": lambda: A1.build_parse_tree(tokens, compact=True),
+        "build_parse_tree[lazy]": lambda: A1.build_parse_tree(tokens, lazy=True).root.children,
+        "print_tree": lambda: _print_tree(tree),
+        # an edit of one letter, against parsing the whole string again
+        "parse_expression": lambda: A1.parse_expression(s),
+        "reparse": lambda: A1.reparse(parsed, edit, 1, "z"),
+    }
+
+
+# Every node of a Node tree holds a copy of its tokens and print_tree prints them all,
+# so on deep inputs their output itself grows with the square of the depth.
+EXPECTED_EXPONENTS = {
+    ("nesting", "build_parse_tree"): 2.0,
+    ("nesting", "print_tree"): 2.0,
+    ("lambda_chain", "build_parse_tree"): 2.0,
+    ("lambda_chain", "print_tree"): 2.0,
+}
+
+
+# the largest size must be at least this many times the smallest, over a narrower range
+# a few percent of timing noise is enough to move the fitted exponent past the tolerance
+MIN_SIZE_SPREAD = 4
+
+
+def time_phase(run: Callable[[], object], repeat: int, min_time: float) -> float:
+    """
+    :return: the best time of one call to run, over repeat rounds of at least min_time seconds each
+    """
+    best = math.inf
+    # like timeit, keep the cyclic garbage collector from adding pauses that grow with the heap
+    gc.collect()
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            calls = 0
+            start = time.perf_counter()
+            while True:
+                run()
+                calls += 1
+                elapsed = time.perf_counter() - start
+                if elapsed >= min_time:
+                    break
+            best = min(best, elapsed / calls)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    return best
+
+
+def peak_memory(run: Callable[[], object]) -> int:
+    """
+    :return: the most memory allocated at once during one call to run, in bytes
+    """
+    tracemalloc.start()
+    try:
+        result = run()
+        (_, peak) = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak
+
+
+def growth_exponent(sizes: List[int], seconds: List[float]) -> float:
+    """
+    Least squares slope of log(seconds) against log(size), so about 1 for linear
+    and about 2 for quadratic growth
+    """
+    xs = [math.log(size) for size in sizes]
+    ys = [math.log(max(sec, 1e-9)) for sec in seconds]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var_x = sum((x - mean_x) ** 2 for x in xs)
+    if var_x == 0:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for (x, y) in zip(xs, ys)) / var_x
+
+
+def run_benchmarks(sizes: List[int], repeat: int = 3, min_time: float = 0.05,
+                   tolerance: float = 0.35, shapes: List[str] = None) -> dict:
+    """
+    :param sizes: values of the varied dimension, the largest at least MIN_SIZE_SPREAD times the smallest
+    :param tolerance: how far above its expected exponent a phase may grow before it fails
+    :param shapes: names from SHAPES to run, all of them by default
+    :return: the results, as saved to the JSON file
+    :raises ValueError: if the sizes are too close together to fit an exponent
+    """
+    if len(sizes) < 2 or max(sizes) < MIN_SIZE_SPREAD * min(sizes):
+        raise ValueError(f"the largest size must be at least {MIN_SIZE_SPREAD} times the smallest")
+    A1.disable_parse_cache()
+    results = []
+    for shape in shapes or SHAPES:
+        make_expr = SHAPES[shape]
+        measurements = {}
+        runs = {}
+        for size in sizes:
+            s = make_expr(size)
+            runs[size] = _phases(s)
+            for (phase, run) in runs[size].items():
+                seconds = time_phase(run, repeat, min_time)
+                entry = measurements.setdefault(phase, {"sizes": [], "chars": [], "seconds": [],
+                                                        "chars_per_second": [], "peak_bytes": []})
+                entry["sizes"].append(size)
+                entry["chars"].append(len(s))
+                entry["seconds"].append(seconds)
+                entry["chars_per_second"].append(len(s) / seconds)
+                entry["peak_bytes"].append(peak_memory(run))
+
+        for (phase, entry) in measurements.items():
+            exponent = growth_exponent(entry["sizes"], entry["seconds"])
+            expected = EXPECTED_EXPONENTS.get((shape, phase), 1.0)
+            rechecked = exponent > expected + tolerance
+            if rechecked:
+                # one slow round (another process, a CPU frequency change) can be enough to fail,
+                # so time every size again and only fail if the best times still grow too fast
+                entry["seconds"] = [min(seconds, time_phase(runs[size][phase], repeat, min_time))
+                                    for (size, seconds) in zip(entry["sizes"], entry["seconds"])]
+                entry["chars_per_second"] = [chars / seconds
+                                             for (chars, seconds) in zip(entry["chars"], entry["seconds"])]
+                exponent = growth_exponent(entry["sizes"], entry["seconds"])
+            results.append(dict(shape=shape, phase=phase, exponent=exponent, expected_exponent=expected,
+                                ok=exponent <= expected + tolerance, rechecked=rechecked, **entry))
+
+    return {
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "commit": _git_commit(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "sizes": sizes,
+        "tolerance": tolerance,
+        "results": results,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the A1 parser and check how each phase scales.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[250, 500, 1000, 2000],
+                        help="sizes of the varied dimension (depth, width, chain or name length)")
+    parser.add_argument("--shapes", nargs="+", choices=sorted(SHAPES), help="only run these expression shapes")
+    parser.add_argument("--repeat", type=int, default=3, help="timing rounds per measurement, the best is kept")
+    parser.add_argument("--min-time", type=float, default=0.05, help="minimum seconds per timing round")
+    parser.add_argument("--tolerance", type=float, default=0.35,
+                        help="allowed growth exponent above the expected one before failing")
+    parser.add_argument("--output", default="bench_results.json", help="where to save the results as JSON")
+    args = parser.parse_args(argv)
+    if len(args.sizes) < 2:
+        parser.error("need at least two sizes to fit a growth exponent")
+    if max(args.sizes) < MIN_SIZE_SPREAD * min(args.sizes):
+        parser.error(f"the largest size must be at least {MIN_SIZE_SPREAD} times the smallest")
+
+    report = run_benchmarks(args.sizes, args.repeat, args.min_time, args.tolerance, args.shapes)
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    failed = 0
+    for result in report["results"]:
+        status = "TOO SLOW" if not result["ok"] else "ok (timed again)" if result["rechecked"] else "ok"
+        print(f"{result['shape']:<13} {result['phase']:<26} exponent {result['exponent']:5.2f} "
+              f"(expected {result['expected_exponent']:.1f})  "
+              f"{result['chars_per_second'][-1]:>14,.0f} chars/s  "
+              f"peak {result['peak_bytes'][-1]:>12,} B  {status}")
+        failed += not result["ok"]
+
+    print(f"Results saved to {args.output}")
+    if failed:
+        print(f"{failed} phase(s) grew faster than expected")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
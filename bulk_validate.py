@@ -0,0 +1,292 @@
+"""
+Vectorized pre-validation of whole files with NumPy.
+
+A block of lines is loaded into one uint8 array with the start and end offset of
+every line, and the checks that do not need the grammar run over the whole block
+at once: characters are classified with a lookup table, bracket depth is a
+cumulative sum checked per line (negative minimum, nonzero final depth, empty
+brackets), and every dot and lambda is checked against the characters around it.
+
+A line failing any of these checks certainly has a syntax error and is rejected
+without ever reaching the Python parser. The error code given for it is the
+earliest error these checks see, the full checker (A1.syntax_errors) can report
+a different first error for lines with several. Lines passing the checks can
+still be invalid and go on to the full parser.
+
+Usage: python bulk_validate.py FILE
+"""
+import sys
+from typing import Iterator, List, NamedTuple
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("bulk_validate needs numpy (pip install numpy)") from e
+
+import A1
+import result_sinks
+
+# character classes
+_C_BAD = 0
+_C_LETTER = 1
+_C_DIGIT = 2
+_C_SPACE = 3
+_C_OPEN = 4
+_C_CLOSE = 5
+_C_DOT = 6
+_C_LAMBDA = 7
+_C_NEWLINE = 8
+
+_char_class = np.zeros(256, dtype=np.uint8)
+for char in A1.alphabet_chars:
+    _char_class[ord(char)] = _C_LETTER
+for char in A1.numeric_chars:
+    _char_class[ord(char)] = _C_DIGIT
+_char_class[[ord(" "), ord("\t")]] = _C_SPACE
+_char_class[ord("(")] = _C_OPEN
+_char_class[ord(")")] = _C_CLOSE
+_char_class[ord(".")] = _C_DOT
+_char_class[ord("\\")] = _C_LAMBDA
+_char_class[ord("\n")] = _C_NEWLINE
+
+# the bytes str.rstrip() strips from the end of a line: the ASCII whitespace, which has
+# more than the space and tab separating tokens (other control bytes are bad characters)
+_trailing_space = np.zeros(256, dtype=bool)
+_trailing_space[[ord(char) for char in " \t\n\v\f\r\x1c\x1d\x1e\x1f"]] = True
+
+# error code for the character after a '\\', by its class (a letter is fine)
+_after_lambda_error = np.array([A1.ERR_VAR_START, 0, A1.ERR_VAR_START, A1.ERR_LAMBDA_SPACE, A1.ERR_LAMBDA_SPACE,
+                                A1.ERR_LAMBDA, A1.ERR_DOT_NO_VAR, A1.ERR_LAMBDA, A1.ERR_LAMBDA], dtype=np.uint8)
+
+# lines are loaded in blocks of about this many bytes, the checks use a few
+# int64 arrays of the same length so memory use is some tens of times this
+BLOCK_SIZE = 1 << 20
+
+
+class LineBlock(NamedTuple):
+    """
+    Lines loaded into one array
+    Attributes:
+        data: the bytes of the lines, each followed by a newline
+        starts: the offset in data of the first byte of every line
+        ends: the offset after the last byte of every line, trailing whitespace excluded
+    """
+    data: np.ndarray
+    starts: np.ndarray
+    ends: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def line(self, idx: int) -> str:
+        """
+        :return: line idx decoded and then stripped of trailing whitespace, so that lines
+        ending in whitespace that is not ASCII come out as A1.iter_lines_from_txt reads them
+        """
+        end = self.starts[idx + 1] - 1 if idx + 1 < len(self.starts) else len(self.data) - 1
+        return bytes(self.data[self.starts[idx]:end]).decode(errors="replace").rstrip()
+
+
+def line_block(raw: bytes) -> LineBlock:
+    """
+    :param raw: lines separated by newlines, as read from a file
+    :return: the lines, with trailing whitespace cut off as A1.iter_lines_from_txt does
+    for ASCII lines, see _trailing_space
+    """
+    if raw and not raw.endswith(b"\n"):
+        raw += b"\n"
+    data = np.frombuffer(raw, dtype=np.uint8)
+    newlines = np.flatnonzero(data == ord("\n"))
+    starts = np.empty(len(newlines), dtype=np.int64)
+    starts[:1] = 0
+    starts[1:] = newlines[:-1] + 1
+    # the end of a line is one after its last character that is not whitespace
+    positions = np.arange(len(data), dtype=np.int64)
+    kept = np.where(~_trailing_space[data] | (data == ord("\n")), positions, -1)
+    last_kept = np.maximum.accumulate(kept) if len(kept) else kept
+    before_newline = last_kept[np.maximum(newlines - 1, 0)]
+    ends = np.where((newlines > starts) & (before_newline >= starts), before_newline + 1, starts)
+    return LineBlock(data, starts, ends)
+
+
+def iter_line_blocks(fp, block_size: int = BLOCK_SIZE) -> Iterator[LineBlock]:
+    """
+    Reads a file in blocks of whole lines of about block_size bytes
+    """
+    with open(fp, "rb") as file:
+        rest = b""
+        while True:
+            chunk = file.read(block_size)
+            if not chunk:
+                break
+            chunk = rest + chunk
+            cut = chunk.rfind(b"\n") + 1
+            if cut == 0:
+                rest = chunk
+                continue
+            (chunk, rest) = (chunk[:cut], chunk[cut:])
+            yield line_block(chunk)
+        if rest:
+            yield line_block(rest)
+
+
+def prevalidate(block: LineBlock) -> tuple:
+    """
+    Runs the bulk checks over every line of block
+    :return: (accept, codes, offsets): whether each line passed the checks, and for the
+    lines that did not the ERR_* code and byte offset in the line of the earliest error found
+    """
+    data = block.data
+    starts = block.starts
+    ends = block.ends
+    line_count = len(starts)
+    size = len(data)
+    if not size:
+        return (np.ones(0, dtype=bool), np.zeros(0, dtype=np.uint8), np.zeros(0, dtype=np.int64))
+    classes = _char_class[data]
+    positions = np.arange(size, dtype=np.int64)
+    line_of = np.cumsum(classes == _C_NEWLINE) - (classes == _C_NEWLINE)
+    in_line = positions < ends[line_of]
+
+    # candidate errors as (byte position in data, code), only the earliest per line is kept
+    error_at = []
+    error_code = []
+
+    def found(where: np.ndarray, code) -> None:
+        error_at.append(where)
+        error_code.append(np.broadcast_to(np.asarray(code, dtype=np.uint8), where.shape))
+
+    # bad characters, and words starting with a digit: a word starting with a letter
+    # is reported at its first bad character, any other word at its start
+    separator = classes >= _C_SPACE
+    word_start = np.maximum.accumulate(np.where(separator, positions, -1)) + 1
+    bad = np.flatnonzero(in_line & ((classes == _C_BAD) | ((classes == _C_DIGIT) & (word_start == positions))))
+    starts_with_letter = classes[word_start[bad]] == _C_LETTER
+    found(np.where(starts_with_letter, bad, word_start[bad]),
+          np.where(starts_with_letter, A1.ERR_VAR_CHAR, A1.ERR_VAR_START).astype(np.uint8))
+
+    # brackets: depth below zero, or not back at zero by the end of the line
+    step = (classes == _C_OPEN).astype(np.int64) - (classes == _C_CLOSE)
+    depth = np.cumsum(step)
+    depth_before_line = np.where(starts > 0, depth[np.maximum(starts - 1, 0)], 0)
+    depth -= depth_before_line[line_of]
+    found(np.flatnonzero(in_line & (depth < 0)), A1.ERR_BRACKETS)
+    unclosed = np.flatnonzero((ends > starts) & (depth[np.maximum(ends - 1, 0)] != 0))
+    # the full checker reports unclosed brackets after everything else
+    found(ends[unclosed], A1.ERR_BRACKETS)
+
+    # empty brackets: a ')' whose previous character other than whitespace is a '('
+    not_space = np.where(classes != _C_SPACE, positions, -1)
+    previous = np.concatenate(([-1], np.maximum.accumulate(not_space)[:-1]))
+    closes = np.flatnonzero(in_line & (classes == _C_CLOSE))
+    opened_before = previous[closes]
+    empty = (opened_before >= 0) & (classes[np.maximum(opened_before, 0)] == _C_OPEN)
+    found(opened_before[empty], A1.ERR_EMPTY_BRACKETS)
+
+    # a dot has to come right after '\\' and a variable
+    dots = np.flatnonzero(in_line & (classes == _C_DOT))
+    # the start of the word before the dot
+    binder = np.where(dots > 0, word_start[np.maximum(dots - 1, 0)], dots)
+    after_lambda = (binder >= 1) & (classes[np.maximum(binder - 1, 0)] == _C_LAMBDA)
+    dot_ok = (binder < dots) & (classes[np.minimum(binder, size - 1)] == _C_LETTER) & after_lambda
+    # where a lambda body was expected (after a '\\', its variable and whitespace, or
+    # another dot) the variable is missing, anywhere else the lambda is
+    wrong_dots = dots[~dot_ok]
+    before = previous[wrong_dots]
+    before_class = classes[np.maximum(before, 0)]
+    before_word = word_start[np.maximum(before, 0)]
+    binder_before = ((before_class == _C_LETTER) | (before_class == _C_DIGIT)) & (before_word >= 1) \
+        & (classes[np.maximum(before_word - 1, 0)] == _C_LAMBDA)
+    body_expected = (before >= 0) & ((before_class == _C_LAMBDA) | (before_class == _C_DOT) | binder_before)
+    found(wrong_dots, np.where(body_expected, A1.ERR_DOT_NO_VAR, A1.ERR_DOT_NO_LAMBDA).astype(np.uint8))
+
+    # a '\\' has to be followed by a letter
+    lambdas = np.flatnonzero(in_line & (classes == _C_LAMBDA))
+    following = lambdas + 1
+    at_end = following >= ends[line_of[lambdas]]
+    lambda_codes = np.where(at_end, A1.ERR_LAMBDA, _after_lambda_error[classes[np.minimum(following, size - 1)]])
+    wrong = lambda_codes != 0
+    lambda_codes = lambda_codes[wrong].astype(np.uint8)
+    found(np.where(lambda_codes == A1.ERR_LAMBDA_SPACE, lambdas[wrong], following[wrong]), lambda_codes)
+
+    # nothing but whitespace
+    found(starts[ends == starts], A1.ERR_EMPTY)
+
+    error_at = np.concatenate(error_at)
+    error_code = np.concatenate(error_code)
+    # errors at the end of a line are at its trailing whitespace or newline, still in the line
+    error_line = line_of[error_at]
+    order = np.lexsort((error_at, error_line))
+    (first_lines, first) = np.unique(error_line[order], return_index=True)
+    accept = np.ones(line_count, dtype=bool)
+    codes = np.zeros(line_count, dtype=np.uint8)
+    offsets = np.zeros(line_count, dtype=np.int64)
+    accept[first_lines] = False
+    codes[first_lines] = error_code[order][first]
+    offsets[first_lines] = error_at[order][first] - starts[first_lines]
+    return (accept, codes, offsets)
+
+
+def bulk_line_results(fp, block_size: int = BLOCK_SIZE) -> Iterator[A1.LineResult]:
+    """
+    :return: iterator over the A1.LineResult of every line of the file, the lines
+    rejected by prevalidate() without parsing them
+    """
+    LineResult = A1.LineResult
+    syntax_issue = A1._syntax_issue
+    parse_line = A1.parse_line
+    for block in iter_line_blocks(fp, block_size):
+        (accept, codes, offsets) = prevalidate(block)
+        # latin-1 maps every byte to one character, so ASCII lines come out right and
+        # byte offsets stay string offsets, lines with other bytes are decoded again
+        text = block.data.tobytes().decode("latin-1")
+        non_ascii = np.concatenate(([0], np.cumsum(block.data >= 128)))
+        ascii_line = (non_ascii[block.ends] == non_ascii[block.starts]).tolist()
+        starts = block.starts.tolist()
+        ends = block.ends.tolist()
+        for (idx, accepted, code, offset) in zip(range(len(starts)), accept.tolist(), codes.tolist(), offsets.tolist()):
+            if not ascii_line[idx]:
+                # the full checker finds the error, the offsets of the bulk checks are in bytes
+                yield parse_line(block.line(idx))
+                continue
+            line = text[starts[idx]:ends[idx]]
+            if accepted:
+                yield parse_line(line)
+            else:
+                message = _constant_messages.get(code)
+                if message is None:
+                    message = syntax_issue(line, code, offset).message
+                yield LineResult(line, code, offset, message, None)
+
+
+# the error messages that do not depend on where the error is
+_constant_messages = {code: message for (code, message) in A1._error_messages.items() if "{" not in message}
+
+
+def check_validity(fp, sink: result_sinks.ResultSink = None, block_size: int = BLOCK_SIZE) -> None:
+    """
+    A1.read_lines_from_txt_check_validity, with the lines pre-validated in bulk
+    """
+    if sink is None:
+        sink = result_sinks.TextSink()
+    line_count = 0
+    valid_count = 0
+    for result in bulk_line_results(fp, block_size):
+        line_count += 1
+        valid_count += result.code == 0
+        sink.write(result)
+    sink.summary(line_count, valid_count)
+    sink.flush()
+
+
+def main(argv: List[str] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) != 1:
+        print(__doc__.strip().splitlines()[-1])
+        return 2
+    check_validity(argv[0])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,347 @@
+"""
+Normalizer for the lambda expressions parsed by A1.
+
+Terms are converted to de Bruijn form (A1.to_de_bruijn) and reduced to normal
+form by an environment machine: instead of substituting into copies of a term,
+a beta reduction binds the argument as an unevaluated thunk in the environment
+of the function body. Going under a lambda to read back its body binds the
+lambda's variable to a fresh neutral value (normalization by evaluation), so
+reduction never needs to rename variables. Everything runs on explicit stacks,
+so neither deep terms nor long reductions can hit the recursion limit.
+
+Strategies:
+    "normal": normal order (call-by-name), a thunk is evaluated again every time it is used
+    "need": call-by-need, a thunk is overwritten with its value the first time it is
+    evaluated, so every argument is reduced at most once
+
+Usage: python lambda_eval.py "(\\f.\\x.f (f x)) (\\f.\\x.f (f x))" [--strategy need] [--max-steps N] [--timeout S]
+"""
+import argparse
+import sys
+from time import perf_counter
+from typing import List, NamedTuple, Optional
+
+import A1
+from A1 import DB_VAR, DB_FREE, DB_ABS, DB_APP
+
+STRATEGIES = ("normal", "need")
+
+# kinds of heap cells, all cells are tuples starting with the kind:
+#   (_THUNK, term, env)        a term not evaluated yet, in its environment
+#   (_CLOSURE, abs term, env)  a lambda, in its environment
+#   (_NEUTRAL, head, spine)    a variable applied to the thunks in spine, head is the
+#                              lambda depth of a bound variable or the name of a free one
+# environments are linked lists (heap index of the innermost variable, rest) ending in None
+_THUNK = 0
+_CLOSURE = 1
+_NEUTRAL = 2
+
+# work items of the read back
+_READ_TERM = 0
+_READ_CELL = 1
+_MAKE_ABS = 2
+_MAKE_APP = 3
+
+# how many reductions run between checks of the time limit
+_CLOCK_INTERVAL = 1024
+
+
+class EvaluationLimit(Exception):
+    """ A step or time limit ran out before the normal form was reached """
+
+
+class Evaluation(NamedTuple):
+    """
+    What normalize() did
+    Attributes:
+        normal_form: the normal form in de Bruijn form, None if a limit ran out first
+        status: "normal form", "step limit" or "time limit"
+        steps: number of beta reductions done
+        heap_cells: peak size of the heap, cells are never freed during a run
+        seconds: wall time spent
+    """
+    normal_form: Optional[tuple]
+    status: str
+    steps: int
+    heap_cells: int
+    seconds: float
+
+
+class Machine:
+    """
+    Reduces one term to normal form, see the module docstring
+    Attributes:
+        strategy: one of STRATEGIES
+        max_steps: the most beta reductions allowed, None for no limit
+        deadline: perf_counter() time to stop at, None for no limit
+        heap: the cells, see _THUNK, _CLOSURE and _NEUTRAL
+        steps: beta reductions done so far
+    """
+    def __init__(self, strategy: str = "need", max_steps: Optional[int] = None, deadline: Optional[float] = None):
+        if strategy not in STRATEGIES:
+            raise ValueError(f"strategy must be one of {STRATEGIES}, not {strategy!r}")
+        self.strategy = strategy
+        self.max_steps = max_steps
+        self.deadline = deadline
+        self.heap = []
+        self.steps = 0
+
+    def whnf(self, term: tuple, env: Optional[tuple], cell: int = -1) -> tuple:
+        """
+        Evaluates term to weak head normal form, a _CLOSURE or _NEUTRAL cell.
+        :param cell: with call-by-need, the heap cell term came from, updated with the result
+        :raises EvaluationLimit: if a limit runs out
+        """
+        heap = self.heap
+        need = self.strategy == "need"
+        max_steps = self.max_steps
+        deadline = self.deadline
+        # frames: a heap index h >= 0 is an argument waiting to be applied,
+        # ~h < 0 marks cell h to be overwritten with the value once it is reached
+        stack = [~cell] if need and cell >= 0 else []
+        while True:
+            kind = term[0]
+            if kind == DB_APP:
+                stack.append(len(heap))
+                heap.append((_THUNK, term[2], env))
+                term = term[1]
+                continue
+            if kind == DB_VAR:
+                found = env
+                for _ in range(term[1]):
+                    found = found[1]
+                h = found[0]
+                value = heap[h]
+                if value[0] == _THUNK:
+                    if need:
+                        stack.append(~h)
+                    (_, term, env) = value
+                    continue
+            elif kind == DB_ABS:
+                value = (_CLOSURE, term, env)
+            else:
+                value = (_NEUTRAL, term[1], ())
+
+            # apply the value to the frames on the stack
+            if value[0] == _CLOSURE:
+                while stack and stack[-1] < 0:
+                    heap[~stack.pop()] = value
+                if not stack:
+                    return value
+                if max_steps is not None and self.steps >= max_steps:
+                    raise EvaluationLimit("step limit")
+                self.steps += 1
+                if deadline is not None and self.steps % _CLOCK_INTERVAL == 0 and perf_counter() > deadline:
+                    raise EvaluationLimit("time limit")
+                env = (stack.pop(), value[2])
+                term = value[1][1]
+                continue
+
+            (_, head, spine) = value
+            spine = list(spine)
+            while stack:
+                frame = stack.pop()
+                if frame >= 0:
+                    spine.append(frame)
+                else:
+                    heap[~frame] = (_NEUTRAL, head, tuple(spine))
+            return (_NEUTRAL, head, tuple(spine))
+
+    def normal_form(self, term: tuple) -> tuple:
+        """
+        :param term: a closed or open term in de Bruijn form
+        :return: its normal form, in de Bruijn form
+        :raises EvaluationLimit: if a limit runs out
+        """
+        heap = self.heap
+        results = []
+        # items are (_READ_TERM, term, env, depth), (_READ_CELL, heap index, depth),
+        # (_MAKE_ABS, name) or (_MAKE_APP, head, depth, number of arguments)
+        stack = [(_READ_TERM, term, None, 0)]
+        while stack:
+            item = stack.pop()
+            action = item[0]
+            if action == _READ_TERM:
+                value = self.whnf(item[1], item[2])
+                depth = item[3]
+            elif action == _READ_CELL:
+                value = heap[item[1]]
+                if value[0] == _THUNK:
+                    value = self.whnf(value[1], value[2], item[1])
+                depth = item[2]
+            elif action == _MAKE_ABS:
+                results.append((DB_ABS, results.pop(), item[1]))
+                continue
+            else:
+                (_, head, depth, count) = item
+                applied = (DB_FREE, head) if head.__class__ is str else (DB_VAR, depth - 1 - head)
+                first = len(results) - count
+                for idx in range(first, len(results)):
+                    applied = (DB_APP, applied, results[idx])
+                del results[first:]
+                results.append(applied)
+                continue
+
+            if value[0] == _CLOSURE:
+                # read the body back with the variable bound to itself, a neutral value
+                abs_term = value[1]
+                heap.append((_NEUTRAL, depth, ()))
+                stack.append((_MAKE_ABS, abs_term[2]))
+                stack.append((_READ_TERM, abs_term[1], (len(heap) - 1, value[2]), depth + 1))
+            else:
+                (_, head, spine) = value
+                stack.append((_MAKE_APP, head, depth, len(spine)))
+                stack.extend((_READ_CELL, h, depth) for h in reversed(spine))
+        return results[0]
+
+
+def normalize_term(term: tuple, strategy: str = "need", max_steps: Optional[int] = None,
+                   timeout: Optional[float] = None) -> Evaluation:
+    """
+    :param term: a term in de Bruijn form, see A1.to_de_bruijn
+    :param strategy: one of STRATEGIES
+    :param max_steps: stop after this many beta reductions
+    :param timeout: stop after this many seconds
+    :return: the normal form and statistics of the reduction
+    """
+    start = perf_counter()
+    machine = Machine(strategy, max_steps, None if timeout is None else start + timeout)
+    try:
+        normal_form = machine.normal_form(term)
+        status = "normal form"
+    except EvaluationLimit as e:
+        normal_form = None
+        status = str(e)
+    return Evaluation(normal_form, status, machine.steps, len(machine.heap), perf_counter() - start)
+
+
+def normalize(s: str, strategy: str = "need", max_steps: Optional[int] = None,
+              timeout: Optional[float] = None) -> Evaluation:
+    """
+    Parses s and reduces it to normal form, see normalize_term
+    :param s: the input string
+    :raises ValueError: with the syntax error message if s is not a valid expression
+    """
+    (valid, msg) = A1.valid_syntax(s)
+    if not valid:
+        raise ValueError(msg)
+    buf = A1.tokenize(s)
+    return normalize_term(A1.to_de_bruijn(A1.parse_token_buffer(buf), buf), strategy, max_steps, timeout)
+
+
+def to_tokens(term: tuple) -> List[str]:
+    """
+    Converts a de Bruijn term back into tokens with named variables and only the
+    brackets needed under left association (see A1.emit_minimal_tokens). A
+    binder keeps its source name unless that would capture another variable,
+    then a number is added to it.
+    :param term: a term in de Bruijn form
+    :return: a list of tokens
+    """
+    free = set()
+    stack = [term]
+    while stack:
+        item = stack.pop()
+        if item[0] == DB_FREE:
+            free.add(item[1])
+        elif item[0] == DB_ABS:
+            stack.append(item[1])
+        elif item[0] == DB_APP:
+            stack.append(item[1])
+            stack.append(item[2])
+
+    tokens = []
+    scope = []       # names of the enclosing binders, innermost last
+    in_scope = set(free)
+    # items are a token string, None to leave a lambda, or (term, rightmost)
+    stack = [(term, True)]
+    while stack:
+        item = stack.pop()
+        if item is None:
+            in_scope.discard(scope.pop())
+            continue
+        if item.__class__ is str:
+            tokens.append(item)
+            continue
+        (term, rightmost) = item
+        kind = term[0]
+        if kind == DB_VAR:
+            tokens.append(scope[-1 - term[1]])
+        elif kind == DB_FREE:
+            tokens.append(term[1])
+        elif kind == DB_ABS:
+            name = term[2]
+            number = 0
+            while name in in_scope:
+                number += 1
+                name = f"{term[2]}{number}"
+            scope.append(name)
+            in_scope.add(name)
+            tokens.append("\\")
+            tokens.append(name)
+            stack.append(None)
+            stack.append((term[1], True))
+        else:
+            # the arguments of the left spine, then the head
+            arguments = []
+            while term[0] == DB_APP:
+                arguments.append(term[2])
+                term = term[1]
+            for (idx, argument) in enumerate(arguments):
+                if argument[0] == DB_APP or (argument[0] == DB_ABS and not (idx == 0 and rightmost)):
+                    stack.append(")")
+                    stack.append((argument, True))
+                    stack.append("(")
+                else:
+                    stack.append((argument, rightmost and idx == 0))
+            if term[0] == DB_ABS:
+                stack.append(")")
+                stack.append((term, True))
+                stack.append("(")
+            else:
+                stack.append((term, False))
+    return tokens
+
+
+def to_source(term: tuple) -> str:
+    """
+    :param term: a term in de Bruijn form
+    :return: the term as a valid input string, with dots after the binders, e.g. \\x.\\y.x (x y)
+    """
+    parts = []
+    tokens = to_tokens(term)
+    idx = 0
+    while idx < len(tokens):
+        token = tokens[idx]
+        if parts and parts[-1][-1] not in "(." and token != ")":
+            parts.append(" ")
+        if token == "\\":
+            idx += 1
+            parts.append(f"\\{tokens[idx]}.")
+        else:
+            parts.append(token)
+        idx += 1
+    return "".join(parts)
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reduce a lambda expression to normal form.")
+    parser.add_argument("expression", help="the expression, in the syntax of A1")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="need", help="reduction strategy")
+    parser.add_argument("--max-steps", type=int, help="stop after this many beta reductions")
+    parser.add_argument("--timeout", type=float, help="stop after this many seconds")
+    args = parser.parse_args(argv)
+
+    try:
+        result = normalize(args.expression, args.strategy, args.max_steps, args.timeout)
+    except ValueError as e:
+        print(e)
+        return 1
+    if result.normal_form is not None:
+        print(to_source(result.normal_form))
+    print(f"{result.status}: {result.steps} reductions, {result.heap_cells} heap cells, {result.seconds:.6f} s")
+    return 0 if result.normal_form is not None else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
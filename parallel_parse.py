@@ -0,0 +1,345 @@
+"""
+Process pools for A1.
+
+map_lines_in_parallel() runs a worker over the lines of a file in a pool of
+processes, streaming the lines in chunks and giving the results back in order.
+The A1 batch functions use it for jobs=N, and stored_results() for jobs=N with a
+parse_store.ParseStore.
+
+tokens_or_error() and build_compact_parse_tree() parse one huge line in a pool.
+The top level of an expression a1 a2 ... aN is an application whose operands can
+be parsed on their own: every operand gets the same tokens and subtree whatever
+comes before or after it. The line is cut between top level operands into
+segments, the segments are parsed in worker processes and the results are
+joined. A lambda at the top level takes in everything after it, so no cut goes
+before one and the segments after one are parsed as a single segment.
+"""
+import os
+import re
+from array import array
+from collections import deque
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from typing import Iterator, List, Optional, Union
+
+import A1
+import parse_profiler
+import parse_store
+
+
+def map_lines_in_parallel(worker, lines: Iterator[str], jobs: int, chunk_size: int = 512) -> Iterator[tuple]:
+    """
+    Runs worker over chunks of lines in a pool of jobs processes. Only a couple of
+    chunks per process are in flight at a time, so the lines are still streamed.
+    :param worker: a module level function taking a list of lines and returning one result per line
+    :return: iterator over (line, result of the line), in the order of the lines
+    """
+    profiler = A1._profiler
+
+    def submit(chunk):
+        if profiler is None:
+            return pool.submit(worker, chunk)
+        if isinstance(profiler, parse_profiler.MemoryProfiler):
+            return pool.submit(parse_profiler.run_profiled, worker, chunk, True, profiler.worst_lines)
+        return pool.submit(parse_profiler.run_profiled, worker, chunk)
+
+    def finish(chunk, future):
+        results = future.result()
+        if profiler is not None:
+            (results, exported) = results
+            profiler.merge(exported)
+        return zip(chunk, results)
+
+    with ProcessPoolExecutor(jobs) as pool:
+        pending = deque()
+        chunk = list(islice(lines, chunk_size))
+        while chunk:
+            pending.append((chunk, submit(chunk)))
+            if len(pending) >= 2 * jobs:
+                yield from finish(*pending.popleft())
+            chunk = list(islice(lines, chunk_size))
+        while pending:
+            yield from finish(*pending.popleft())
+
+
+# stores opened by worker processes, by path
+_worker_stores = {}
+
+
+def _stored_line_results(path: [str, os.PathLike], with_tree: bool, lines: List[str],
+                         limits: Optional[A1.Limits] = None) -> List[tuple]:
+    """
+    Worker side of the A1 batch functions with a store and jobs=N, looks lines up in
+    the flushed part of the store and parses the others
+    :return: per line, (its A1.LineResult, whether it came from the store)
+    """
+    store = _worker_stores.get(path)
+    if store is None:
+        store = _worker_stores[path] = parse_store.ParseStore(path, readonly=True)
+    results = []
+    for l in lines:
+        result = store.get(l, with_tree)
+        if result is None:
+            results.append((A1.parse_line(l, with_tree, limits), False))
+        else:
+            # memory maps cannot be sent to another process
+            results.append((_detached(result), True))
+    return results
+
+
+def _detached(result: A1.LineResult) -> A1.LineResult:
+    tree = result.tree
+    if tree is None:
+        return result
+    return result._replace(tree=A1.CompactParseTree.from_arrays(
+        tree.tokens, array("b", tree.kinds), array("l", tree.starts), array("l", tree.ends),
+        array("l", tree.first_child), array("l", tree.next_sibling)))
+
+
+def stored_results(store: parse_store.ParseStore, lines: Iterator[str], jobs: int, with_tree: bool,
+                   limits: Optional[A1.Limits] = None) -> Iterator[A1.LineResult]:
+    """
+    parse_store.ParseStore.results() with the lines the store does not have parsed in jobs processes
+    """
+    store.flush()
+    worker = partial(_stored_line_results, store.path, with_tree, limits=limits)
+    for (_, (result, stored)) in map_lines_in_parallel(worker, lines, jobs):
+        if stored:
+            store.hits += 1
+        else:
+            store.misses += 1
+            store.put(result)
+        yield result
+
+
+# segments are at least this many tokens (characters for a line not lexed yet), smaller
+# lines are parsed serially
+_PARALLEL_MIN_SEGMENT = 1 << 14
+
+
+def _top_level_cuts(tokens: Sequence[str], parts: int) -> Optional[List[int]]:
+    """
+    Cuts tokens at top level operand starts (see A1.BracketIndex.operand_starts) into about
+    parts segments of similar length, each holding whole operands
+    :param tokens: a list of tokens with balanced brackets
+    :param parts: how many segments to aim for
+    :return: the index of the first token of each segment, the first being 0, or None
+    if tokens cannot be cut (a single operand or a lambda at the start)
+    :raises ValueError: if the brackets are not balanced
+    """
+    if parts < 2:
+        return None
+    step = len(tokens) // parts
+    cuts = [0]
+    for start in A1.BracketIndex(tokens).operand_starts():
+        if start - cuts[-1] >= step and tokens[start] != "\\":
+            cuts.append(start)
+    return cuts if len(cuts) > 1 else None
+
+
+# an operand following another one at the same level: a variable or '(' after whitespace or a ')'
+_operand_start_re = re.compile(r"(?<=[ \t)])[A-Za-z(]")
+
+
+def _top_level_string_cuts(s: str, parts: int) -> Optional[List[int]]:
+    """
+    Cuts s before top level operands into about parts segments of similar length, like
+    _top_level_cuts() but on the string, so the line is not lexed to find the cuts. Only
+    the brackets between the cuts are counted, with str.count and str.find. A cut after
+    a lambda at the top level is not noticed, see tokens_or_error().
+    :param s: the input string
+    :param parts: how many segments to aim for
+    :return: the offset in s of each segment, the first being 0, or None if s cannot be
+    cut (a single operand, a lambda at the start or unbalanced brackets)
+    """
+    if parts < 2 or s.lstrip().startswith("\\"):
+        return None
+    step = max(len(s) // parts, 1)
+    cuts = [0]
+    pos = 0
+    # the number of brackets open at pos
+    depth = 0
+    while True:
+        target = max(cuts[-1] + step, pos)
+        if target >= len(s):
+            break
+        depth += s.count("(", pos, target) - s.count(")", pos, target)
+        pos = target
+        # leave the bracket groups around pos
+        while depth > 0:
+            close = s.find(")", pos)
+            if close == -1:
+                return None
+            depth += s.count("(", pos, close) - 1
+            pos = close + 1
+        if depth < 0:
+            return None
+        m = _operand_start_re.search(s, pos)
+        if m is None:
+            break
+        depth += s.count("(", pos, m.start()) - s.count(")", pos, m.start())
+        pos = m.start()
+        if depth == 0:
+            cuts.append(pos)
+    return cuts if len(cuts) > 1 else None
+
+
+def _has_top_level_lambda(s: str) -> bool:
+    """
+    :param s: a valid expression
+    :return: whether s has a lambda outside of all brackets, which then takes in everything after it
+    """
+    depth = 0
+    pos = 0
+    while True:
+        lambda_at = s.find("\\", pos)
+        if lambda_at == -1:
+            return False
+        depth += s.count("(", pos, lambda_at) - s.count(")", pos, lambda_at)
+        if depth == 0:
+            return True
+        pos = lambda_at + 1
+
+
+def _segment_tokens(association_type: Optional[str], segment: str) -> Union[tuple, str]:
+    """
+    Worker side of A1.parse_tokens(jobs=N)
+    :return: the error message if segment is invalid, otherwise (whether its last top
+    level operand is a lambda, the tokens of segment), the tokens being for an association
+    type a list of the tokens of each top level operand, associated one by one
+    """
+    issues = A1.syntax_errors(segment)
+    if issues:
+        return issues[0].message
+    ends_in_lambda = _has_top_level_lambda(segment)
+    buf = A1.tokenize(segment)
+    if association_type is None:
+        return (ends_in_lambda, buf.to_list())
+    term = A1.parse_token_buffer(buf)
+    operands = term[1] if term[0] == A1.TERM_APP else (term,)
+    return (ends_in_lambda, [A1.emit_tokens(operand, buf, association_type) for operand in operands])
+
+
+def tokens_or_error(s: str, association_type: Optional[str], jobs: int) -> Union[List[str], str]:
+    """
+    A1._tokens_or_error() with the top level operands of s checked, lexed and parsed in
+    jobs processes. s is cut by _top_level_string_cuts(), and the segments after one
+    ending in a lambda are parsed again as one segment. Lines that cannot be cut or have
+    an error are parsed serially, so the result is always the same.
+    """
+    cuts = _top_level_string_cuts(s, min(4 * jobs, len(s) // _PARALLEL_MIN_SEGMENT))
+    if cuts is None:
+        return A1._tokens_or_error(s, association_type)
+
+    work = partial(_segment_tokens, association_type)
+    with ProcessPoolExecutor(jobs) as pool:
+        parsed = list(pool.map(work, [s[start:end] for (start, end) in zip(cuts, cuts[1:] + [len(s)])]))
+        if not any(result.__class__ is str for result in parsed):
+            lambda_at = next((idx for (idx, (ends_in_lambda, _)) in enumerate(parsed[:-1]) if ends_in_lambda), None)
+            if lambda_at == 0:
+                parsed = None
+            elif lambda_at is not None:
+                parsed[lambda_at:] = [pool.submit(work, s[cuts[lambda_at]:]).result()]
+    if parsed is None or any(result.__class__ is str for result in parsed):
+        # for the error message, or the whole line being one lambda's body
+        return A1._tokens_or_error(s, association_type)
+    if association_type is None:
+        tokens = []
+        for (_, segment_tokens) in parsed:
+            tokens += segment_tokens
+        return tokens
+
+    # join the operands as A1.emit_tokens() does for a whole application
+    operands = [operand for (_, segment_operands) in parsed for operand in segment_operands]
+    pairs = len(operands) - 1
+    tokens = []
+    if association_type == "left":
+        # ( ( ( a b ) c ) d )
+        tokens += "(" * pairs
+    for (operand_idx, operand_tokens) in enumerate(operands):
+        if association_type == "right":
+            # ( a ( b ( c d ) ) )
+            if operand_idx < pairs:
+                tokens.append("(")
+        elif operand_idx > 1:
+            tokens.append(")")
+        tokens += operand_tokens
+    tokens += ")" * (pairs if association_type == "right" else 1)
+    return tokens
+
+
+def _segment_tree(segment: tuple) -> tuple:
+    """
+    Worker side of A1.build_parse_tree(compact=True, jobs=N)
+    :param segment: (index of the first token of the segment in the whole tree, its tokens)
+    :return: (the node arrays of the compact tree of the tokens, with token indices in
+    the whole tree, the number of children of its root)
+    """
+    (offset, tokens) = segment
+    tree = A1.build_compact_parse_tree(tokens)
+    children = 0
+    child = tree.first_child[0]
+    while child != -1:
+        children += 1
+        child = tree.next_sibling[child]
+    starts = array("l", [v + offset for v in tree.starts])
+    ends = array("l", [v + offset for v in tree.ends])
+    return ((tree.kinds, starts, ends, tree.first_child, tree.next_sibling), children)
+
+
+def _shifted(values: Sequence[int], shift: int) -> array:
+    """
+    :return: values with shift added to every node index, -1 (no node) is kept
+    """
+    return array("l", [v + shift if v >= 0 else -1 for v in values])
+
+
+def build_compact_parse_tree(tokens: List[str], jobs: int) -> A1.CompactParseTree:
+    """
+    A1.build_compact_parse_tree() with the subtrees of the top level operands built in
+    jobs processes. The nodes are numbered as A1.build_compact_parse_tree() numbers them:
+    the root, its children, then the subtree of each child from the last to the first.
+    """
+    cuts = _top_level_cuts(tokens, min(4 * jobs, len(tokens) // _PARALLEL_MIN_SEGMENT))
+    if cuts is None:
+        return A1.build_compact_parse_tree(tokens)
+
+    bounds = list(zip(cuts, cuts[1:] + [len(tokens)]))
+    with ProcessPoolExecutor(jobs) as pool:
+        built = list(pool.map(_segment_tree, [(start, tokens[start:end]) for (start, end) in bounds]))
+
+    tree = A1.CompactParseTree(tokens)
+    tree.add_node(A1._NODE_SEQ, 0, len(tokens))
+    tree.first_child[0] = 1
+    # where the children of the root of each segment go, and where the rest of its nodes go
+    child_at = []
+    subtree_at = [0] * len(built)
+    at = 1
+    for (_, children) in built:
+        child_at.append(at)
+        at += children
+    for idx in range(len(built) - 1, -1, -1):
+        (arrays, children) = built[idx]
+        subtree_at[idx] = at
+        at += len(arrays[0]) - 1 - children
+
+    # the children of the segment roots in order, then the rest of the nodes of each segment from the last
+    for (root_children, order) in ((True, range(len(built))), (False, range(len(built) - 1, -1, -1))):
+        for idx in order:
+            ((kinds, starts, ends, first_child, next_sibling), children) = built[idx]
+            subtree_shift = subtree_at[idx] - children - 1
+            nodes = slice(1, children + 1) if root_children else slice(children + 1, len(kinds))
+            tree.kinds += kinds[nodes]
+            tree.starts += starts[nodes]
+            tree.ends += ends[nodes]
+            tree.first_child += _shifted(first_child[nodes], subtree_shift)
+            if root_children:
+                siblings = _shifted(next_sibling[nodes], child_at[idx] - 1)
+                if idx + 1 < len(built):
+                    siblings[-1] = child_at[idx + 1]
+            else:
+                siblings = _shifted(next_sibling[nodes], subtree_shift)
+            tree.next_sibling += siblings
+    return tree
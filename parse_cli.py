@@ -0,0 +1,182 @@
+"""
+Command line interface of A1.
+
+Streams the lines of files (or standard input) through one of the commands
+validate, tokens, tree, associate and stats, in one process or in a pool of
+worker processes, with the output as text or as JSON lines. The exit status is
+1 if any line is invalid, so the command can be used as a check.
+
+Usage: python parse_cli.py {validate,tokens,tree,associate,stats} [FILE ...] [--jobs N] [--format text|jsonl]
+                           [--quiet] [--limit NAME=VALUE] [--store PATH]
+"""
+import argparse
+import json
+import sys
+from functools import partial
+from typing import Iterator, List, Optional
+
+import A1
+import result_sinks
+
+# parallel_parse (with concurrent.futures), parse_profiler and parse_store are imported
+# by the commands using them, so a plain run does not pay for them at startup
+
+
+def _iter_input_lines(files: List[str]) -> Iterator[str]:
+    """
+    :param files: paths of the files to read in turn, "-" (or no files at all) for standard input
+    :return: iterator over the lines, without trailing whitespace and newline characters
+    """
+    for fp in files or ["-"]:
+        if fp == "-":
+            for line in sys.stdin:
+                yield line.rstrip()
+        else:
+            yield from A1.iter_lines_from_txt(fp)
+
+
+def _associated_results(lines: List[str], association_type: str, minimal: bool = False,
+                        limits: Optional[A1.Limits] = None) -> List[A1.LineResult]:
+    """
+    Worker side of the associate command
+    :return: the A1.LineResult of each line, with the tokens of a valid line associated by
+    A1.add_associativity(), which works on the tokens parse_line() found without lexing the line again
+    """
+    results = []
+    for l in lines:
+        result = A1.parse_line(l, limits=limits)
+        if result.code == 0:
+            result = result._replace(tokens=tuple(A1.add_associativity(result.tokens, association_type, minimal)))
+        results.append(result)
+    return results
+
+
+def _parse_limits(specs: List[str]) -> Optional[A1.Limits]:
+    """
+    :param specs: NAME=VALUE strings, NAME one of depth, tokens, nodes and seconds
+    :raises ValueError: for a spec that is not one of those
+    """
+    if not specs:
+        return None
+    fields = {"depth": ("max_depth", int), "tokens": ("max_tokens", int), "nodes": ("max_nodes", int),
+              "seconds": ("max_seconds", float)}
+    values = {}
+    for spec in specs:
+        (name, _, value) = spec.partition("=")
+        if name not in fields or not value:
+            raise ValueError(f"limits look like {'|'.join(fields)}=VALUE, not {spec!r}")
+        (field, convert) = fields[name]
+        values[field] = convert(value)
+    return A1.Limits(**values)
+
+
+def _command_stats(results: Iterator[A1.LineResult], args) -> int:
+    import parse_profiler
+    line_count = valid_count = limited_count = 0
+    with parse_profiler.profiling(memory=args.memory, worst_lines=args.worst) as profiler:
+        for result in results:
+            line_count += 1
+            valid_count += result.code == 0
+            limited_count += result.limit_exceeded
+    counts = {"lines": line_count, "valid": valid_count, "invalid": line_count - valid_count,
+              "limit_exceeded": limited_count}
+    if args.format == "jsonl":
+        phases = {phase: dict(zip(parse_profiler.PhaseStats.__slots__, stats.as_tuple()))
+                  for (phase, stats) in profiler.phases.items()}
+        record = {**counts, "phases": phases}
+        if args.memory:
+            record["memory"] = {phase: {**dict(zip(parse_profiler.PhaseMemory.__slots__, stats.as_tuple())),
+                                        "bytes_per_token": stats.bytes_per_token}
+                                for (phase, stats) in profiler.memory.items()}
+            record["worst_lines"] = [{"peak_bytes": peak, "tokens": tokens, "line": line}
+                                     for (peak, tokens, line) in profiler.worst()]
+        print(json.dumps(record))
+    else:
+        print(", ".join(f"{value} {name.replace('_', ' ')}" for (name, value) in counts.items()))
+        if not args.quiet:
+            print(profiler.report())
+    return 0 if valid_count == line_count else 1
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Command line interface, see python parse_cli.py --help
+    :return: the exit status, 1 if any line was invalid
+    """
+    parser = argparse.ArgumentParser(prog="parse_cli.py",
+                                     description="Validate and parse lambda calculus expressions, one per line.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    validate = commands.add_parser("validate", help="report the invalid lines")
+    tokens = commands.add_parser("tokens", help="print the tokens of every line")
+    tree = commands.add_parser("tree", help="print the parse tree of every line")
+    associate = commands.add_parser("associate", help="print the tokens with associativity brackets")
+    associate.add_argument("association_type", choices=("left", "right"))
+    associate.add_argument("--minimal", action="store_true", help="only keep the brackets that are needed")
+    stats = commands.add_parser("stats", help="print line counts and the time spent in each phase")
+    stats.add_argument("--memory", action="store_true",
+                       help="also trace the memory used by each phase and list the lines using the most")
+    stats.add_argument("--worst", type=int, default=10, metavar="N", help="with --memory, how many lines to list")
+    for command in (validate, tokens, tree, associate, stats):
+        command.add_argument("files", nargs="*", metavar="FILE", help="files to read, standard input if none or -")
+        command.add_argument("--jobs", type=int, default=1, help="number of processes to parse with")
+        command.add_argument("--format", choices=("text", "jsonl"), default="text", help="output format")
+        command.add_argument("--quiet", action="store_true",
+                             help="only print the summary, the exit status tells if all lines are valid")
+        command.add_argument("--limit", action="append", metavar="NAME=VALUE",
+                             help="resource limit per line (depth, tokens, nodes or seconds), can be repeated")
+    for command in (validate, tokens, tree, stats):
+        command.add_argument("--store", metavar="PATH", help="reuse and keep results in this ParseStore file")
+    args = parser.parse_args(argv)
+    try:
+        limits = _parse_limits(args.limit)
+    except ValueError as e:
+        parser.error(str(e))
+
+    lines = _iter_input_lines(args.files)
+    store = None
+    if getattr(args, "store", None) is not None:
+        import parse_store
+        store = parse_store.ParseStore(args.store)
+    try:
+        if args.command == "associate":
+            worker = partial(_associated_results, association_type=args.association_type, minimal=args.minimal,
+                             limits=limits)
+            if args.jobs > 1:
+                import parallel_parse
+                results = (result for (_, result) in parallel_parse.map_lines_in_parallel(worker, lines, args.jobs))
+            else:
+                results = (result for l in lines for result in worker([l]))
+        else:
+            results = A1._batch_results(lines, args.jobs, args.command == "tree", store, limits)
+        if args.command == "stats":
+            return _command_stats(results, args)
+
+        if args.format == "jsonl":
+            sink = result_sinks.JsonLinesSink(sys.stdout)
+        elif args.command == "validate":
+            sink = result_sinks.ErrorSink()
+        else:
+            sink = result_sinks.TextSink(trees=args.command == "tree")
+        line_count = 0
+        valid_count = 0
+        for result in results:
+            line_count += 1
+            valid_count += result.code == 0
+            if not args.quiet:
+                sink.write(result)
+        if args.format == "text" and args.command != "tree":
+            sink.summary(line_count, valid_count)
+        sink.flush()
+    finally:
+        if store is not None:
+            store.close()
+    return 0 if valid_count == line_count else 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except BrokenPipeError:
+        # the reader of a pipeline went away, e.g. head
+        sys.stdout = None
+        sys.exit(1)
@@ -0,0 +1,295 @@
+"""
+Per phase profiling of the A1 pipeline.
+
+profiling() installs a Profiler as A1._profiler for the length of a with block.
+Every phase of the pipeline (validate, lex, parse, associate, build_tree,
+print_tree) checks that global and, while a profiler is installed, reports the
+time it took and how much input it went through. A MemoryProfiler also traces
+memory with tracemalloc and keeps the lines with the highest peak.
+"""
+import heapq
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Iterator, List
+
+import A1
+
+
+class PhaseStats:
+    """
+    What one phase of the pipeline did while profiling
+    Attributes:
+        calls: number of times the phase ran
+        seconds: total wall time spent in it
+        chars: total characters of input it processed
+        tokens: total tokens it processed
+        max_depth: deepest nesting it reached
+    """
+    __slots__ = ("calls", "seconds", "chars", "tokens", "max_depth")
+
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self.chars = 0
+        self.tokens = 0
+        self.max_depth = 0
+
+    def as_tuple(self) -> tuple:
+        return (self.calls, self.seconds, self.chars, self.tokens, self.max_depth)
+
+
+class Profiler:
+    """
+    Collects PhaseStats for each phase (validate, lex, parse, associate, build_tree,
+    print_tree) while installed with profiling()
+    Attributes:
+        phases: the stats of each phase by name, in the order they first ran
+        callback: if not None, called as callback(phase, seconds, chars, tokens, depth) every time a phase ends
+    """
+    def __init__(self, callback=None):
+        self.phases = {}
+        self.callback = callback
+
+    def start(self, phase: str) -> float:
+        """
+        Called when a phase starts
+        :return: the perf_counter() time it started at, to pass the seconds it took to record()
+        """
+        return perf_counter()
+
+    def record_line(self, line: str, tokens: int) -> None:
+        """
+        Called by A1.parse_line() when a line is done, after start("line")
+        """
+
+    def record(self, phase: str, seconds: float, chars: int = 0, tokens: int = 0, depth: int = 0) -> None:
+        stats = self.phases.get(phase)
+        if stats is None:
+            stats = self.phases[phase] = PhaseStats()
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.chars += chars
+        stats.tokens += tokens
+        if depth > stats.max_depth:
+            stats.max_depth = depth
+        if self.callback is not None:
+            self.callback(phase, seconds, chars, tokens, depth)
+
+    def export(self):
+        """
+        :return: the stats in a form merge() takes, for sending from a worker process
+        """
+        return {phase: stats.as_tuple() for (phase, stats) in self.phases.items()}
+
+    def merge(self, phases: dict) -> None:
+        """
+        Adds in stats collected elsewhere (by a worker process)
+        :param phases: PhaseStats.as_tuple() of each phase by name, see export()
+        """
+        for (phase, (calls, seconds, chars, tokens, max_depth)) in phases.items():
+            stats = self.phases.get(phase)
+            if stats is None:
+                stats = self.phases[phase] = PhaseStats()
+            stats.calls += calls
+            stats.seconds += seconds
+            stats.chars += chars
+            stats.tokens += tokens
+            stats.max_depth = max(stats.max_depth, max_depth)
+
+    def report(self) -> str:
+        """
+        :return: a table of the stats of each phase
+        """
+        lines = [f"{'phase':<12}{'calls':>10}{'seconds':>12}{'chars':>14}{'tokens':>14}{'max depth':>11}"]
+        for (phase, stats) in self.phases.items():
+            lines.append(f"{phase:<12}{stats.calls:>10}{stats.seconds:>12.6f}{stats.chars:>14}"
+                         f"{stats.tokens:>14}{stats.max_depth:>11}")
+        return "\n".join(lines)
+
+
+class PhaseMemory:
+    """
+    Memory used by one phase (or by whole lines, as the phase "line") while profiling memory
+    Attributes:
+        calls: number of times the phase ran
+        peak_bytes: the highest peak of one call, counted from what was allocated when it started
+        total_peak_bytes: the peaks of all calls added up
+        tokens: total tokens the calls processed
+        blocks: memory blocks the calls left allocated (sys.getallocatedblocks()), net of those they freed
+    """
+    __slots__ = ("calls", "peak_bytes", "total_peak_bytes", "tokens", "blocks")
+
+    def __init__(self):
+        self.calls = 0
+        self.peak_bytes = 0
+        self.total_peak_bytes = 0
+        self.tokens = 0
+        self.blocks = 0
+
+    @property
+    def bytes_per_token(self) -> float:
+        return self.total_peak_bytes / self.tokens if self.tokens else 0.0
+
+    def as_tuple(self) -> tuple:
+        return (self.calls, self.peak_bytes, self.total_peak_bytes, self.tokens, self.blocks)
+
+
+class MemoryProfiler(Profiler):
+    """
+    A Profiler that also traces memory with tracemalloc: the peak bytes and the blocks
+    left allocated by every phase, and by every line parse_line() parsed
+    Attributes:
+        memory: the PhaseMemory of each phase by name
+        worst_lines: how many lines to keep in lines
+        lines: (peak bytes, tokens, line) of the worst_lines lines with the highest peak,
+        as a heap, see worst()
+    """
+    def __init__(self, callback=None, worst_lines: int = 10):
+        super().__init__(callback)
+        self.memory = {}
+        self.worst_lines = worst_lines
+        self.lines = []
+        # the phases running, innermost last, as [phase, bytes and blocks allocated
+        # when it started, highest peak of the phases it ran]
+        self._frames = []
+
+    def start(self, phase: str) -> float:
+        frames = self._frames
+        # a frame of the same phase was left by a call that raised
+        frames[:] = [frame for frame in frames if frame[0] != phase]
+        (current, peak) = tracemalloc.get_traced_memory()
+        if frames and peak > frames[-1][3]:
+            frames[-1][3] = peak
+        tracemalloc.reset_peak()
+        frames.append([phase, current, sys.getallocatedblocks(), 0])
+        return perf_counter()
+
+    def _finish(self, phase: str, tokens: int) -> int:
+        """
+        :return: the peak bytes of the phase ending now
+        """
+        (_, peak) = tracemalloc.get_traced_memory()
+        blocks = sys.getallocatedblocks()
+        frames = self._frames
+        while frames:
+            frame = frames.pop()
+            if frame[0] == phase:
+                break
+        else:
+            return 0  # not started with start()
+        peak = max(peak, frame[3])
+        if frames and peak > frames[-1][3]:
+            frames[-1][3] = peak
+        peak -= frame[1]
+
+        stats = self.memory.get(phase)
+        if stats is None:
+            stats = self.memory[phase] = PhaseMemory()
+        stats.calls += 1
+        stats.peak_bytes = max(stats.peak_bytes, peak)
+        stats.total_peak_bytes += peak
+        stats.tokens += tokens
+        stats.blocks += blocks - frame[2]
+        return peak
+
+    def record(self, phase: str, seconds: float, chars: int = 0, tokens: int = 0, depth: int = 0) -> None:
+        super().record(phase, seconds, chars, tokens, depth)
+        self._finish(phase, tokens)
+
+    def record_line(self, line: str, tokens: int) -> None:
+        self._keep_line((self._finish("line", tokens), tokens, line))
+
+    def _keep_line(self, entry: tuple) -> None:
+        if len(self.lines) < self.worst_lines:
+            heapq.heappush(self.lines, entry)
+        elif entry > self.lines[0]:
+            heapq.heapreplace(self.lines, entry)
+
+    def worst(self) -> List[tuple]:
+        """
+        :return: the (peak bytes, tokens, line) of the lines with the highest peak, highest first
+        """
+        return sorted(self.lines, reverse=True)
+
+    def export(self) -> tuple:
+        return (super().export(), {phase: stats.as_tuple() for (phase, stats) in self.memory.items()}, self.lines)
+
+    def merge(self, exported) -> None:
+        """
+        :param exported: what export() of a MemoryProfiler returned
+        """
+        (phases, memory, lines) = exported
+        super().merge(phases)
+        for (phase, (calls, peak_bytes, total_peak_bytes, tokens, blocks)) in memory.items():
+            stats = self.memory.get(phase)
+            if stats is None:
+                stats = self.memory[phase] = PhaseMemory()
+            stats.calls += calls
+            stats.peak_bytes = max(stats.peak_bytes, peak_bytes)
+            stats.total_peak_bytes += total_peak_bytes
+            stats.tokens += tokens
+            stats.blocks += blocks
+        for entry in lines:
+            self._keep_line(entry)
+
+    def report(self) -> str:
+        """
+        :return: the table of Profiler.report(), a table of the memory used by each phase
+        and the lines with the highest peak
+        """
+        lines = [super().report(), "",
+                 f"{'phase':<12}{'calls':>10}{'peak bytes':>14}{'mean peak':>14}{'bytes/token':>13}{'blocks':>12}"]
+        for (phase, stats) in self.memory.items():
+            lines.append(f"{phase:<12}{stats.calls:>10}{stats.peak_bytes:>14}"
+                         f"{stats.total_peak_bytes // stats.calls:>14}{stats.bytes_per_token:>13.1f}{stats.blocks:>12}")
+        if self.lines:
+            lines.append("")
+            lines.append(f"{'peak bytes':>14}{'tokens':>10}  line")
+            for (peak, tokens, line) in self.worst():
+                shown = line if len(line) <= 60 else line[:57] + "..."
+                lines.append(f"{peak:>14}{tokens:>10}  {shown}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def profiling(callback=None, memory: bool = False, worst_lines: int = 10) -> Iterator[Profiler]:
+    """
+    Records per phase statistics of everything parsed inside the with block.
+    When not profiling, the pipeline only pays for a check of the A1._profiler global.
+    Example:
+        with profiling() as profiler:
+            A1.read_lines_from_txt_check_validity(fp)
+        print(profiler.phases["parse"].seconds)
+    :param callback: see Profiler.callback
+    :param memory: also trace memory, with a MemoryProfiler. Tracing makes every allocation
+    slower, so the times are higher than without it.
+    :param worst_lines: with memory, how many of the lines with the highest peak to keep
+    """
+    previous = A1._profiler
+    started_tracing = False
+    if memory:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+        profiler = MemoryProfiler(callback, worst_lines)
+    else:
+        profiler = Profiler(callback)
+    A1._profiler = profiler
+    try:
+        yield profiler
+    finally:
+        A1._profiler = previous
+        if started_tracing:
+            tracemalloc.stop()
+
+
+def run_profiled(worker, lines: List[str], memory: bool = False, worst_lines: int = 10) -> tuple:
+    """
+    Runs a batch worker (see parallel_parse.map_lines_in_parallel) with profiling on, in a worker process
+    :return: (the worker's results, the export() of the profiler)
+    """
+    with profiling(memory=memory, worst_lines=worst_lines) as profiler:
+        results = worker(lines)
+    return (results, profiler.export())
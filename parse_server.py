@@ -0,0 +1,314 @@
+"""
+Line protocol parsing service for A1, so other programs can parse expressions
+without starting a Python process each time.
+
+Clients connect over TCP or a Unix socket and send one expression per line. Each
+line is answered, in order, by one line of JSON with the fields of
+result_sinks.result_record (validity, error code, offset and message, tokens, and
+the tree in tree mode). The line "#stats" is answered with the server's counters
+and latency percentiles instead.
+
+Lines from all connections are queued and parsed in batches, either in the event
+loop or in a pool of worker processes. At most max_in_flight lines are queued or
+being parsed at once, after that connections are not read from until some finish.
+
+Usage: python parse_server.py [--host 127.0.0.1] [--port 8765 | --unix PATH] [--mode tokens|tree] [--jobs N]
+"""
+import argparse
+import asyncio
+import json
+import math
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from time import perf_counter
+from typing import List, Optional
+
+import A1
+import result_sinks
+
+MODES = ("tokens", "tree")
+STATS_REQUEST = "#stats"
+
+
+def _parse_chunk(lines: List[str], trees: bool) -> List[A1.LineResult]:
+    """
+    Worker side of ParseServer
+    """
+    return [A1.parse_line(l, trees) for l in lines]
+
+
+def percentile(sorted_values: List[float], fraction: float) -> float:
+    """
+    :param sorted_values: the values, in increasing order
+    :param fraction: between 0 and 1, e.g. 0.99 for the 99th percentile
+    :return: the nearest rank percentile, 0.0 if there are no values
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)), 1)
+    return sorted_values[rank - 1]
+
+
+class ParseServer:
+    """
+    Attributes:
+        mode: "tokens" or "tree", what the answers hold
+        jobs: number of worker processes, 1 parses in the event loop
+        batch_size: the most lines parsed in one batch
+        batch_delay: seconds to wait for more lines before parsing a batch that is not full
+        max_in_flight: the most lines queued or being parsed at once
+        max_line: the longest line accepted, in bytes
+        requests: lines answered so far
+        batches: batches parsed so far
+        in_flight: lines queued or being parsed now
+        latencies: seconds from receiving to answering each of the most recent lines
+    """
+    def __init__(self, mode: str = "tokens", jobs: int = 1, batch_size: int = 256, batch_delay: float = 0.0,
+                 max_in_flight: int = 4096, max_line: int = 1 << 20, latency_window: int = 10000):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {MODES}, not {mode!r}")
+        self.mode = mode
+        self.jobs = jobs
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.max_in_flight = max_in_flight
+        self.max_line = max_line
+        self.requests = 0
+        self.batches = 0
+        self.in_flight = 0
+        self.latencies = deque(maxlen=latency_window)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+        self._queue = None
+        self._slots = None
+        self._batcher = None
+        self._pool = None
+        self._servers = []
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        """
+        :param port: 0 picks a free port, see the returned server's sockets for it
+        """
+        self._start()
+        server = await asyncio.start_server(self._handle, host, port, limit=self.max_line)
+        self._servers.append(server)
+        return server
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        self._start()
+        server = await asyncio.start_unix_server(self._handle, path, limit=self.max_line)
+        self._servers.append(server)
+        return server
+
+    def _start(self) -> None:
+        if self._queue is not None:
+            return
+        self._queue = asyncio.Queue()
+        self._slots = asyncio.Semaphore(self.max_in_flight)
+        if self.jobs > 1:
+            self._pool = ProcessPoolExecutor(self.jobs)
+        self._batcher = asyncio.ensure_future(self._run_batcher())
+
+    async def close(self) -> None:
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers.clear()
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+        self._queue = None
+
+    def stats(self) -> dict:
+        """
+        :return: the counters, and the latency percentiles in milliseconds over the recent lines
+        """
+        latencies = sorted(self.latencies)
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "in_flight": self.in_flight,
+            "latency_ms": {name: 1000 * percentile(latencies, fraction)
+                           for (name, fraction) in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99), ("max", 1.0))},
+        }
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        loop = asyncio.get_running_loop()
+        # answers in the order of the lines, each (receive time, future of the encoded answer)
+        answers = asyncio.Queue()
+        write_task = asyncio.ensure_future(self._write_answers(answers, writer))
+        try:
+            while True:
+                try:
+                    data = await reader.readline()
+                except ValueError:
+                    future = loop.create_future()
+                    future.set_result(self._encode({"error": f"line longer than {self.max_line} bytes"}))
+                    await answers.put((perf_counter(), future, False))
+                    break
+                if not data:
+                    break
+                received = perf_counter()
+                line = data.decode(errors="replace").rstrip()
+                future = loop.create_future()
+                if line == STATS_REQUEST:
+                    future.set_result(self._encode(self.stats()))
+                    await answers.put((received, future, False))
+                    continue
+                await self._slots.acquire()
+                self.in_flight += 1
+                await self._queue.put((line, future))
+                await answers.put((received, future, True))
+        except ConnectionError:
+            pass
+        finally:
+            await answers.put(None)
+            await write_task
+
+    async def _write_answers(self, answers: asyncio.Queue, writer: asyncio.StreamWriter) -> None:
+        broken = False
+        while True:
+            item = await answers.get()
+            if item is None:
+                break
+            (received, future, counted) = item
+            data = await future
+            if counted:
+                self._slots.release()
+                self.in_flight -= 1
+                self.requests += 1
+                self.latencies.append(perf_counter() - received)
+            if broken:
+                continue
+            writer.write(data)
+            if answers.empty():
+                try:
+                    await writer.drain()
+                except ConnectionError:
+                    broken = True
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+    def _encode(self, record: dict) -> bytes:
+        return (self._encoder.encode(record) + "\n").encode()
+
+    async def _run_batcher(self) -> None:
+        loop = asyncio.get_running_loop()
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            deadline = loop.time() + self.batch_delay
+            while len(batch) < self.batch_size:
+                if not queue.empty():
+                    batch.append(queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batches += 1
+            lines = [line for (line, _) in batch]
+            if self._pool is None:
+                try:
+                    results = _parse_chunk(lines, self.mode == "tree")
+                except Exception as e:
+                    results = e
+                self._set_answers(batch, results)
+            else:
+                # several batches may be in the pool at once, max_in_flight bounds them
+                asyncio.ensure_future(self._run_batch_in_pool(batch, lines))
+
+    async def _run_batch_in_pool(self, batch: list, lines: List[str]) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._pool, _parse_chunk, lines, self.mode == "tree")
+        except Exception as e:
+            results = e
+        self._set_answers(batch, results)
+
+    def _set_answers(self, batch: list, results) -> None:
+        """
+        :param results: the LineResult of every line of batch, or the exception parsing them raised
+        """
+        if isinstance(results, Exception):
+            answers = [self._encode({"error": f"parsing failed: {results!r}"})] * len(batch)
+        else:
+            answers = [self._encode(result_sinks.result_record(result)) for result in results]
+        for ((_, future), answer) in zip(batch, answers):
+            future.set_result(answer)
+
+
+async def parse_remote(lines: List[str], host: str = "127.0.0.1", port: int = 8765,
+                       unix: Optional[str] = None) -> List[dict]:
+    """
+    Client for a ParseServer: sends the lines over one connection
+    :return: the decoded answer to each line, in order
+    """
+    if unix is not None:
+        (reader, writer) = await asyncio.open_unix_connection(unix, limit=1 << 30)
+    else:
+        (reader, writer) = await asyncio.open_connection(host, port, limit=1 << 30)
+
+    async def send():
+        for line in lines:
+            writer.write(line.encode() + b"\n")
+            await writer.drain()
+        writer.write_eof()
+
+    sender = asyncio.ensure_future(send())
+    answers = [json.loads(await reader.readline()) for _ in lines]
+    await sender
+    writer.close()
+    await writer.wait_closed()
+    return answers
+
+
+async def _serve(args: argparse.Namespace) -> None:
+    server = ParseServer(args.mode, args.jobs, args.batch_size, args.batch_delay, args.max_in_flight)
+    if args.unix:
+        listening = await server.start_unix(args.unix)
+    else:
+        listening = await server.start_tcp(args.host, args.port)
+    names = ", ".join(str(sock.getsockname()) for sock in listening.sockets)
+    print(f"Parsing {args.mode} on {names}", flush=True)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        print(json.dumps(server.stats()))
+        await server.close()
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve the A1 parser over a newline delimited JSON protocol.")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on")
+    parser.add_argument("--port", type=int, default=8765, help="TCP port to listen on, 0 for any free port")
+    parser.add_argument("--unix", help="listen on this Unix socket path instead of TCP")
+    parser.add_argument("--mode", choices=MODES, default="tokens", help="answer with the tokens or also the tree")
+    parser.add_argument("--jobs", type=int, default=1, help="worker processes, 1 parses in the server process")
+    parser.add_argument("--batch-size", type=int, default=256, help="the most lines parsed together")
+    parser.add_argument("--batch-delay", type=float, default=0.0,
+                        help="seconds to wait for more lines to fill a batch")
+    parser.add_argument("--max-in-flight", type=int, default=4096, help="the most lines queued or being parsed")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(_serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,263 @@
+"""
+Persistent store of parse results.
+
+A ParseStore keeps the LineResult of every line it was given in one file, filed
+under a hash of the line, so that lines seen in an earlier run are not parsed
+again. Records hold the tokens and the arrays of the compact parse tree in a
+fixed binary layout that is read straight from a memory map: looking a line up
+reads one header and builds no nodes.
+"""
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Iterator, Optional
+
+import A1
+
+
+# Record format of a ParseStore file: _STORE_MAGIC, then per record a _store_header of
+# (key, payload bytes, error code, error offset, token count, names bytes, node count)
+# followed by the payload, all little endian and every part padded to 4 bytes:
+#   token kinds (int8), token ids (uint32, below A1.TOK_VAR the punctuation, A1.TOK_VAR + i
+#   the i-th name), the variable names joined by NUL bytes, node kinds (int8), and the
+#   node starts, ends, first children and next siblings (int32), see A1.CompactParseTree.
+# Errors have no payload. A record with no nodes was stored without its tree.
+_STORE_MAGIC = b"A1PS\x01\x00\x00\x00"
+_store_header = struct.Struct("<16sIBxxxIIII")
+
+
+def _pad4(size: int) -> int:
+    return -size % 4
+
+
+def _little_endian(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def line_key(line: str) -> bytes:
+    """
+    :return: the content hash a ParseStore files the result of line under
+    """
+    return hashlib.blake2b(line.encode(), digest_size=16).digest()
+
+
+def dump_line_result(result: A1.LineResult) -> bytes:
+    """
+    :return: result as a ParseStore record, with its tree if it has one
+    """
+    key = line_key(result.line)
+    if result.code:
+        return _store_header.pack(key, 0, result.code, result.offset, 0, 0, 0)
+
+    name_ids = dict(A1._punctuation_ids)
+    names = []
+    kinds = array("b")
+    ids = array("I")
+    for token in result.tokens:
+        name_id = name_ids.get(token)
+        if name_id is None:
+            name_id = name_ids[token] = A1.TOK_VAR + len(names)
+            names.append(token)
+        ids.append(name_id)
+        kinds.append(name_id if name_id < A1.TOK_VAR else A1.TOK_VAR)
+    names = "\0".join(names).encode()
+    parts = [b"", kinds.tobytes(), bytes(_pad4(len(kinds))), _little_endian(ids), names, bytes(_pad4(len(names)))]
+
+    tree = result.tree
+    node_count = 0
+    if tree is not None:
+        if not isinstance(tree, A1.CompactParseTree):
+            tree = A1.build_parse_tree(result.tokens, compact=True)
+        node_count = len(tree)
+        parts.append(tree.kinds.tobytes())
+        parts.append(bytes(_pad4(node_count)))
+        for values in (tree.starts, tree.ends, tree.first_child, tree.next_sibling):
+            parts.append(_little_endian(array("i", values)))
+
+    payload_size = sum(map(len, parts))
+    parts[0] = _store_header.pack(key, payload_size, 0, 0, len(ids), len(names), node_count)
+    return b"".join(parts)
+
+
+def load_line_result(line: str, record: memoryview, with_tree: bool = True) -> A1.LineResult:
+    """
+    Reads a record written by dump_line_result(). The tree's arrays are views of the
+    record, so nothing is copied or decoded per node.
+    :param line: the line the record is for
+    :param record: the record, starting at its header
+    :param with_tree: also load the tree, if the record has one
+    """
+    (_, _, code, offset, token_count, names_size, node_count) = _store_header.unpack_from(record)
+    if code:
+        return A1.LineResult(line, code, offset, A1._syntax_issue(line, code, offset).message, None)
+
+    at = _store_header.size + token_count + _pad4(token_count)
+    ids = record[at:at + 4 * token_count].cast("I")
+    if sys.byteorder == "big":
+        ids = array("I", ids)
+        ids.byteswap()
+    at += 4 * token_count
+    names = ["\\", "(", ")"]
+    if names_size:
+        names += bytes(record[at:at + names_size]).decode().split("\0")
+    at += names_size + _pad4(names_size)
+    tokens = tuple(map(names.__getitem__, ids))
+    if not with_tree or not node_count:
+        return A1.LineResult(line, 0, None, None, tokens)
+
+    arrays = [record[at:at + node_count].cast("b")]
+    at += node_count + _pad4(node_count)
+    for _ in range(4):
+        values = record[at:at + 4 * node_count].cast("i")
+        if sys.byteorder == "big":
+            values = array("i", values)
+            values.byteswap()
+        arrays.append(values)
+        at += 4 * node_count
+    return A1.LineResult(line, 0, None, None, tokens, A1.CompactParseTree.from_arrays(tokens, *arrays))
+
+
+def _answers_for_tree(record) -> bool:
+    """
+    :return: whether the record is an error or has a tree, a valid line stored without its tree does not
+    """
+    (_, _, code, _, _, _, node_count) = _store_header.unpack_from(record)
+    return code != 0 or node_count > 0
+
+
+class ParseStore:
+    """
+    Persistent cache of A1.LineResults in one file, keyed by the content hash of the
+    line (see line_key). Stored records are read through a memory map, opening the
+    store only reads the record headers. New results are kept in memory until
+    flush() or close() appends them to the file.
+    Attributes:
+        path: the file of the store
+        readonly: whether the store only answers lookups
+        hits: lookups answered from the store
+        misses: lookups the store had no answer for
+    """
+    def __init__(self, path: [str, os.PathLike], readonly: bool = False):
+        """
+        :param readonly: never write to the file, which then has to exist already
+        :raises ValueError: if the file exists but is not a ParseStore
+        """
+        self.path = path
+        self.readonly = readonly
+        self.hits = 0
+        self.misses = 0
+        self._index = {}
+        self._pending = {}
+        self._mapped = None
+        self._size = 0
+        if not readonly and not os.path.exists(path):
+            with open(path, "wb") as file:
+                file.write(_STORE_MAGIC)
+        self._load()
+
+    def _load(self) -> None:
+        """
+        Maps the file and indexes the records after the ones already indexed
+        """
+        with open(self.path, "rb") as file:
+            size = os.fstat(file.fileno()).st_size
+            if file.read(len(_STORE_MAGIC)) != _STORE_MAGIC:
+                raise ValueError(f"{self.path} is not a parse store")
+            if size == len(_STORE_MAGIC):
+                return
+            # earlier maps stay valid for as long as trees loaded from them are in use
+            self._mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(self._mapped)
+        at = max(self._size, len(_STORE_MAGIC))
+        header_size = _store_header.size
+        while at + header_size <= size:
+            (key, payload_size, *_) = _store_header.unpack_from(view, at)
+            end = at + header_size + payload_size
+            if end > size:
+                break  # cut short by a crash while appending
+            self._index[key] = view[at:end]
+            at = end
+        self._size = at
+
+    def __len__(self) -> int:
+        return len(self._index) + len(self._pending)
+
+    def __contains__(self, line: str) -> bool:
+        key = line_key(line)
+        return key in self._pending or key in self._index
+
+    def get(self, line: str, with_tree: bool = False) -> Optional[A1.LineResult]:
+        """
+        :param with_tree: only answer if the stored result has a tree (or is an error)
+        :return: the stored result of line, or None if it is not stored
+        """
+        key = line_key(line)
+        record = self._pending.get(key)
+        if record is None:
+            record = self._index.get(key)
+        if record is not None:
+            if not with_tree or _answers_for_tree(record):
+                self.hits += 1
+                return load_line_result(line, memoryview(record), with_tree)
+        self.misses += 1
+        return None
+
+    def put(self, result: A1.LineResult) -> None:
+        """
+        Stores result, replacing a stored result of the same line without a tree.
+        Results cut short by a limit are not stored, they depend on the limits and not only on the line.
+        """
+        if self.readonly:
+            raise ValueError(f"{self.path} was opened read only")
+        if result.limit_exceeded:
+            return
+        key = line_key(result.line)
+        stored = self._pending.get(key)
+        if stored is None:
+            stored = self._index.get(key)
+        if stored is not None and (result.tree is None or _answers_for_tree(stored)):
+            return
+        self._pending[key] = dump_line_result(result)
+
+    def results(self, lines: Iterator[str], with_tree: bool = False,
+                limits: Optional[A1.Limits] = None) -> Iterator[A1.LineResult]:
+        """
+        :return: iterator over the result of every line, from the store if it is there,
+        otherwise parsed (within limits) and added to the store
+        """
+        for l in lines:
+            result = self.get(l, with_tree)
+            if result is None:
+                result = A1.parse_line(l, with_tree, limits)
+                self.put(result)
+            yield result
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        with open(self.path, "r+b") as file:
+            # drop a record cut short by a crash, it would swallow the ones after it
+            file.truncate(max(self._size, len(_STORE_MAGIC)))
+            file.seek(0, os.SEEK_END)
+            file.write(b"".join(self._pending.values()))
+        self._pending.clear()
+        self._load()
+
+    def close(self) -> None:
+        if not self.readonly:
+            self.flush()
+        self._index.clear()
+        self._mapped = None
+
+    def __enter__(self) -> 'ParseStore':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
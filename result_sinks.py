@@ -0,0 +1,201 @@
+"""
+Output of the LineResults of a batch run.
+
+A ResultSink collects the output of buffer_size results at a time before writing
+it. TextSink prints what the assignment asks for (the error message or the tokens
+of each line, or its parse tree), ErrorSink only the invalid lines, JsonLinesSink
+one JSON object per line and BinarySink compact records that read_binary_results()
+reads back.
+"""
+import abc
+import json
+import os
+import struct
+import sys
+from array import array
+from time import perf_counter
+from typing import Iterator
+
+import A1
+
+
+class ResultSink(abc.ABC):
+    """
+    Destination of the A1.LineResults of a batch run (see A1.read_lines_from_txt_check_validity).
+    Output is collected and written to the file buffer_size results at a time, subclasses
+    give the output of each result by implementing encode().
+    Attributes:
+        file: the file written to
+        buffer_size: how many results are collected before they are written
+    """
+    def __init__(self, file, buffer_size: int = 1024):
+        self.file = file
+        self.buffer_size = buffer_size
+        self._parts = []
+        self._pending = 0
+
+    def write(self, result: A1.LineResult) -> None:
+        self._parts.append(self.encode(result))
+        self._pending += 1
+        if self._pending >= self.buffer_size:
+            self.flush()
+
+    @abc.abstractmethod
+    def encode(self, result: A1.LineResult):
+        """
+        :return: the output for one result, as the str or bytes the file takes
+        """
+
+    def summary(self, line_count: int, valid_count: int) -> None:
+        """
+        Called once at the end of a validity run, with the number of lines and of valid lines
+        """
+
+    def flush(self) -> None:
+        if self._parts:
+            self.file.write(self._parts[0][:0].join(self._parts))
+            self._parts.clear()
+            self._pending = 0
+        self.file.flush()
+
+    def __enter__(self) -> 'ResultSink':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.flush()
+
+
+class TextSink(ResultSink):
+    """
+    The human readable output: the error message of each invalid line, and the tokens
+    (or with trees=True, the parse tree) of each valid one
+    """
+    def __init__(self, file=None, trees: bool = False, buffer_size: int = 1024):
+        super().__init__(sys.stdout if file is None else file, buffer_size)
+        self.trees = trees
+
+    def encode(self, result: A1.LineResult) -> str:
+        if result.code:
+            return result.message + "\n"
+        if not self.trees:
+            return f"The tokenized string for input string {result.line} is {'_'.join(result.tokens)}\n"
+
+        profiler = A1._profiler
+        if profiler is not None:
+            start = profiler.start("print_tree")
+        text = "\n\n" + "\n".join(result.tree.iter_tree_lines()) + "\n"
+        if profiler is not None:
+            profiler.record("print_tree", perf_counter() - start)
+        return text
+
+    def summary(self, line_count: int, valid_count: int) -> None:
+        if valid_count == line_count:
+            self._parts.append(f"All lines are valid\n")
+        else:
+            self._parts.append(f"{valid_count} of {line_count} lines were correct\n")
+
+
+class ErrorSink(TextSink):
+    """
+    Only the invalid lines, each as its line number (counting from 1) and error message
+    """
+    def __init__(self, file=None, buffer_size: int = 1024):
+        super().__init__(file, False, buffer_size)
+        self.line_number = 0
+
+    def encode(self, result: A1.LineResult) -> str:
+        self.line_number += 1
+        if result.code:
+            return f"line {self.line_number}: {result.message}\n"
+        return ""
+
+
+def result_record(result: A1.LineResult) -> dict:
+    """
+    :return: the fields of result as a dict of JSON types, the tree (if any) as the
+    list of its nodes in print_tree() order, each as [level, tokens]
+    """
+    record = {"line": result.line, "valid": result.code == 0, "code": result.code,
+              "offset": result.offset, "message": result.message, "tokens": result.tokens}
+    if result.tree is not None:
+        record["tree"] = [(level, list(elem)) for (level, elem) in result.tree.iter_tree_labels()]
+    return record
+
+
+class JsonLinesSink(ResultSink):
+    """
+    One JSON object per line, see result_record()
+    """
+    def __init__(self, file, buffer_size: int = 1024):
+        super().__init__(file, buffer_size)
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def encode(self, result: A1.LineResult) -> str:
+        return self._encoder.encode(result_record(result)) + "\n"
+
+
+# BinarySink format: _BINARY_MAGIC, then per result a _binary_header of
+# (code, offset, line bytes, token count, names bytes), the line as UTF-8, the
+# token ids as little endian uint32 and the variable names joined by NUL bytes.
+# Ids below A1.TOK_VAR are the punctuation, A1.TOK_VAR + i is the i-th name.
+_BINARY_MAGIC = b"A1LR\x01"
+_binary_header = struct.Struct("<BIIII")
+
+
+class BinarySink(ResultSink):
+    """
+    Compact binary records, read back with read_binary_results(). Trees are not
+    stored, A1.build_parse_tree() rebuilds them from the tokens.
+    """
+    def __init__(self, file, buffer_size: int = 1024):
+        super().__init__(file, buffer_size)
+        self._parts.append(_BINARY_MAGIC)
+
+    def encode(self, result: A1.LineResult) -> bytes:
+        line = result.line.encode()
+        if result.code:
+            return _binary_header.pack(result.code, result.offset, len(line), 0, 0) + line
+
+        name_ids = dict(A1._punctuation_ids)
+        names = []
+        ids = array("I")
+        for token in result.tokens:
+            name_id = name_ids.get(token)
+            if name_id is None:
+                name_id = name_ids[token] = A1.TOK_VAR + len(names)
+                names.append(token)
+            ids.append(name_id)
+        if sys.byteorder == "big":
+            ids.byteswap()
+        names = "\0".join(names).encode()
+        return b"".join((_binary_header.pack(0, 0, len(line), len(ids), len(names)), line, ids.tobytes(), names))
+
+
+def read_binary_results(fp: [str, os.PathLike]) -> Iterator[A1.LineResult]:
+    """
+    :param fp: path of a file written by a BinarySink
+    :return: iterator over the results in the file, without trees
+    :raises ValueError: if the file was not written by a BinarySink
+    """
+    with open(fp, "rb") as file:
+        if file.read(len(_BINARY_MAGIC)) != _BINARY_MAGIC:
+            raise ValueError(f"{fp} is not a binary results file")
+        header_size = _binary_header.size
+        while True:
+            header = file.read(header_size)
+            if not header:
+                return
+            (code, offset, line_size, token_count, names_size) = _binary_header.unpack(header)
+            line = file.read(line_size).decode()
+            if code:
+                yield A1.LineResult(line, code, offset, A1._syntax_issue(line, code, offset).message, None)
+                continue
+
+            ids = array("I")
+            ids.frombytes(file.read(4 * token_count))
+            if sys.byteorder == "big":
+                ids.byteswap()
+            names = ["\\", "(", ")"]
+            if names_size:
+                names += file.read(names_size).decode().split("\0")
+            yield A1.LineResult(line, 0, None, None, tuple(map(names.__getitem__, ids)))
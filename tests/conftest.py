@@ -0,0 +1,5 @@
+import os
+import sys
+
+# the modules are scripts next to A1.py rather than an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
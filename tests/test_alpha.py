@@ -0,0 +1,45 @@
+import pytest
+
+import A1
+
+
+@pytest.mark.parametrize("first, second", [
+    ("\\x.x", "\\y.y"),
+    ("\\x.x y", "(\\z.(z) y)"),
+    ("\\x.\\y.x y", "\\a.\\b.a b"),
+    # an inner binder of the same name shadows the outer one
+    ("\\x.\\x.x", "\\a.\\b.b"),
+    ("(a b) c", "a b c"),
+])
+def test_alpha_equivalent(first, second):
+    assert A1.alpha_hash(first) == A1.alpha_hash(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    # free variables keep their names
+    ("\\x.y", "\\x.z"),
+    ("\\x.\\y.x", "\\x.\\y.y"),
+    ("a (b c)", "a b c"),
+    ("\\x.x y", "(\\x.x) y"),
+])
+def test_not_alpha_equivalent(first, second):
+    assert A1.alpha_hash(first) != A1.alpha_hash(second)
+
+
+def test_invalid_lines_have_no_hash():
+    for line in ("(a", "\\.x", "", "a)"):
+        assert A1.alpha_hash(line) is None
+    # a blake2b digest, the same between runs unlike hash()
+    assert A1.alpha_hash("\\x.x") == "64c90f85f903b71b69c1b04d231df0b1"
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_group_alpha_equivalent(tmp_path, capsys, jobs):
+    path = tmp_path / "lines.txt"
+    path.write_text("\\x.x\na b\n(a\n\\y.y\n\\z.z\n(a) (b)\nc\n")
+    classes = A1.read_lines_from_txt_group_alpha_equivalent(str(path), jobs=jobs)
+    assert [(c.representative, c.first_line, c.count) for c in classes.values()] == \
+           [("\\x.x", 1, 3), ("a b", 2, 2), ("c", 7, 1)]
+    assert capsys.readouterr().out == ("3 lines are alpha equivalent to line 1: \\x.x\n"
+                                       "2 lines are alpha equivalent to line 2: a b\n"
+                                       "6 valid lines in 3 classes, 1 invalid lines\n")
@@ -0,0 +1,45 @@
+import pytest
+
+import benchmark_parser
+
+
+@pytest.fixture
+def fake_timings(monkeypatch):
+    """
+    Replaces the phases of a line of size characters by functions returning their own
+    time, so the tests choose what each timing round measures
+    """
+    calls = []
+
+    def phases(s):
+        size = len(s)
+
+        def noisy():
+            calls.append(size)
+            # the first round at the largest size is a hundred times too slow
+            return 1e-6 * size * (100 if calls.count(size) == 1 and size == 2000 else 1)
+
+        return {"linear": lambda: 1e-6 * size, "noisy": noisy, "quadratic": lambda: 1e-9 * size ** 2}
+
+    monkeypatch.setattr(benchmark_parser, "SHAPES", {"line": lambda size: "a" * size})
+    monkeypatch.setattr(benchmark_parser, "_phases", phases)
+    monkeypatch.setattr(benchmark_parser, "time_phase", lambda run, repeat, min_time: run())
+    monkeypatch.setattr(benchmark_parser, "peak_memory", lambda run: 0)
+    return calls
+
+
+def test_only_phases_still_too_slow_when_timed_again_fail(fake_timings):
+    report = benchmark_parser.run_benchmarks([250, 500, 1000, 2000])
+    results = {result["phase"]: result for result in report["results"]}
+    assert (results["linear"]["ok"], results["linear"]["rechecked"]) == (True, False)
+    assert (results["noisy"]["ok"], results["noisy"]["rechecked"]) == (True, True)
+    assert results["noisy"]["exponent"] == pytest.approx(1.0)
+    assert fake_timings == [250, 500, 1000, 2000] * 2
+    assert (results["quadratic"]["ok"], results["quadratic"]["rechecked"]) == (False, True)
+
+
+def test_sizes_too_close_together(fake_timings):
+    with pytest.raises(ValueError):
+        benchmark_parser.run_benchmarks([1000, 2000])
+    with pytest.raises(SystemExit):
+        benchmark_parser.main(["--sizes", "1000", "1500", "2000"])
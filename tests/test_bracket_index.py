@@ -0,0 +1,32 @@
+import pytest
+
+import A1
+
+
+def test_partners_and_depths():
+    tokens = A1.parse_tokens("(a (b c)) \\x.x")
+    # ( a ( b c ) ) \ x ( x )
+    index = A1.BracketIndex(tokens)
+    assert list(index.partners) == [6, -1, 5, -1, -1, 2, 0, -1, -1, 11, -1, 9]
+    assert list(index.depths) == [0, 1, 1, 2, 2, 1, 0, 0, 0, 0, 1, 0]
+    assert index.max_depth == 2
+    assert A1.BracketIndex(["a"]).max_depth == 0
+
+
+@pytest.mark.parametrize("tokens", [["(", "a"], ["a", ")"], [")", "("]])
+def test_unbalanced(tokens):
+    with pytest.raises(ValueError):
+        A1.BracketIndex(tokens)
+
+
+def test_operand_starts():
+    tokens = A1.parse_tokens("a (b c) \\x x y")
+    # a ( b c ) \ x x y
+    index = A1.BracketIndex(tokens)
+    assert index.operand_starts() == [0, 1, 5]
+    # the inside of the brackets, and a range ending before the lambda
+    assert index.operand_starts(2, 4) == [2, 3]
+    assert index.operand_starts(0, 5) == [0, 1]
+    assert index.operand_starts(1, 5) == [1]
+    assert index.operand_starts(5) == [5]
+    assert index.operand_starts(3, 3) == []
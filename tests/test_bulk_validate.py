@@ -0,0 +1,61 @@
+import random
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import A1
+import bulk_validate
+
+
+def write_lines(lines: list, tmp_path) -> str:
+    path = tmp_path / "lines.txt"
+    path.write_bytes("\n".join(lines).encode())
+    return str(path)
+
+
+def bulk_results(lines: list, tmp_path, block_size: int = bulk_validate.BLOCK_SIZE) -> list:
+    return list(bulk_validate.bulk_line_results(write_lines(lines, tmp_path), block_size))
+
+
+def full_results(lines: list, tmp_path) -> list:
+    return [A1.parse_line(line) for line in A1.iter_lines_from_txt(write_lines(lines, tmp_path))]
+
+
+def assert_bulk_agrees(lines: list, tmp_path, block_size: int = bulk_validate.BLOCK_SIZE) -> None:
+    bulk = bulk_results(lines, tmp_path, block_size)
+    full = full_results(lines, tmp_path)
+    assert [result.line for result in bulk] == [result.line for result in full]
+    for (bulk_result, full_result) in zip(bulk, full):
+        # a line the bulk checks reject is rejected by the full checker too, possibly for another error
+        assert bulk_result.valid == full_result.valid, bulk_result.line
+        if bulk_result.valid:
+            assert bulk_result == full_result
+
+
+def test_control_characters_are_not_trailing_whitespace(tmp_path):
+    lines = ["a\x01", "a\x01 ", "\x01", "a \x00", "(a\x7f)", "a\x1b", "a\x08\t"]
+    assert_bulk_agrees(lines, tmp_path)
+    assert not any(result.valid for result in bulk_results(lines, tmp_path))
+
+
+def test_ascii_whitespace_is_trailing_whitespace(tmp_path):
+    lines = ["a\x0b", "a\x0c", "a\r", "a \x1c", "a\x1d\x1e\x1f", "(a b)\t \x0b", "\x1f"]
+    assert_bulk_agrees(lines, tmp_path)
+    assert [result.line for result in bulk_results(lines, tmp_path)] == ["a", "a", "a", "a", "a", "(a b)", ""]
+
+
+def test_non_ascii_trailing_whitespace(tmp_path):
+    lines = ["a ", "a 　", "é a", "(a )"]
+    assert_bulk_agrees(lines, tmp_path)
+    assert [result.line for result in bulk_results(lines, tmp_path)][:2] == ["a", "a"]
+
+
+def test_random_lines_agree_with_the_full_checker(tmp_path):
+    rng = random.Random(21)
+    alphabet = "ab() .\\\\x\t\x01\x0b\x1c"
+    lines = ["".join(rng.choice(alphabet) for _ in range(rng.randrange(12))) for _ in range(3000)]
+    lines += ["(a b) c", "\\x.x y", "((a))", "\\x.(\\y.y) x"]
+    # small blocks also check lines split between blocks
+    assert_bulk_agrees(lines, tmp_path, block_size=256)
+    assert any(result.valid for result in bulk_results(lines, tmp_path))
@@ -0,0 +1,43 @@
+import json
+
+import pytest
+
+from parse_cli import main
+
+
+@pytest.fixture
+def lines_file(tmp_path):
+    path = tmp_path / "lines.txt"
+    path.write_text("a b c\n\\x.x y\n(a\n")
+    return str(path)
+
+
+def test_associate(lines_file, capsys):
+    assert main(["associate", "left", lines_file]) == 1
+    out = capsys.readouterr().out.splitlines()
+    assert out[0] == "The tokenized string for input string a b c is (_(_a_b_)_c_)"
+    assert out[1] == "The tokenized string for input string \\x.x y is \\_x_(_x_y_)"
+    assert out[-1] == "2 of 3 lines were correct"
+
+
+def test_associate_minimal_in_processes(lines_file, capsys):
+    assert main(["associate", "--jobs", "2", "--minimal", "right", lines_file]) == 1
+    assert capsys.readouterr().out.splitlines()[0] == "The tokenized string for input string a b c is a_b_c"
+
+
+def test_store_is_only_taken_by_the_commands_using_it(lines_file, tmp_path, capsys):
+    store = str(tmp_path / "results.store")
+    assert main(["tokens", "--store", store, lines_file]) == 1
+    first = capsys.readouterr().out
+    assert main(["tokens", "--store", store, lines_file]) == 1
+    assert capsys.readouterr().out == first
+    with pytest.raises(SystemExit):
+        main(["associate", "left", "--store", store, lines_file])
+
+
+def test_stats(lines_file, capsys):
+    assert main(["stats", "--format", "jsonl", "--limit", "tokens=4", lines_file]) == 1
+    record = json.loads(capsys.readouterr().out)
+    assert {name: record[name] for name in ("lines", "valid", "invalid", "limit_exceeded")} == \
+           {"lines": 3, "valid": 1, "invalid": 2, "limit_exceeded": 1}
+    assert record["phases"]["validate"]["calls"] == 3
@@ -0,0 +1,100 @@
+import pytest
+
+import A1
+import lambda_eval
+
+TWO = "(\\f.\\x.f (f x))"
+OMEGA = "((\\x.x x) (\\x.x x))"
+
+
+def normal_source(s: str, strategy: str = "need") -> str:
+    result = lambda_eval.normalize(s, strategy, max_steps=10000)
+    assert result.status == "normal form"
+    return lambda_eval.to_source(result.normal_form)
+
+
+@pytest.mark.parametrize("strategy", lambda_eval.STRATEGIES)
+@pytest.mark.parametrize("s, normal_form", [
+    ("a b", "a b"),
+    ("(\\x.x) a", "a"),
+    (TWO + " " + TWO, "\\x.\\x1.x (x (x (x x1)))"),
+    # normal order reaches the normal form without reducing the argument that has none
+    ("(\\x.a) " + OMEGA, "a"),
+    ("\\y.(\\x.x) y", "\\y.y"),
+    ("(\\x.x x x) ((\\y.y) z)", "z z z"),
+    ("a ((\\x.x) b) c", "a b c"),
+])
+def test_normal_forms(strategy, s, normal_form):
+    assert normal_source(s, strategy) == normal_form
+
+
+def test_call_by_need_reduces_arguments_once():
+    s = "(\\x.x x x) ((\\y.y) z)"
+    normal = lambda_eval.normalize(s, "normal")
+    need = lambda_eval.normalize(s, "need")
+    assert normal.normal_form == need.normal_form
+    # one reduction for \x, then (\y.y) z for each of the three uses or only the first
+    assert (normal.steps, need.steps) == (4, 2)
+
+
+@pytest.mark.parametrize("strategy", lambda_eval.STRATEGIES)
+def test_step_limit(strategy):
+    result = lambda_eval.normalize(OMEGA, strategy, max_steps=100)
+    assert (result.normal_form, result.status, result.steps) == (None, "step limit", 100)
+    assert lambda_eval.normalize("(\\x.x) a", strategy, max_steps=1).status == "normal form"
+    assert lambda_eval.normalize("(\\x.x) ((\\x.x) a)", strategy, max_steps=1).status == "step limit"
+
+
+def test_time_limit():
+    result = lambda_eval.normalize(OMEGA, timeout=0.0)
+    assert (result.normal_form, result.status) == (None, "time limit")
+    # the clock is only read every _CLOCK_INTERVAL reductions
+    assert result.steps == lambda_eval._CLOCK_INTERVAL
+
+
+def test_to_source_avoids_capture():
+    # the bound y must not become the free y it is applied to
+    assert normal_source("(\\x.\\y.x) y") == "\\y1.y"
+    assert normal_source("(\\x.\\y.\\y1.x y1) y") == "\\y1.\\y11.y y11"
+    # a shadowing binder is renamed as well, so every name stands for one variable
+    assert normal_source("\\x.\\x.x") == "\\x.\\x1.x1"
+    assert normal_source("\\x.x (\\x.x)") == "\\x.x \\x1.x1"
+
+
+@pytest.mark.parametrize("s", [
+    "(\\x.\\y.x) y",
+    TWO + " " + TWO,
+    "\\f.(\\x.f (x x)) (\\x.f (x x)) a",
+    "a (\\x.x) (b c) \\y.y",
+    "(\\x.x) \\y.y",
+])
+def test_to_source_reads_back_the_same_term(s):
+    normal_form = lambda_eval.normalize(s, max_steps=1000).normal_form
+    if normal_form is None:
+        return
+    source = lambda_eval.to_source(normal_form)
+    assert A1.valid_syntax(source) == (True, "")
+    again = lambda_eval.normalize(source)
+    # already in normal form, and printed the same way again
+    assert again.steps == 0 and lambda_eval.to_source(again.normal_form) == source
+
+
+def test_deep_terms():
+    depth = 20000
+    s = "(\\y.y) " * 5 + "(" * depth + "\\x.x " + "a " * depth + ")" * depth
+    assert normal_source(s) == "\\x.x" + " a" * depth
+
+
+def test_invalid_input():
+    with pytest.raises(ValueError, match="brackets are mismatched"):
+        lambda_eval.normalize("(a")
+    with pytest.raises(ValueError):
+        lambda_eval.Machine("value")
+
+
+def test_main(capsys):
+    assert lambda_eval.main([TWO + " a b"]) == 0
+    assert capsys.readouterr().out.startswith("a (a b)\nnormal form: 2 reductions")
+    assert lambda_eval.main([OMEGA, "--max-steps", "10"]) == 2
+    assert capsys.readouterr().out.startswith("step limit: 10 reductions")
+    assert lambda_eval.main(["(a"]) == 1
@@ -0,0 +1,50 @@
+import pytest
+
+import A1
+
+
+def labels(tree: A1.ParseTree) -> list:
+    return [(level, list(elem)) for (level, elem) in tree.iter_tree_labels()]
+
+
+@pytest.mark.parametrize("s", ["a b c", "(a b) (\\x.x c)", "\\x.\\y.x y", "((a (b c)) d)", "a"])
+def test_same_tree_as_the_node_builder(s):
+    tokens = A1.parse_tokens(s)
+    tree = A1.build_parse_tree(tokens, lazy=True)
+    assert isinstance(tree, A1.LazyParseTree)
+    assert labels(tree) == labels(A1.build_parse_tree(tokens))
+    assert list(tree.iter_tree_lines()) == list(A1.build_parse_tree(tokens).iter_tree_lines())
+
+
+def test_children_built_when_asked_for():
+    tree = A1.build_parse_tree(A1.parse_tokens("(a b) (c d)"), lazy=True)
+    root = tree.root
+    assert root._children is None
+    (first, second) = root.children
+    # asked once, kept afterwards
+    assert root.children[0] is first
+    assert first._children is None and second._children is None
+    assert [list(child.elem) for child in first.children] == [["("], ["a", "b"], [")"]]
+    assert second._children is None
+    assert first.children[0].children == []
+
+
+def test_labels_are_ranges_of_the_tokens():
+    tokens = A1.parse_tokens("a (b c)")
+    tree = A1.build_parse_tree(tokens, lazy=True)
+    group = tree.root.children[1]
+    assert (group.start, group.end) == (1, 5)
+    assert group.elem.tokens is tokens
+    assert group.elem == ["(", "b", "c", ")"]
+
+
+def test_deep_nesting():
+    depth = 5000
+    tokens = ["("] * depth + ["a"] + [")"] * depth
+    tree = A1.build_parse_tree(tokens, lazy=True)
+    # only the path down to the innermost token is built
+    node = tree.root
+    for _ in range(depth):
+        node = node.children[0].children[1]
+    assert list(node.elem) == ["a"]
+    assert tree.root.children[0].children[2]._children is None
@@ -0,0 +1,52 @@
+import re
+
+import pytest
+
+import A1
+
+
+def test_tokens_and_offsets():
+    buf = A1.tokenize("(ab\tc) ab")
+    assert buf.to_list() == ["(", "ab", "c", ")", "ab"]
+    assert list(buf.kinds) == [A1.TOK_OPEN, A1.TOK_VAR, A1.TOK_VAR, A1.TOK_CLOSE, A1.TOK_VAR]
+    assert list(buf.offsets) == [0, 1, 4, 5, 7]
+    assert [buf.token(idx) for idx in range(len(buf))] == buf.to_list()
+    assert buf.source == "(ab\tc) ab"
+
+
+def test_names_are_interned():
+    buf = A1.tokenize("ab c ab")
+    # the punctuation first, then every name once in order of first appearance
+    assert buf.names == ["\\", "(", ")", "ab", "c"]
+    assert list(buf.ids) == [3, 4, 3]
+    assert buf.token(0) is buf.token(2)
+
+
+def test_dots_become_brackets():
+    # '(' at the dot and ')' right before the closing bracket or at the end of the input
+    buf = A1.tokenize("\\x.\\y.x y")
+    assert buf.to_list() == ["\\", "x", "(", "\\", "y", "(", "x", "y", ")", ")"]
+    assert list(buf.offsets) == [0, 1, 2, 3, 4, 5, 6, 8, 9, 9]
+    buf = A1.tokenize("\\x.(a \\y.b) c")
+    assert buf.to_list() == ["\\", "x", "(", "(", "a", "\\", "y", "(", "b", ")", ")", "c", ")"]
+    assert list(buf.offsets)[9:] == [10, 10, 12, 13]
+
+
+@pytest.mark.parametrize("s, message", [
+    ("a 1b", "SYNTAX ERROR: variables must start with a letter"),
+    ("a b1$", "SYNTAX ERROR: variables cannot contain the character '$'"),
+    ("(a", "SYNTAX ERROR: brackets are mismatched."),
+    ("a)", "SYNTAX ERROR: brackets are mismatched."),
+])
+def test_lexical_errors(s, message):
+    with pytest.raises(ValueError, match=re.escape(message)):
+        A1.tokenize(s)
+
+
+def test_buffer_from_tokens():
+    buf = A1.buffer_from_tokens(["\\", "x", "(", "x", "y", ")"])
+    assert buf.source is None
+    assert list(buf.kinds) == [A1.TOK_LAMBDA, A1.TOK_VAR, A1.TOK_OPEN, A1.TOK_VAR, A1.TOK_VAR, A1.TOK_CLOSE]
+    assert buf.names == ["\\", "(", ")", "x", "y"]
+    assert list(buf.offsets) == list(range(6))
+    assert buf.to_list() == A1.tokenize("\\x.x y").to_list()
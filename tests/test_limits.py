@@ -0,0 +1,110 @@
+import pytest
+
+import A1
+from A1 import Limits
+
+
+@pytest.fixture
+def parse_cache():
+    cache = A1.enable_parse_cache()
+    yield cache
+    A1.disable_parse_cache()
+
+
+def test_depth_limit_counts_brackets_dots_and_lambdas():
+    assert A1.parse_line("((a))", limits=Limits(max_depth=2)).code == 0
+    result = A1.parse_line("((a))", limits=Limits(max_depth=1))
+    assert (result.code, result.offset) == (A1.ERR_DEPTH_LIMIT, 1)
+    assert result.limit_exceeded and not result.valid
+    assert A1.parse_line("\\x.\\y.x", limits=Limits(max_depth=1)).code == A1.ERR_DEPTH_LIMIT
+
+
+def test_token_limit_counts_a_dot_as_two_brackets():
+    assert A1.parse_line("a b", limits=Limits(max_tokens=2)).code == 0
+    result = A1.parse_line("a b c", limits=Limits(max_tokens=2))
+    assert (result.code, result.offset) == (A1.ERR_TOKEN_LIMIT, 4)
+    assert A1.parse_line("a.b", limits=Limits(max_tokens=2)).code == A1.ERR_TOKEN_LIMIT
+
+
+def test_node_limit_applies_to_the_tree():
+    assert A1.parse_line("(a b) c", limits=Limits(max_nodes=3)).code == 0
+    result = A1.parse_line("(a b) c", build_tree=True, limits=Limits(max_nodes=3))
+    assert (result.code, result.offset, result.tree) == (A1.ERR_NODE_LIMIT, 7, None)
+    assert A1.parse_line("(a b) c", build_tree=True, limits=Limits(max_nodes=100)).tree is not None
+    with pytest.raises(A1.LimitExceeded):
+        A1.build_parse_tree(list("ab"), limits=Limits(max_nodes=2))
+
+
+def test_syntax_errors_come_before_limits():
+    result = A1.parse_line("(a", limits=Limits(max_depth=5))
+    assert result.code == A1.ERR_BRACKETS
+
+
+def test_time_limit(monkeypatch):
+    now = [0.0]
+
+    def slow_clock():
+        now[0] += 1.0
+        return now[0]
+
+    monkeypatch.setattr(A1, "process_time", slow_clock)
+    result = A1.parse_line("a b", limits=Limits(max_seconds=0.5))
+    assert result.code == A1.ERR_TIME_LIMIT
+    assert result.message.startswith("LIMIT EXCEEDED")
+
+
+def test_timed_out_line_is_parsed_again(monkeypatch, parse_cache):
+    limits = Limits(max_seconds=0.5)
+    now = [0.0]
+
+    def slow_clock():
+        now[0] += 1.0
+        return now[0]
+
+    monkeypatch.setattr(A1, "process_time", slow_clock)
+    assert A1.parse_line("a b", limits=limits).code == A1.ERR_TIME_LIMIT
+    monkeypatch.setattr(A1, "process_time", lambda: 0.0)
+    assert A1.parse_line("a b", limits=limits).code == 0
+    assert (parse_cache.hits, parse_cache.misses) == (0, 2)
+    # the result within the limits is cached
+    assert A1.parse_line("a b", limits=limits).code == 0
+    assert parse_cache.hits == 1
+
+
+def test_limit_results_are_not_cached(parse_cache):
+    limits = Limits(max_tokens=1)
+    assert A1.parse_line("a b", limits=limits).code == A1.ERR_TOKEN_LIMIT
+    assert len(parse_cache) == 0
+    assert A1.parse_line("a b").code == 0
+    assert len(parse_cache) == 1
+
+
+@pytest.mark.parametrize("options", [{}, {"compact": True}, {"shared": True}])
+def test_tree_builders_check_the_bracket_depth(options):
+    tokens = A1.parse_tokens("((a) \\x.(x))")
+    # ( ( a ) \ x ( ( x ) ) ), three pairs deep
+    assert A1.build_parse_tree(tokens, limits=Limits(max_depth=3), **options)
+    with pytest.raises(A1.LimitExceeded) as e:
+        A1.build_parse_tree(tokens, limits=Limits(max_depth=2), **options)
+    assert e.value.issue.code == A1.ERR_DEPTH_LIMIT
+
+
+@pytest.mark.parametrize("options", [{}, {"compact": True}, {"shared": True}])
+def test_tree_builders_read_the_clock_every_interval(monkeypatch, options):
+    tokens = A1.parse_tokens(" ".join(f"(a{n} b)" for n in range(2000)))
+    calls = []
+
+    def counting_clock():
+        calls.append(None)
+        return 0.0
+
+    monkeypatch.setattr(A1, "process_time", counting_clock)
+    A1.build_parse_tree(tokens, limits=Limits(max_seconds=1.0), deadline=1.0, **options)
+    # the root, then each group, its brackets, its inside and the two variables in it
+    nodes = 1 + 2000 * 6
+    assert len(calls) == nodes // A1._CLOCK_INTERVAL
+
+    monkeypatch.setattr(A1, "process_time", lambda: 2.0)
+    with pytest.raises(A1.LimitExceeded) as e:
+        A1.build_parse_tree(tokens, limits=Limits(max_seconds=1.0), deadline=1.0, **options)
+    assert e.value.issue.code == A1.ERR_TIME_LIMIT
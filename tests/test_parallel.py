@@ -0,0 +1,87 @@
+import random
+
+import pytest
+
+import A1
+import parallel_parse
+
+
+@pytest.fixture(autouse=True)
+def short_segments(monkeypatch):
+    # cut lines of a few tokens, long lines would make the tests slow
+    monkeypatch.setattr(parallel_parse, "_PARALLEL_MIN_SEGMENT", 4)
+
+
+def random_expression(rng: random.Random, depth: int = 0) -> str:
+    choice = rng.randrange(6 if depth < 4 else 2)
+    if choice < 2:
+        return rng.choice("abxy")
+    if choice < 4:
+        return "(" + random_expression(rng, depth + 1) + " " + random_expression(rng, depth + 1) + ")"
+    if choice == 4:
+        return "\\" + rng.choice("xy") + "." + random_expression(rng, depth + 1)
+    return "(" + random_expression(rng, depth + 1) + ")"
+
+
+def random_line(rng: random.Random, operands: int) -> str:
+    return " ".join(random_expression(rng) for _ in range(operands))
+
+
+def compact_arrays(tree: A1.CompactParseTree) -> tuple:
+    return tuple(list(values) for values in (tree.kinds, tree.starts, tree.ends, tree.first_child, tree.next_sibling))
+
+
+def test_cuts_fall_between_top_level_operands():
+    tokens = A1.parse_tokens("(a b) c (d (e f)) g \\x.x y")
+    # ( a b ) c ( d ( e f ) ) g \ x ( x y ), never before the lambda
+    assert parallel_parse._top_level_cuts(tokens, len(tokens)) == [0, 4, 5, 12]
+    assert parallel_parse._top_level_cuts(tokens, 8) == [0, 4, 12]
+    assert parallel_parse._top_level_cuts(A1.parse_tokens("\\x.a b c d e f g"), 4) is None
+    assert parallel_parse._top_level_cuts(tokens, 1) is None
+
+
+def test_string_cuts_fall_between_top_level_operands():
+    s = "(a b) c (d (e f)) g \\x.x y"
+    # the last cut is in the body of the lambda, tokens_or_error() parses the segments after it as one
+    assert parallel_parse._top_level_string_cuts(s, len(s)) == [0, 6, 8, 18, 25]
+    assert parallel_parse._top_level_string_cuts(s, 3) == [0, 8, 18]
+    # lambdas and unbalanced brackets
+    assert parallel_parse._top_level_string_cuts(" \\x.a b c d e f g", 4) is None
+    assert parallel_parse._top_level_string_cuts("(a b c d e f g)", 4) is None
+    assert parallel_parse._top_level_string_cuts("a b) c d e f (g", 4) is None
+    assert parallel_parse._top_level_string_cuts(s, 1) is None
+
+
+@pytest.mark.parametrize("association_type", [None, "left", "right"])
+def test_segments_after_a_top_level_lambda(association_type):
+    line = "a b c d e f \\x.x y z w v u t"
+    assert parallel_parse._has_top_level_lambda(line)
+    assert not parallel_parse._has_top_level_lambda("(\\x.x) (\\y y)")
+    assert A1.parse_tokens(line, association_type, jobs=2) == A1.parse_tokens(line, association_type)
+
+
+@pytest.mark.parametrize("association_type", [None, "left", "right"])
+def test_parallel_tokens_are_the_serial_tokens(association_type):
+    rng = random.Random(24)
+    lines = [random_line(rng, operands) for operands in (3, 8, 20)]
+    lines.append("a b c d e f \\x.x y z w v")
+    for line in lines:
+        assert A1.parse_tokens(line, association_type, jobs=2) == A1.parse_tokens(line, association_type)
+
+
+def test_parallel_tokens_of_invalid_lines(capsys):
+    for line in ("a b c d e f g (h", "a b c d e f g h)", "a b c d e f g \\.h", "a b c d e f g 1h"):
+        assert A1.parse_tokens(line, jobs=2) is False
+        parallel_message = capsys.readouterr().out
+        assert A1.parse_tokens(line) is False
+        assert parallel_message == capsys.readouterr().out
+
+
+def test_parallel_tree_is_the_serial_tree():
+    rng = random.Random(24)
+    for operands in (3, 8, 20):
+        tokens = A1.parse_tokens(random_line(rng, operands) + " \\x.x y")
+        serial = A1.build_parse_tree(tokens, compact=True)
+        parallel = A1.build_parse_tree(tokens, compact=True, jobs=2)
+        assert compact_arrays(parallel) == compact_arrays(serial)
+        assert list(parallel.iter_tree_labels()) == list(serial.iter_tree_labels())
@@ -0,0 +1,69 @@
+import pytest
+
+import A1
+
+
+@pytest.fixture
+def parse_cache():
+    cache = A1.enable_parse_cache(maxsize=3)
+    yield cache
+    A1.disable_parse_cache()
+
+
+def results(lines: list) -> list:
+    return [(A1.parse_tokens(s, association_type), A1.valid_syntax(s), A1.parse_line(s))
+            for s in lines for association_type in (None, "left", "right")]
+
+
+def test_cached_results_match(capsys):
+    lines = ["a b c", "\\x.x y", "(a", "", "1a", "a b c"]
+    expected = [(tokens if tokens is False else tuple(tokens), valid, line)
+                for (tokens, valid, line) in results(lines)]
+    printed = capsys.readouterr().out
+    cache = A1.enable_parse_cache()
+    try:
+        # computed, then from the cache
+        assert results(lines) == expected
+        assert results(lines) == expected
+        # parse_tokens() keyed on the 5 distinct lines and 3 association types,
+        # valid_syntax() and parse_line() on the lines only
+        assert cache.misses == 5 * 3 + 5 + 5
+        assert cache.hits + cache.misses == 2 * len(lines) * 3 * 3
+    finally:
+        A1.disable_parse_cache()
+    # the error messages are printed again for cached results
+    assert capsys.readouterr().out == printed * 2
+
+
+def test_errors_are_cached_and_printed_each_time(parse_cache, capsys):
+    assert A1.parse_tokens("(a") is False
+    assert A1.parse_tokens("(a") is False
+    assert capsys.readouterr().out == "SYNTAX ERROR: brackets are mismatched.\n" * 2
+    assert (parse_cache.hits, parse_cache.misses) == (1, 1)
+
+
+def test_keyed_on_the_association_type(parse_cache):
+    assert A1.parse_tokens("a b c") == ("a", "b", "c")
+    assert A1.parse_tokens("a b c", "left") == ("(", "(", "a", "b", ")", "c", ")")
+    assert A1.valid_syntax("a b c") == (True, "")
+    assert A1.parse_line("a b c").valid
+    assert (parse_cache.hits, parse_cache.misses, len(parse_cache)) == (0, 4, 3)
+
+
+def test_least_recently_used_is_evicted(parse_cache):
+    for s in ("a", "b", "c"):
+        A1.parse_tokens(s)
+    # "a" becomes the most recently used, so "b" is dropped for "d"
+    A1.parse_tokens("a")
+    A1.parse_tokens("d")
+    assert parse_cache.stats() == {"size": 3, "maxsize": 3, "hits": 1, "misses": 4, "evictions": 1}
+    A1.parse_tokens("a")
+    A1.parse_tokens("b")
+    assert (parse_cache.hits, parse_cache.misses) == (2, 5)
+    parse_cache.clear()
+    assert parse_cache.stats() == {"size": 0, "maxsize": 3, "hits": 0, "misses": 0, "evictions": 0}
+
+
+def test_maxsize_must_be_positive():
+    with pytest.raises(ValueError):
+        A1.ParseCache(0)
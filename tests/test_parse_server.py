@@ -0,0 +1,73 @@
+import asyncio
+import json
+
+import pytest
+
+import A1
+import parse_server
+import result_sinks
+
+LINES = ["a b c", "(a", "\\x.x y", "", "((a) (b))", "1a"]
+
+
+def expected_answers(lines: list, trees: bool) -> list:
+    # through JSON, which turns the tree's tuples into lists
+    return [json.loads(json.dumps(result_sinks.result_record(A1.parse_line(l, trees)))) for l in lines]
+
+
+def serve(requests, **options):
+    """
+    Starts a ParseServer on a free port, sends it each list of lines in requests over
+    its own connection, one connection after the other, and closes it
+    :return: the answers to each list of lines, and the server
+    """
+    async def run():
+        server = parse_server.ParseServer(**options)
+        listening = await server.start_tcp("127.0.0.1", 0)
+        port = listening.sockets[0].getsockname()[1]
+        try:
+            answers = [await parse_server.parse_remote(lines, port=port) for lines in requests]
+        finally:
+            await server.close()
+        return (answers, server)
+
+    return asyncio.run(run())
+
+
+def test_answers_in_order():
+    ([answers], server) = serve([LINES])
+    assert answers == expected_answers(LINES, trees=False)
+    assert [answer["valid"] for answer in answers] == [True, False, True, False, True, False]
+    assert server.requests == len(LINES) and server.in_flight == 0
+
+
+def test_trees_in_worker_processes():
+    lines = LINES * 20
+    ([answers], server) = serve([lines], mode="tree", jobs=2, batch_size=7, max_in_flight=16)
+    assert answers == expected_answers(lines, trees=True)
+    assert server.batches >= len(lines) // 7
+
+
+def test_stats_request():
+    ([first, second], _) = serve([LINES, ["a", parse_server.STATS_REQUEST]])
+    stats = second[1]
+    # the line before the request may not have been answered yet when the counters are read
+    assert stats["requests"] in (len(LINES), len(LINES) + 1)
+    assert set(stats["latency_ms"]) == {"p50", "p90", "p99", "max"}
+    assert 0 <= stats["latency_ms"]["p50"] <= stats["latency_ms"]["max"]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError):
+        parse_server.ParseServer(mode="labels")
+
+
+def test_percentile():
+    values = [1.0, 2.0, 3.0, 4.0]
+    assert [parse_server.percentile(values, f) for f in (0.0, 0.5, 0.9, 1.0)] == [1.0, 2.0, 4.0, 4.0]
+    assert parse_server.percentile([], 0.5) == 0.0
+
+
+def test_line_too_long():
+    ([answers], _) = serve([["a " * 100]], max_line=64)
+    assert answers == [{"error": "line longer than 64 bytes"}]
@@ -0,0 +1,87 @@
+import pytest
+
+import A1
+import result_sinks
+from parse_store import ParseStore
+
+LINES = ["a", "(a b) c", "\\x.\\y.x y", "a (b (c d))", "(a", "\\x", "a.b", "long_name", ""]
+
+
+def labels(tree: A1.ParseTree) -> list:
+    return [(level, list(elem)) for (level, elem) in tree.iter_tree_labels()]
+
+
+def assert_same_result(loaded: A1.LineResult, parsed: A1.LineResult) -> None:
+    assert loaded[:5] == parsed[:5]
+    if parsed.tree is not None:
+        assert labels(loaded.tree) == labels(parsed.tree)
+
+
+@pytest.mark.parametrize("with_tree", [False, True])
+def test_store_round_trip(tmp_path, with_tree):
+    path = tmp_path / "results.store"
+    parsed = [A1.parse_line(line, build_tree=with_tree) for line in LINES]
+    with ParseStore(path) as store:
+        for result in parsed:
+            store.put(result)
+        # results not flushed yet are answered too
+        assert_same_result(store.get(LINES[1], with_tree), parsed[1])
+
+    with ParseStore(path, readonly=True) as store:
+        assert len(store) == len(LINES)
+        for result in parsed:
+            assert_same_result(store.get(result.line, with_tree), result)
+        assert store.get("not stored") is None
+        assert (store.hits, store.misses) == (len(LINES), 1)
+
+
+def test_tree_lookup_only_answers_with_a_tree(tmp_path):
+    with ParseStore(tmp_path / "results.store") as store:
+        store.put(A1.parse_line("a b"))
+        store.put(A1.parse_line("(a", build_tree=True))
+        assert store.get("a b", with_tree=True) is None
+        assert store.get("(a", with_tree=True).code == A1.ERR_BRACKETS
+        store.put(A1.parse_line("a b", build_tree=True))
+        assert labels(store.get("a b", with_tree=True).tree) == [(0, ["a", "b"]), (1, ["a"]), (1, ["b"])]
+
+
+def test_store_results_parse_only_new_lines(tmp_path):
+    path = tmp_path / "results.store"
+    with ParseStore(path) as store:
+        first = list(store.results(LINES[:4], with_tree=True))
+    with ParseStore(path) as store:
+        again = list(store.results(LINES, with_tree=True))
+        assert (store.hits, store.misses) == (4, len(LINES) - 4)
+    for (stored, result) in zip(again, first):
+        assert_same_result(stored, result)
+
+
+def test_limit_results_are_not_stored(tmp_path):
+    with ParseStore(tmp_path / "results.store") as store:
+        result = next(store.results(["a b c"], limits=A1.Limits(max_tokens=1)))
+        assert result.limit_exceeded
+        assert "a b c" not in store
+
+
+def test_not_a_store(tmp_path):
+    path = tmp_path / "other.txt"
+    path.write_bytes(b"a b\n")
+    with pytest.raises(ValueError):
+        ParseStore(path)
+
+
+def test_binary_sink_round_trip(tmp_path):
+    path = tmp_path / "results.bin"
+    parsed = [A1.parse_line(line) for line in LINES + ["\\x.é x"]]
+    with open(path, "wb") as file:
+        with result_sinks.BinarySink(file, buffer_size=3) as sink:
+            for result in parsed:
+                sink.write(result)
+    assert list(result_sinks.read_binary_results(path)) == parsed
+
+
+def test_binary_results_need_the_magic(tmp_path):
+    path = tmp_path / "results.bin"
+    path.write_bytes(b"A1PS")
+    with pytest.raises(ValueError):
+        list(result_sinks.read_binary_results(path))
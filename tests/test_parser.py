@@ -0,0 +1,81 @@
+import pytest
+
+import A1
+
+
+def emitted(s: str, emit, *args) -> str:
+    buf = A1.tokenize(s)
+    return " ".join(emit(A1.parse_token_buffer(buf), buf, *args))
+
+
+def test_terms():
+    buf = A1.tokenize("(a b) \\x.x c")
+    # ( a b ) \ x ( x c ), terms refer to token indices
+    var = lambda idx: (A1.TERM_VAR, idx)
+    assert A1.parse_token_buffer(buf) == (A1.TERM_APP, (
+        (A1.TERM_GROUP, 0, 3, (A1.TERM_APP, (var(1), var(2)))),
+        (A1.TERM_ABS, 4, (A1.TERM_GROUP, 6, 9, (A1.TERM_APP, (var(7), var(8))))),
+    ))
+    assert A1.parse_token_buffer(A1.tokenize("a")) == var(0)
+    # a range of the tokens, here the inside of the first brackets
+    assert A1.parse_token_buffer(buf, 1, 3) == (A1.TERM_APP, (var(1), var(2)))
+
+
+def test_deep_nesting_does_not_recurse():
+    depth = 100000
+    buf = A1.tokenize("(" * depth + "a" + ")" * depth)
+    term = A1.parse_token_buffer(buf)
+    assert term[:3] == (A1.TERM_GROUP, 0, 2 * depth)
+    assert A1.emit_tokens(term, buf, "left") == buf.to_list()
+
+
+@pytest.mark.parametrize("tokens, message", [
+    (["\\"], "SYNTAX ERROR: lambda expression syntax is incorrect."),
+    (["\\", "("], "SYNTAX ERROR: lambda expression syntax is incorrect."),
+    (["(", "a"], "SYNTAX ERROR: brackets are mismatched."),
+    (["a", ")"], "SYNTAX ERROR: brackets are mismatched."),
+    (["(", ")"], "SYNTAX ERROR: expression is missing."),
+    (["\\", "x", "(", ")"], "SYNTAX ERROR: expression is missing."),
+    ([], "SYNTAX ERROR: expression is missing."),
+])
+def test_malformed_token_lists(tokens, message, capsys):
+    with pytest.raises(ValueError) as e:
+        A1.parse_token_buffer(A1.buffer_from_tokens(tokens))
+    assert str(e.value) == message
+    assert A1.add_associativity(tokens, "left") is False
+    assert capsys.readouterr().out == message + "\n"
+
+
+@pytest.mark.parametrize("s, plain, left, right", [
+    ("a b c d", "a b c d", "( ( ( a b ) c ) d )", "( a ( b ( c d ) ) )"),
+    ("(a b c) d", "( a b c ) d", "( ( ( a b ) c ) d )", "( ( a ( b c ) ) d )"),
+    ("\\x.a b c", "\\ x ( a b c )", "\\ x ( ( a b ) c )", "\\ x ( a ( b c ) )"),
+    ("a \\x.x y", "a \\ x ( x y )", "( a \\ x ( x y ) )", "( a \\ x ( x y ) )"),
+    ("((a b))", "( ( a b ) )", "( ( a b ) )", "( ( a b ) )"),
+])
+def test_emit_tokens(s, plain, left, right):
+    assert emitted(s, A1.emit_tokens) == plain == " ".join(A1.parse_tokens(s))
+    assert emitted(s, A1.emit_tokens, "left") == left == " ".join(A1.parse_tokens(s, "left"))
+    assert emitted(s, A1.emit_tokens, "right") == right == " ".join(A1.parse_tokens(s, "right"))
+
+
+@pytest.mark.parametrize("s, left, right", [
+    ("a b c d", "a b c d", "a b c d"),
+    ("(a b c) d", "a b c d", "( a b c ) d"),
+    ("a (b c)", "a ( b c )", "a b c"),
+    ("(a b) (\\x.x) c", "a b ( \\ x x ) c", "( a b ) ( \\ x x ) c"),
+    ("((a b))", "a b", "a b"),
+    ("a \\x.x y", "a \\ x x y", "a \\ x x y"),
+])
+def test_emit_minimal_tokens(s, left, right):
+    assert emitted(s, A1.emit_minimal_tokens, "left") == left
+    assert emitted(s, A1.emit_minimal_tokens, "right") == right
+    for association_type in ("left", "right"):
+        # every bracket kept is needed, so the minimal form of the minimal form is itself
+        minimal = A1.add_associativity(A1.parse_tokens(s), association_type, minimal=True)
+        assert A1.add_associativity(minimal, association_type, minimal=True) == minimal
+
+
+def test_emit_minimal_tokens_needs_an_association_type():
+    with pytest.raises(ValueError):
+        emitted("a b", A1.emit_minimal_tokens, "none")
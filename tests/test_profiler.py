@@ -0,0 +1,34 @@
+import A1
+from parse_profiler import MemoryProfiler, profiling
+
+
+def test_profiling_records_every_phase():
+    with profiling() as profiler:
+        assert A1._profiler is profiler
+        A1.parse_tokens("(a b) c", "left")
+        A1.build_parse_tree(A1.parse_tokens("\\x.x y"))
+    assert A1._profiler is None
+    assert {"validate", "lex", "parse", "associate", "build_tree"} <= set(profiler.phases)
+    assert profiler.phases["lex"].calls == 2
+    # ( a b ) c and \ x ( x y )
+    assert profiler.phases["lex"].tokens == 11
+
+
+def test_memory_profiling_keeps_the_worst_lines():
+    with profiling(memory=True, worst_lines=2) as profiler:
+        for line in ["a", "(a b) (c d) (e f)", "\\x." * 50 + "x", "(b"]:
+            A1.parse_line(line, build_tree=True)
+    assert isinstance(profiler, MemoryProfiler)
+    assert profiler.memory["line"].calls == 4
+    worst = profiler.worst()
+    assert [line for (_, _, line) in worst][0] == "\\x." * 50 + "x"
+    assert len(worst) == 2 and worst[0][0] >= worst[1][0]
+
+
+def test_worker_stats_are_merged():
+    with profiling() as profiler:
+        with profiling() as worker_profiler:
+            A1.parse_line("a b")
+        profiler.merge(worker_profiler.export())
+        profiler.merge(worker_profiler.export())
+    assert profiler.phases["validate"].calls == 2 * worker_profiler.phases["validate"].calls
@@ -0,0 +1,99 @@
+import random
+
+import pytest
+
+import A1
+
+
+def labels(tree: A1.ParseTree) -> list:
+    return [(level, list(elem)) for (level, elem) in tree.iter_tree_labels()]
+
+
+def assert_same_as_full_parse(source: str, offset: int, deleted: int, inserted: str,
+                              prev: A1.ParsedExpression = None) -> A1.ParsedExpression:
+    if prev is None:
+        prev = A1.parse_expression(source)
+    prev_labels = labels(prev.tree) if prev.valid else None
+    edited = A1.reparse(prev, offset, deleted, inserted)
+    full = A1.parse_expression(source[:offset] + inserted + source[offset + deleted:])
+    assert edited.source == full.source
+    assert edited.issues == full.issues
+    if full.valid:
+        assert edited.tokens == full.tokens
+        assert list(edited.buffer.offsets) == list(full.buffer.offsets)
+        assert [edited.buffer.token(idx) for idx in range(len(edited.buffer))] == full.tokens
+        assert labels(edited.tree) == labels(full.tree)
+        # parses that agree on the labels also agree on the tree built by build_parse_tree
+        assert labels(edited.tree) == labels(A1.build_parse_tree(full.tokens))
+    if prev_labels is not None:
+        assert labels(prev.tree) == prev_labels
+    return edited
+
+
+@pytest.mark.parametrize("depth", [1, 2, 5])
+def test_every_edit_of_a_nested_expression(depth):
+    source = "(" * depth + "a b" + ")" * depth
+    for offset in range(len(source) + 1):
+        for inserted in ("", "c", " (d e)", "\\x.y", ")"):
+            for deleted in (0, 1):
+                if offset + deleted <= len(source):
+                    assert_same_as_full_parse(source, offset, deleted, inserted)
+
+
+def test_every_insertion_into_a_wide_expression():
+    source = " ".join(["(a)", "(b)", "(\\x.(x b))", "c"] * 3)
+    for offset in range(len(source) + 1):
+        assert_same_as_full_parse(source, offset, 0, "z ")
+        assert_same_as_full_parse(source, offset, 0, "(")
+
+
+def test_invalid_before_or_after():
+    assert not assert_same_as_full_parse("(a b", 1, 1, "c").valid
+    assert assert_same_as_full_parse("(a b", 4, 0, ")").valid
+    assert not assert_same_as_full_parse("(a b)", 2, 1, ".").valid
+
+
+def test_edit_outside_of_the_expression():
+    with pytest.raises(ValueError):
+        A1.reparse(A1.parse_expression("a"), 1, 1, "")
+
+
+def test_deep_edit_only_rebuilds_the_path():
+    depth = 300
+    source = "(" * depth + "a b" + ")" * depth
+    prev = A1.parse_expression(source)
+    edited = assert_same_as_full_parse(source, depth, 1, "long", prev)
+    node = edited.tree.root
+    # the nodes above the innermost pair are rebuilt as views of the new tokens, not copies of them
+    for _ in range(2 * depth - 1):
+        assert isinstance(node.elem, A1.TokenSlice) and node.elem.tokens is edited.tokens
+        node = node.children[1] if len(node.children) == 3 else node.children[0]
+    assert list(node.elem) == ["(", "long", "b", ")"]
+    assert prev.tree.root.elem.tokens is prev.tokens
+
+
+def test_wide_edit_reuses_the_other_operands():
+    source = " ".join(f"(v{idx} w)" for idx in range(200))
+    prev = A1.parse_expression(source)
+    offset = source.index("(v100 ") + 1
+    edited = assert_same_as_full_parse(source, offset, 4, "x", prev)
+    old_children = prev.tree.root.children
+    new_children = edited.tree.root.children
+    assert [new is old for (new, old) in zip(new_children, old_children)] == [idx != 100 for idx in range(200)]
+
+
+def test_edit_at_the_end_of_a_dot_line():
+    # the ')' closing the dot is at the end of the source, after the trailing space
+    assert assert_same_as_full_parse("\\x.a ", 5, 0, "b").source == "\\x.a b"
+    assert_same_as_full_parse("(\\x.a )", 6, 0, "b")
+
+
+def test_chained_edits():
+    rng = random.Random(12)
+    edits = ["", "a", "z ", "(", ")", " (b c)", "\\x.", ".", " "]
+    for _ in range(300):
+        prev = A1.parse_expression(rng.choice(["(a (b c))", "\\x.(x (y z)) ", "((a) b) (\\y.y c)", "(\\x.a )"]))
+        for _ in range(6):
+            offset = rng.randrange(len(prev.source) + 1)
+            deleted = rng.randrange(min(2, len(prev.source) - offset) + 1)
+            prev = assert_same_as_full_parse(prev.source, offset, deleted, rng.choice(edits), prev)
@@ -0,0 +1,58 @@
+import pytest
+
+import A1
+
+LINES = ["a b c", "(a b) (a b)", "\\x.x (\\x.x)", "((a (b c)) ((a (b c))))", "a"]
+
+
+def labels(tree: A1.ParseTree) -> list:
+    return [(level, list(elem)) for (level, elem) in tree.iter_tree_labels()]
+
+
+@pytest.mark.parametrize("s", LINES)
+def test_same_tree_as_the_node_builder(s):
+    tokens = A1.parse_tokens(s)
+    tree = A1.build_parse_tree(tokens, shared=True)
+    assert labels(tree) == labels(A1.build_parse_tree(tokens))
+    assert tree.root.size == len(labels(tree))
+
+
+def test_repeated_subtrees_are_one_node():
+    table = A1.HashConsTable()
+    root = A1.build_shared_parse_tree(A1.parse_tokens("(a b) (a b)"), table).root
+    (first, second) = root.children
+    assert first is second
+    assert first.elem == ["(", "a", "b", ")"]
+    assert root.elem == ["(", "a", "b", ")", "(", "a", "b", ")"]
+    # the leaves (, a, b and ), then a b, ( a b ) and the root
+    assert len(table) == 7
+    # every occurrence of the shared subtree is counted
+    assert (first.size, root.size) == (6, 13)
+
+
+def test_table_shared_between_expressions():
+    table = A1.HashConsTable()
+    first = A1.build_shared_parse_tree(A1.parse_tokens("\\x.x y"), table).root
+    second = A1.build_shared_parse_tree(A1.parse_tokens("\\x.(x y)"), table).root
+    other = A1.build_shared_parse_tree(A1.parse_tokens("\\x.x z"), table).root
+    assert first is not second
+    # the bodies ( x y ) and ( ( x y ) ) differ, their x y is the same node
+    assert first.children[2].children[1] is second.children[2].children[1].children[0].children[1]
+    assert first == first and first != other
+    assert hash(first) == first.hash
+    assert len({first, second, other, first}) == 3
+
+
+def test_shared_nodes_cannot_be_changed():
+    root = A1.build_parse_tree(A1.parse_tokens("a b"), shared=True).root
+    with pytest.raises(TypeError):
+        root.add_child_node(A1.Node(["c"]))
+
+
+def test_deep_nesting():
+    depth = 5000
+    tokens = ["("] * depth + ["a"] + [")"] * depth
+    root = A1.build_parse_tree(tokens, shared=True).root
+    # each bracket pair adds a node for the pair, its two brackets and what is between them
+    assert root.size == 4 * depth + 1
+    assert root.elem == tokens
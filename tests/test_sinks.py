@@ -0,0 +1,45 @@
+import io
+import json
+
+import pytest
+
+import A1
+import result_sinks
+
+
+def results(lines: list) -> list:
+    return [A1.parse_line(line, build_tree=True) for line in lines]
+
+
+def test_result_sink_is_abstract():
+    with pytest.raises(TypeError):
+        result_sinks.ResultSink(io.StringIO())
+
+    class NoEncode(result_sinks.ResultSink):
+        pass
+
+    with pytest.raises(TypeError):
+        NoEncode(io.StringIO())
+
+
+def test_output_is_written_buffer_size_results_at_a_time():
+    file = io.StringIO()
+    sink = result_sinks.ErrorSink(file, buffer_size=2)
+    for result in results(["(a", "b", "c)"]):
+        sink.write(result)
+        if sink._pending == 0:
+            assert file.getvalue() == "line 1: SYNTAX ERROR: brackets are mismatched.\n"
+    sink.summary(3, 1)
+    sink.flush()
+    assert file.getvalue().splitlines()[1:] == ["line 3: SYNTAX ERROR: brackets are mismatched.",
+                                                "1 of 3 lines were correct"]
+
+
+def test_json_lines_sink():
+    file = io.StringIO()
+    with result_sinks.JsonLinesSink(file) as sink:
+        for result in results(["a b", "(a"]):
+            sink.write(result)
+    (valid, invalid) = map(json.loads, file.getvalue().splitlines())
+    assert valid["tokens"] == ["a", "b"] and valid["tree"][0] == [0, ["a", "b"]]
+    assert (invalid["valid"], invalid["code"], invalid["tokens"]) == (False, A1.ERR_BRACKETS, None)
@@ -0,0 +1,28 @@
+import random
+
+import pytest
+
+import A1
+
+
+@pytest.mark.parametrize("s, code, offset", [
+    ("a(a.\\", A1.ERR_BRACKETS, 1),
+    ("(.)", A1.ERR_EMPTY_BRACKETS, 0),
+    ("\\\\ a", A1.ERR_LAMBDA_SPACE, 1),
+    ("a . b", A1.ERR_DOT_NO_LAMBDA, 2),
+])
+def test_first_error_is_the_lowest_offset(s, code, offset):
+    issue = A1.syntax_errors(s)[0]
+    assert (issue.code, issue.offset) == (code, offset)
+    assert A1.syntax_errors(s, all_errors=True)[0] == issue
+    assert A1.valid_syntax(s) == (False, issue.message)
+    assert A1.parse_expression(s).issues[0] == issue
+
+
+def test_both_modes_agree():
+    rng = random.Random(3)
+    for _ in range(20000):
+        s = "".join(rng.choice("ab()\\. 1\t") for _ in range(rng.randrange(12)))
+        first = A1.syntax_errors(s)
+        assert first == A1.syntax_errors(s, all_errors=True)[:1], s
+        assert A1.parse_line(s).message == (first[0].message if first else None)